@@ -1,9 +1,13 @@
-from pydantic_ai import Agent
+from pydantic_ai import Agent, RunContext
 from agents.utils.gemini_model import get_model
 from agents.states.states import ComprehensiveAnalysis
+from agents.tools.script_queries import (
+    get_scenes, scene_record, select_scenes, scene_costs_by_number, unique_characters, unique_locations
+)
 import json
 import logging
-from typing import Dict, Any
+from collections import Counter
+from typing import Dict, Any, List, Literal, Optional
 
 logger = logging.getLogger(__name__)
 
@@ -82,7 +86,15 @@ You are an expert film production assistant chatbot specializing in script analy
 
 IMPORTANT: You MUST respond to every user message. Never stay silent or fail to respond.
 
-You will receive script analysis data in the conversation context. Use this data to provide detailed, specific answers about:
+You will receive a script summary and the scenes most relevant to the question in the conversation context. For anything else, call your tools - they return exact data for the whole script:
+- list_scenes: scenes filtered by time of day, interior/exterior, special requirements, character or location
+- get_scenes_by_number: full details of specific scene numbers
+- character_appearances: the scenes each character appears in
+- location_groups: scenes grouped by location
+- cost_lookup: budget totals, per-scene costs and the most expensive scenes
+Prefer a tool call over guessing whenever the answer depends on scenes not shown in the prompt.
+
+Use this data to provide detailed, specific answers about:
 - Scene breakdowns and requirements
 - Cast and character details  
 - Budget estimates and cost breakdowns
@@ -133,4 +145,120 @@ def create_chatbot_agent():
         logger.error(f"Failed to initialize chatbot agent: {e}")
         raise
 
-chatbot_agent = create_chatbot_agent()  
\ No newline at end of file
+chatbot_agent = create_chatbot_agent()
+
+# Local query tools over the script bound to ctx.deps; no LLM or database calls
+
+SceneFilter = Literal["night", "day", "dawn", "dusk", "exterior", "interior", "special requirements"]
+
+# Caps on list sizes returned to the model
+MAX_TOOL_SCENES = 60
+
+def _deps_analysis(ctx: RunContext[dict]) -> Dict[str, Any]:
+    return (ctx.deps or {}).get("comprehensive_analysis") or {}
+
+def _deps_scenes(ctx: RunContext[dict]) -> List[Dict[str, Any]]:
+    return get_scenes(_deps_analysis(ctx))
+
+@chatbot_agent.tool
+async def list_scenes(
+    ctx: RunContext[dict],
+    filters: Optional[List[SceneFilter]] = None,
+    character: Optional[str] = None,
+    location: Optional[str] = None,
+    limit: int = 30
+) -> dict:
+    """List scenes matching all given filters, an exact character name and/or a location name fragment."""
+    try:
+        scenes = select_scenes(_deps_scenes(ctx), filters, character, location)
+    except ValueError as e:
+        return {"success": False, "error": str(e)}
+
+    limit = max(1, min(limit, MAX_TOOL_SCENES))
+    return {
+        "success": True,
+        "total_matches": len(scenes),
+        "scenes": [
+            {"scene_number": r["scene_number"], "scene_header": r["scene_header"], "characters": r["characters"]}
+            for r in map(scene_record, scenes[:limit])
+        ],
+        "truncated": len(scenes) > limit
+    }
+
+@chatbot_agent.tool
+async def get_scenes_by_number(ctx: RunContext[dict], scene_numbers: List[int]) -> dict:
+    """Full details (location, time, characters, props, special requirements, cost) of the given scene numbers."""
+    wanted = {str(n) for n in scene_numbers[:MAX_TOOL_SCENES]}
+    costs = scene_costs_by_number(_deps_analysis(ctx))
+    records = [
+        scene_record(scene, costs.get(scene.get("scene_number")))
+        for scene in _deps_scenes(ctx) if str(scene.get("scene_number")) in wanted
+    ]
+    found = {str(r["scene_number"]) for r in records}
+    return {"success": True, "scenes": records, "not_found": sorted(wanted - found, key=lambda n: int(n))}
+
+@chatbot_agent.tool
+async def character_appearances(ctx: RunContext[dict], names: Optional[List[str]] = None) -> dict:
+    """Scene numbers each character appears in. Omit names to get scene counts for every character."""
+    indexes = (ctx.deps or {}).get("indexes") or {}
+    appearances = indexes.get("characters")
+    if appearances is None:
+        scenes = _deps_scenes(ctx)
+        appearances = {
+            name: [s.get("scene_number") for s in select_scenes(scenes, character=name)]
+            for name in unique_characters(scenes)
+        }
+
+    if not names:
+        counts = Counter({name: len(numbers) for name, numbers in appearances.items()})
+        return {"success": True, "total_characters": len(counts), "scene_counts": dict(counts.most_common())}
+
+    by_upper = {name.upper(): name for name in appearances}
+    result, unknown = {}, []
+    for name in names:
+        key = by_upper.get(name.strip().upper())
+        if key is None:
+            matches = [n for upper, n in by_upper.items() if name.strip().upper() in upper]
+            key = matches[0] if len(matches) == 1 else None
+        if key is None:
+            unknown.append(name)
+        else:
+            result[key] = {"scene_count": len(appearances[key]), "scenes": appearances[key]}
+    return {"success": True, "characters": result, "unknown": unknown}
+
+@chatbot_agent.tool
+async def location_groups(ctx: RunContext[dict], location: Optional[str] = None) -> dict:
+    """Scene numbers grouped by location, optionally only locations containing the given name fragment."""
+    indexes = (ctx.deps or {}).get("indexes") or {}
+    groups = indexes.get("locations")
+    if groups is None:
+        scenes = _deps_scenes(ctx)
+        groups = {loc: [s.get("scene_number") for s in select_scenes(scenes, location=loc)] for loc in unique_locations(scenes)}
+
+    if location:
+        groups = {name: numbers for name, numbers in groups.items() if location.strip().upper() in name.upper()}
+    ordered = sorted(groups.items(), key=lambda item: -len(item[1]))
+    return {
+        "success": True,
+        "total_locations": len(ordered),
+        "locations": [{"location": name, "scene_count": len(numbers), "scenes": numbers} for name, numbers in ordered]
+    }
+
+@chatbot_agent.tool
+async def cost_lookup(ctx: RunContext[dict], scene_numbers: Optional[List[int]] = None, top_n: Optional[int] = None) -> dict:
+    """Budget totals by category, plus costs of the given scenes and/or the top_n most expensive scenes."""
+    cost = _deps_analysis(ctx).get("cost_breakdown") or {}
+    if not cost:
+        return {"success": False, "error": "No cost breakdown available for this script"}
+
+    costs = scene_costs_by_number(_deps_analysis(ctx))
+    result = {
+        "success": True,
+        "totals": {key: value for key, value in cost.items() if key != "scene_costs"}
+    }
+    if scene_numbers:
+        result["scene_costs"] = {n: costs.get(n) for n in scene_numbers[:MAX_TOOL_SCENES]}
+    if top_n:
+        ranked = sorted(costs.items(), key=lambda item: item[1] or 0, reverse=True)[:min(top_n, MAX_TOOL_SCENES)]
+        result["most_expensive"] = [{"scene_number": n, "total_scene_cost": c} for n, c in ranked]
+    return result  
\ No newline at end of file
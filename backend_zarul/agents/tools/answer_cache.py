@@ -0,0 +1,76 @@
+from agents.tools.script_queries import normalize_question
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+import os
+import re
+import time
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("CHAT_ANSWER_CACHE_TTL_SECONDS", "3600"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("CHAT_ANSWER_CACHE_MAX_ENTRIES", "2048"))
+
+# Politeness and filler that do not change what is being asked
+FILLER_PATTERN = re.compile(r"\b(please|pls|hey|hi|hello|thanks|thank you|can you|could you|would you|tell me|i want to know)\b")
+
+def cache_question_key(question: str) -> str:
+    """Normalize a question so trivially different phrasings share a cache entry"""
+    return re.sub(r"\s+", " ", FILLER_PATTERN.sub(" ", normalize_question(question))).strip()
+
+class AnswerCache:
+    """
+    TTL + LRU cache of chat responses keyed by (script_id, analysis version, normalized question).
+
+    A new analysis version (re-analysis, re-pricing or feedback all bump updated_at) makes
+    old entries unreachable; invalidate() drops them eagerly.
+    """
+
+    def __init__(self, ttl_seconds: int = ANSWER_CACHE_TTL_SECONDS, max_entries: int = ANSWER_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str, str], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, script_id: str, version: str, question: str) -> Optional[Dict[str, Any]]:
+        key = (script_id, version, cache_question_key(question))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl_seconds:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(entry[1])
+
+    def put(self, script_id: str, version: str, question: str, result: Dict[str, Any]) -> None:
+        key = (script_id, version, cache_question_key(question))
+        with self._lock:
+            self._entries[key] = (time.monotonic(), dict(result))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, script_id: str) -> None:
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == script_id]:
+                del self._entries[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "ttl_seconds": self.ttl_seconds,
+                "max_entries": self.max_entries
+            }
+
+chat_answer_cache = AnswerCache()
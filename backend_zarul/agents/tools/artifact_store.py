@@ -0,0 +1,262 @@
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Optional, Type, TypeVar
+from pydantic import BaseModel
+from sqlalchemy import text
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# "postgres" keeps artifacts next to the workflow checkpoints, readable by every API host and
+# worker; "disk" is for single-process local development (or a directory shared by all hosts)
+ARTIFACT_STORE_BACKEND = os.getenv("ARTIFACT_STORE_BACKEND", "postgres").lower()
+ARTIFACT_STORE_DIR = os.getenv("ARTIFACT_STORE_DIR", "artifacts")
+
+# Artifacts not written or read for this long are purged (they back resumable checkpoints
+# and compact-response handles, so keep it longer than a review cycle)
+ARTIFACT_RETENTION_DAYS = int(os.getenv("ARTIFACT_RETENTION_DAYS", "30"))
+
+# Hot artifacts kept decoded in memory, bounded by their encoded size
+ARTIFACT_CACHE_BYTES = int(os.getenv("ARTIFACT_CACHE_BYTES", str(64 * 1024 * 1024)))
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+def content_key(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def _check_key(key: str) -> str:
+    if len(key) != 64 or not all(c in "0123456789abcdef" for c in key):
+        raise ValueError(f"Invalid artifact key: {key!r}")
+    return key
+
+class ArtifactStore:
+    """
+    Content-addressed store for large workflow artifacts (script text, analyses).
+
+    Artifacts are immutable blobs named by the sha256 of their bytes, so graph state,
+    checkpoints and agent deps only carry the 64-character key. Identical content is
+    written once. Subclasses provide the storage; writing or reading an artifact renews
+    it, and purge_expired() drops those unused for longer than the retention period.
+    """
+
+    def __init__(self, cache_bytes: int = ARTIFACT_CACHE_BYTES, retention_days: int = ARTIFACT_RETENTION_DAYS):
+        self.cache_bytes = cache_bytes
+        self.retention_days = retention_days
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._cached_bytes = 0
+        self._lock = threading.Lock()
+
+    def _write(self, key: str, data: bytes) -> None:
+        raise NotImplementedError
+
+    def _read(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def _contains(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def purge_expired(self) -> int:
+        """Delete artifacts unused for retention_days; returns how many were removed"""
+        raise NotImplementedError
+
+    def _remember(self, key: str, value: Any, size: int) -> None:
+        if size > self.cache_bytes:
+            return
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return
+            self._cache[key] = (value, size)
+            self._cached_bytes += size
+            while self._cached_bytes > self.cache_bytes:
+                _, (_, evicted_size) = self._cache.popitem(last=False)
+                self._cached_bytes -= evicted_size
+
+    def _recall(self, key: str) -> Any:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            self._cache.move_to_end(key)
+            return entry[0]
+
+    def put_bytes(self, data: bytes) -> str:
+        key = content_key(data)
+        self._write(key, data)
+        return key
+
+    def get_bytes(self, key: str) -> bytes:
+        data = self._read(_check_key(key))
+        if data is None:
+            raise KeyError(f"Artifact {key} not found (expired after {self.retention_days} days, or never stored)")
+        return data
+
+    def exists(self, key: Optional[str]) -> bool:
+        return bool(key) and self._contains(_check_key(key))
+
+    def put_text(self, text: str) -> str:
+        data = text.encode("utf-8")
+        key = self.put_bytes(data)
+        self._remember(key, text, len(data))
+        return key
+
+    def get_text(self, key: str) -> str:
+        text = self._recall(key)
+        if text is None:
+            data = self.get_bytes(key)
+            text = data.decode("utf-8")
+            self._remember(key, text, len(data))
+        return text
+
+    def put_json(self, value: Any) -> str:
+        data = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+        key = self.put_bytes(data)
+        self._remember(key, value, len(data))
+        return key
+
+    def get_json(self, key: str) -> Any:
+        value = self._recall(key)
+        if value is None:
+            data = self.get_bytes(key)
+            value = json.loads(data)
+            self._remember(key, value, len(data))
+        return value
+
+    def put_model(self, model: BaseModel) -> str:
+        data = model.model_dump_json().encode("utf-8")
+        key = self.put_bytes(data)
+        self._remember(key, model, len(data))
+        return key
+
+    def get_model(self, key: str, model_type: Type[ModelT]) -> ModelT:
+        """Load a pydantic artifact; callers must not mutate the shared cached instance"""
+        model = self._recall(key)
+        if not isinstance(model, model_type):
+            data = self.get_bytes(key)
+            model = model_type.model_validate_json(data)
+            self._remember(key, model, len(data))
+        return model
+
+class DiskArtifactStore(ArtifactStore):
+    """Artifacts as files under root; only shared between hosts if root is a shared directory"""
+
+    def __init__(self, root: str = ARTIFACT_STORE_DIR, **kwargs):
+        super().__init__(**kwargs)
+        self.root = Path(root)
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    def _write(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        if path.exists():
+            os.utime(path)
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write then rename, so readers never see a partial artifact
+        fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as temp_file:
+                temp_file.write(data)
+            os.replace(temp_path, path)
+        except Exception:
+            Path(temp_path).unlink(missing_ok=True)
+            raise
+
+    def _read(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        os.utime(path)
+        return data
+
+    def _contains(self, key: str) -> bool:
+        return self._path(key).exists()
+
+    def purge_expired(self) -> int:
+        cutoff = time.time() - self.retention_days * 86400
+        removed = 0
+        for path in self.root.glob("??/*"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                continue
+        return removed
+
+class PostgresArtifactStore(ArtifactStore):
+    """Artifacts in the workflow_artifacts table of the application database"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._table_ensured = False
+
+    def _engine(self):
+        from database.database import engine
+        if not self._table_ensured:
+            with engine.begin() as connection:
+                connection.execute(text("""
+                    CREATE TABLE IF NOT EXISTS workflow_artifacts (
+                        key VARCHAR(64) PRIMARY KEY,
+                        data BYTEA NOT NULL,
+                        created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                        last_used_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+                    );
+                """))
+                connection.execute(text("""
+                    CREATE INDEX IF NOT EXISTS idx_workflow_artifacts_last_used_at
+                    ON workflow_artifacts(last_used_at);
+                """))
+            self._table_ensured = True
+        return engine
+
+    def _write(self, key: str, data: bytes) -> None:
+        with self._engine().begin() as connection:
+            # Content seen before only has its lease renewed; the bytes are not sent again
+            renewed = connection.execute(
+                text("UPDATE workflow_artifacts SET last_used_at = NOW() WHERE key = :key"), {"key": key}
+            ).rowcount
+            if not renewed:
+                connection.execute(
+                    text("INSERT INTO workflow_artifacts (key, data) VALUES (:key, :data) ON CONFLICT (key) DO NOTHING"),
+                    {"key": key, "data": data}
+                )
+
+    def _read(self, key: str) -> Optional[bytes]:
+        with self._engine().begin() as connection:
+            row = connection.execute(
+                text("UPDATE workflow_artifacts SET last_used_at = NOW() WHERE key = :key RETURNING data"), {"key": key}
+            ).first()
+        return bytes(row[0]) if row else None
+
+    def _contains(self, key: str) -> bool:
+        with self._engine().connect() as connection:
+            return connection.execute(
+                text("SELECT 1 FROM workflow_artifacts WHERE key = :key"), {"key": key}
+            ).first() is not None
+
+    def purge_expired(self) -> int:
+        with self._engine().begin() as connection:
+            return connection.execute(
+                text("DELETE FROM workflow_artifacts WHERE last_used_at < NOW() - make_interval(days => :days)"),
+                {"days": self.retention_days}
+            ).rowcount
+
+def create_artifact_store() -> ArtifactStore:
+    if ARTIFACT_STORE_BACKEND == "postgres":
+        return PostgresArtifactStore()
+    if ARTIFACT_STORE_BACKEND == "disk":
+        logger.warning(f"⚠️ ARTIFACT_STORE_BACKEND=disk: artifacts in '{ARTIFACT_STORE_DIR}' are only visible to hosts sharing that directory")
+        return DiskArtifactStore()
+    raise RuntimeError(f"Unknown ARTIFACT_STORE_BACKEND '{ARTIFACT_STORE_BACKEND}', use 'postgres' or 'disk'")
+
+artifact_store = create_artifact_store()
@@ -0,0 +1,135 @@
+from agents.tools.script_queries import get_scenes
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Bump when the artifact layout changes so stored copies are rebuilt
+CHAT_CONTEXT_FORMAT = 1
+
+# Scene fields kept in the compact analysis the local query handlers run on
+COMPACT_SCENE_FIELDS = [
+    "scene_number", "scene_header", "location", "scene_type", "time_of_day",
+    "characters_present", "props_mentioned", "special_requirements", "estimated_pages",
+]
+
+COST_TOTAL_FIELDS = [
+    "total_costs", "total_cast_costs", "total_location_costs", "total_props_costs",
+    "total_wardrobe_costs", "total_crew_costs", "total_equipment_costs", "budget_category",
+]
+
+def _scene_row(scene: Dict[str, Any], cost: Optional[float]) -> str:
+    characters = ", ".join(scene.get("characters_present", []) or []) or "-"
+    props = ", ".join(scene.get("props_mentioned", []) or []) or "-"
+    special = ", ".join(scene.get("special_requirements", []) or []) or "-"
+    cost_text = f"${cost:,.0f}" if cost is not None else "-"
+    return (
+        f"{scene.get('scene_number')} | {scene.get('scene_header', '')} | {scene.get('location', '')} | "
+        f"{scene.get('time_of_day', '')} | {characters} | {props} | {special} | {cost_text}"
+    )
+
+def build_chat_context(analysis: Dict[str, Any], script_title: str) -> Dict[str, Any]:
+    """
+    Build the per-script chat artifact once, so chat requests do no serialization work.
+
+    Returns:
+        JSON-serializable dict with a summary text, a pre-rendered compact scene table,
+        a compact analysis for the local query handlers and character/location indexes.
+    """
+    scenes = get_scenes(analysis)
+    cost = (analysis or {}).get("cost_breakdown") or {}
+    cast = (analysis or {}).get("cast_breakdown") or {}
+    script_data = (analysis or {}).get("script_data") or {}
+
+    scene_costs = {c.get("scene_number"): c.get("total_scene_cost") for c in cost.get("scene_costs", []) or []}
+    compact_scenes = [{f: scene.get(f) for f in COMPACT_SCENE_FIELDS if f in scene} for scene in scenes]
+
+    characters = defaultdict(list)
+    locations = defaultdict(list)
+    for scene in compact_scenes:
+        for character in scene.get("characters_present", []) or []:
+            characters[character.strip()].append(scene.get("scene_number"))
+        if scene.get("location"):
+            locations[scene["location"].strip()].append(scene.get("scene_number"))
+
+    summary = [
+        f"Title: {script_title}",
+        f"Total scenes: {len(scenes)}",
+        f"Total pages: {script_data.get('total_pages', 0)}",
+        f"Total characters: {len(characters)}",
+        f"Characters: {', '.join(sorted(characters)[:25])}" + (f" and {len(characters) - 25} more" if len(characters) > 25 else ""),
+        f"Total locations: {len(locations)}",
+        f"Locations: {', '.join(sorted(locations)[:25])}" + (f" and {len(locations) - 25} more" if len(locations) > 25 else ""),
+    ]
+    if cast.get("main_characters"):
+        summary.append(f"Main characters: {', '.join(cast['main_characters'][:5])}")
+    if cost:
+        summary.append(f"Estimated total cost: ${cost.get('total_costs', 0) or 0:,.2f} ({cost.get('budget_category', 'Unknown')} budget)")
+        summary.append(
+            "Cost by category: " + ", ".join(
+                f"{field.replace('total_', '').replace('_costs', '')} ${cost.get(field, 0) or 0:,.0f}"
+                for field in COST_TOTAL_FIELDS[1:-1]
+            )
+        )
+
+    scene_table = "\n".join(
+        ["# | header | location | time | characters | props | special | cost"]
+        + [_scene_row(scene, scene_costs.get(scene.get("scene_number"))) for scene in compact_scenes]
+    )
+
+    return {
+        "format": CHAT_CONTEXT_FORMAT,
+        "script_title": script_title,
+        "summary_text": "\n".join(summary),
+        "scene_table": scene_table,
+        "analysis": {
+            "script_data": {"scenes": compact_scenes},
+            "cost_breakdown": {
+                **{field: cost.get(field) for field in COST_TOTAL_FIELDS if field in cost},
+                "scene_costs": [
+                    {"scene_number": number, "total_scene_cost": total}
+                    for number, total in scene_costs.items()
+                ],
+            },
+        },
+        "indexes": {
+            "characters": dict(characters),
+            "locations": dict(locations),
+        },
+        "built_at": datetime.now(timezone.utc).isoformat()
+    }
+
+def is_current(artifact: Optional[Dict[str, Any]]) -> bool:
+    return bool(artifact) and artifact.get("format") == CHAT_CONTEXT_FORMAT
+
+class ChatContextCache:
+    """In-memory LRU of chat artifacts keyed by script id, valid for one analysis version"""
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, script_id: str, version: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(script_id)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(script_id)
+            return entry[1]
+
+    def put(self, script_id: str, version: str, artifact: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[script_id] = (version, artifact)
+            self._entries.move_to_end(script_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, script_id: str) -> None:
+        with self._lock:
+            self._entries.pop(script_id, None)
+
+chat_context_cache = ChatContextCache()
@@ -0,0 +1,65 @@
+from typing import Any, List, Optional, Sequence, Tuple
+import os
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Rough token estimate; good enough to keep prompt size flat without a tokenizer
+CHARS_PER_TOKEN = 4
+
+# Recent turns sent verbatim, and the cap on the rolling summary of everything older
+HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "1500"))
+SUMMARY_TOKEN_BUDGET = int(os.getenv("CHAT_SUMMARY_TOKEN_BUDGET", "400"))
+TURN_SUMMARY_CHARS = 160
+
+ROLE_LABELS = {"user": "User", "assistant": "Assistant"}
+
+def estimate_tokens(text: Optional[str]) -> int:
+    return max(1, len(text or "") // CHARS_PER_TOKEN)
+
+def split_history(messages: Sequence[Any], budget: int = HISTORY_TOKEN_BUDGET) -> Tuple[List[Any], List[Any]]:
+    """
+    Split messages (oldest first) into (older, recent) so the recent ones fit the token budget.
+
+    Messages need role, content and token_estimate attributes. The newest message is always kept.
+    """
+    used = 0
+    cut = len(messages)
+    for i in range(len(messages) - 1, -1, -1):
+        tokens = messages[i].token_estimate or estimate_tokens(messages[i].content)
+        if used + tokens > budget and cut < len(messages):
+            break
+        used += tokens
+        cut = i
+    return list(messages[:cut]), list(messages[cut:])
+
+def _clip(text: str, limit: int = TURN_SUMMARY_CHARS) -> str:
+    """First sentence of a message, clipped to limit characters"""
+    text = re.sub(r"\s+", " ", text or "").strip()
+    sentence = re.split(r"(?<=[.!?])\s", text, maxsplit=1)[0]
+    return sentence if len(sentence) <= limit else sentence[:limit - 3].rstrip() + "..."
+
+def summarize_turns(summary: Optional[str], messages: Sequence[Any]) -> str:
+    """
+    Fold messages into the rolling summary without an LLM call.
+
+    Each message becomes one clipped line; the oldest lines are dropped once the
+    summary exceeds SUMMARY_TOKEN_BUDGET, so its size stays bounded.
+    """
+    lines = summary.splitlines() if summary else []
+    for message in messages:
+        lines.append(f"- {ROLE_LABELS.get(message.role, message.role)}: {_clip(message.content)}")
+
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > SUMMARY_TOKEN_BUDGET:
+        lines.pop(0)
+    return "\n".join(lines)
+
+def render_history(summary: Optional[str], recent: Sequence[Any]) -> str:
+    """Conversation section for the chat prompt; empty for a new session"""
+    parts = []
+    if summary:
+        parts.append(f"Earlier in this conversation (summary):\n{summary}")
+    if recent:
+        parts.append("\n".join(f"{ROLE_LABELS.get(m.role, m.role)}: {m.content}" for m in recent))
+    return "\n\n".join(parts)
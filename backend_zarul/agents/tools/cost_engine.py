@@ -0,0 +1,479 @@
+import numpy as np
+from agents.states.states import CostBreakdown, SceneCostBreakdown
+from agents.tools.rate_card import RateCard, normalize_key
+from agents.tools.rate_index import RateCardIndex, get_rate_index
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
+from typing import Dict, Any, Callable, List, Optional
+import re
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Script pages a unit shoots per day, used to turn page counts into shooting days
+PAGES_PER_SHOOTING_DAY = 5.0
+
+# Budget category thresholds on total cost (USD)
+LOW_BUDGET_LIMIT = 250_000
+HIGH_BUDGET_LIMIT = 2_500_000
+
+COST_COLUMNS = ["cast_cost", "location_cost", "props_cost", "wardrobe_cost", "crew_cost", "equipment_cost"]
+
+@dataclass
+class CostRates:
+    """Unit rates the cost factors are priced with"""
+    cast_rates: np.ndarray            # (C,) day rate per character
+    location_rates: np.ndarray        # (L,) day rate per location rate key
+    crew_daily: float = 0.0           # day rate of the whole crew
+    catering_per_person: float = 0.0  # per person per day
+    transport_daily: float = 0.0
+    equipment_daily: float = 0.0      # day rate of all equipment packages
+    permit_cost: float = 0.0
+    prop_rate: float = 0.0
+    wardrobe_rate: float = 0.0
+    makeup_rate: float = 0.0
+    sfx_rate: float = 0.0
+
+    def copy(self) -> "CostRates":
+        return replace(self, cast_rates=self.cast_rates.copy(), location_rates=self.location_rates.copy())
+
+@dataclass
+class SceneCostFactors:
+    """Per-scene quantities that, multiplied with CostRates, give scene costs"""
+    scene_numbers: np.ndarray         # (S,)
+    shoot_days: np.ndarray            # (S,)
+    cast_names: List[str]             # (C,)
+    cast_roles: List[str]             # (C,) cast rate key per character
+    cast_presence: np.ndarray         # (S, C) 1.0 where character appears in scene
+    location_keys: List[str]          # (L,)
+    location_names: List[str]         # (S,) location as written in the analysis
+    location_onehot: np.ndarray       # (S, L)
+    location_confidence: np.ndarray   # (S,) rate index confidence of the location match, 0 for INT/EXT defaults
+    permit_flags: np.ndarray          # (S,)
+    prop_counts: np.ndarray           # (S,)
+    costume_counts: np.ndarray        # (S,)
+    makeup_counts: np.ndarray         # (S,)
+    sfx_counts: np.ndarray            # (S,)
+    crew_headcount: int = 0
+    rates: Optional[CostRates] = None
+    low_rates: Optional[CostRates] = None   # low end of every rate record's range
+    high_rates: Optional[CostRates] = None  # high end of every rate record's range
+    rate_card_source: str = "fallback"
+    unmatched_locations: List[str] = field(default_factory=list)
+
+    @property
+    def headcount(self) -> np.ndarray:
+        return self.cast_presence.sum(axis=1) + self.crew_headcount
+
+@dataclass
+class CostEstimate:
+    """Result of pricing a script: the breakdown, per-line provenance and raw arrays"""
+    breakdown: CostBreakdown
+    provenance: List[Dict[str, Any]] = field(default_factory=list)
+    scene_matrix: Optional[np.ndarray] = None  # (S, len(COST_COLUMNS))
+
+def _as_dict(analysis: Any) -> Dict[str, Any]:
+    if hasattr(analysis, 'model_dump'):
+        return analysis.model_dump()
+    return analysis or {}
+
+def _base_name(entry: str) -> str:
+    """'JOHN - 30s detective' -> 'JOHN'"""
+    return re.split(r"\s*[:(]|\s+[-–]\s+", str(entry), maxsplit=1)[0].strip().upper()
+
+def _character_roles(analysis: Dict[str, Any], names: List[str], index: RateCardIndex) -> List[str]:
+    cast = analysis.get("cast_breakdown") or {}
+    main = {_base_name(c) for c in cast.get("main_characters", []) or []}
+    supporting = {_base_name(c) for c in cast.get("supporting_characters", []) or []}
+
+    # Characters outside the main/supporting lists are matched on their name ('CROWD', 'WAITER')
+    unlisted = [n for n in names if n not in main and n not in supporting]
+    matches, _ = index.resolve("cast_rates", unlisted)
+    unlisted_roles = {
+        name: match.key if match.key and match.key.endswith("actor") else "background_actor"
+        for name, match in zip(unlisted, matches)
+    }
+
+    roles = []
+    for name in names:
+        if name in main:
+            roles.append("lead_actor")
+        elif name in supporting:
+            roles.append("supporting_actor")
+        else:
+            roles.append(unlisted_roles[name])
+    return roles
+
+def default_location_key(scene_type: str, available: List[str]) -> Optional[str]:
+    """INT/EXT default for locations the rate index could not resolve"""
+    exterior = "EXT" in str(scene_type or "").upper()
+    default = "exterior_street" if exterior else "interior_house"
+    return default if default in available else (available[0] if available else None)
+
+def resolve_scene_locations(scenes: List[Dict[str, Any]], location_types: List[str], index: RateCardIndex):
+    """
+    Resolve every scene location to a location rate record in one pass.
+
+    Locations the name alone does not resolve get a second chance with the location
+    breakdown's specific type.
+
+    Returns:
+        (matches aligned with scenes, unmatched location names)
+    """
+    matches, _ = index.resolve("location_costs", [scene.get("location", "") for scene in scenes])
+
+    retry = [i for i, match in enumerate(matches) if match.record is None and location_types[i]]
+    if retry:
+        retry_matches, _ = index.resolve("location_costs", [location_types[i] for i in retry])
+        for i, match in zip(retry, retry_matches):
+            if match.record is not None:
+                matches[i] = match
+
+    unmatched = sorted({m.query for m in matches if m.record is None and m.query})
+    return matches, unmatched
+
+def build_rates(rate_card: RateCard, factors: "SceneCostFactors", bound: str = "rate") -> CostRates:
+    """Price cost factors with the records of a rate card ('rate', 'low' or 'high' end of each record)"""
+    def rate(category, key):
+        return rate_card.rate(category, key, bound=bound)
+
+    cast_rates = np.array([rate("cast_rates", role) for role in factors.cast_roles], dtype=float)
+    location_rates = np.array([rate("location_costs", key) for key in factors.location_keys], dtype=float)
+
+    crew = [r for r in rate_card.by_category("cast_rates") if not r.key.endswith("actor")]
+
+    return CostRates(
+        cast_rates=cast_rates,
+        location_rates=location_rates,
+        crew_daily=float(sum(getattr(r, bound) for r in crew)),
+        catering_per_person=rate("production_costs", "catering"),
+        transport_daily=rate("production_costs", "transportation"),
+        equipment_daily=float(sum(getattr(r, bound) for r in rate_card.by_category("equipment_costs"))),
+        permit_cost=rate("production_costs", "permits"),
+        prop_rate=rate("props_costs", "basic_props"),
+        wardrobe_rate=rate("props_costs", "wardrobe"),
+        makeup_rate=rate("props_costs", "makeup"),
+        sfx_rate=rate("props_costs", "special_effects"),
+    )
+
+def build_scene_cost_factors(analysis: Any, rate_card: RateCard) -> SceneCostFactors:
+    """Turn the scenes of an analysis into factor matrices priced with the given rate card"""
+    analysis = _as_dict(analysis)
+    scenes = (analysis.get("script_data") or {}).get("scenes", []) or []
+
+    scene_locations = {
+        loc.get("scene_number"): loc
+        for loc in (analysis.get("location_breakdown") or {}).get("scene_locations", []) or []
+    }
+    scene_props = {
+        p.get("scene_number"): p
+        for p in (analysis.get("props_breakdown") or {}).get("scene_props", []) or []
+    }
+
+    # Column order of the cast and location matrices
+    cast_names = sorted({_base_name(c) for s in scenes for c in s.get("characters_present", []) or [] if c})
+    cast_index = {name: i for i, name in enumerate(cast_names)}
+    location_keys = [r.key for r in rate_card.by_category("location_costs")]
+    location_index = {key: i for i, key in enumerate(location_keys)}
+
+    S, C, L = len(scenes), len(cast_names), len(location_keys)
+    scene_numbers = np.zeros(S, dtype=int)
+    pages = np.ones(S, dtype=float)
+    cast_presence = np.zeros((S, C), dtype=float)
+    location_onehot = np.zeros((S, L), dtype=float)
+    permit_flags = np.zeros(S, dtype=float)
+    prop_counts = np.zeros(S, dtype=float)
+    costume_counts = np.zeros(S, dtype=float)
+    sfx_counts = np.zeros(S, dtype=float)
+    location_names = [scene.get("location", "") for scene in scenes]
+    location_types = [
+        scene_locations.get(scene.get("scene_number", i + 1), {}).get("location_type") or ""
+        for i, scene in enumerate(scenes)
+    ]
+
+    index = get_rate_index(rate_card)
+    location_matches, unmatched_locations = resolve_scene_locations(scenes, location_types, index)
+    location_confidence = np.array([m.confidence if m.record else 0.0 for m in location_matches], dtype=float)
+
+    for i, scene in enumerate(scenes):
+        number = scene.get("scene_number", i + 1)
+        scene_numbers[i] = number
+        pages[i] = max(float(scene.get("estimated_pages") or 1), 0.125)
+
+        for character in scene.get("characters_present", []) or []:
+            if character:
+                cast_presence[i, cast_index[_base_name(character)]] = 1.0
+
+        location_detail = scene_locations.get(number, {})
+        key = location_matches[i].key or default_location_key(location_types[i] or scene.get("scene_type"), location_keys)
+        if key is not None:
+            location_onehot[i, location_index[key]] = 1.0
+        permit_flags[i] = 1.0 if location_detail.get("permit_needed") else 0.0
+
+        props = scene_props.get(number, {})
+        prop_counts[i] = max(len(scene.get("props_mentioned", []) or []), len(props.get("props_needed", []) or []))
+        costume_counts[i] = len(props.get("costume_requirements", []) or [])
+        sfx_counts[i] = max(len(scene.get("special_requirements", []) or []), len(props.get("special_effects_props", []) or []))
+
+    makeup_counts = cast_presence.sum(axis=1)
+    # Every character needs at least one costume even when the analysis lists none
+    costume_counts = np.maximum(costume_counts, makeup_counts)
+
+    factors = SceneCostFactors(
+        scene_numbers=scene_numbers,
+        shoot_days=pages / PAGES_PER_SHOOTING_DAY,
+        cast_names=cast_names,
+        cast_roles=_character_roles(analysis, cast_names, index),
+        cast_presence=cast_presence,
+        location_keys=location_keys,
+        location_names=location_names,
+        location_onehot=location_onehot,
+        location_confidence=location_confidence,
+        permit_flags=permit_flags,
+        prop_counts=prop_counts,
+        costume_counts=costume_counts,
+        makeup_counts=makeup_counts,
+        sfx_counts=sfx_counts,
+        crew_headcount=len([r for r in rate_card.by_category("cast_rates") if not r.key.endswith("actor")]),
+        rate_card_source=rate_card.source,
+        unmatched_locations=unmatched_locations,
+    )
+    factors.rates = build_rates(rate_card, factors)
+    factors.low_rates = build_rates(rate_card, factors, bound="low")
+    factors.high_rates = build_rates(rate_card, factors, bound="high")
+    return factors
+
+def compute_scene_matrix(
+    factors: SceneCostFactors,
+    rates: Optional[CostRates] = None,
+    scene_mask: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Price all scenes at once.
+
+    Returns:
+        (S, len(COST_COLUMNS)) array, columns ordered as COST_COLUMNS.
+        Scenes outside scene_mask are zeroed.
+    """
+    rates = rates or factors.rates
+    days = factors.shoot_days
+
+    cast = (factors.cast_presence @ rates.cast_rates) * days
+    location = (factors.location_onehot @ rates.location_rates) * days + factors.permit_flags * rates.permit_cost
+    props = factors.prop_counts * rates.prop_rate
+    wardrobe = factors.costume_counts * rates.wardrobe_rate + factors.makeup_counts * rates.makeup_rate
+    crew = days * (rates.crew_daily + rates.transport_daily + rates.catering_per_person * factors.headcount)
+    equipment = days * rates.equipment_daily + factors.sfx_counts * rates.sfx_rate
+
+    matrix = np.column_stack([cast, location, props, wardrobe, crew, equipment]) if len(days) else np.zeros((0, len(COST_COLUMNS)))
+    if scene_mask is not None:
+        matrix = matrix * np.asarray(scene_mask, dtype=float)[:, None]
+    return np.round(matrix, 2)
+
+def budget_category_for(total: float) -> str:
+    if total < LOW_BUDGET_LIMIT:
+        return "Low"
+    if total < HIGH_BUDGET_LIMIT:
+        return "Medium"
+    return "High"
+
+def breakdown_from_matrix(factors: SceneCostFactors, matrix: np.ndarray, scene_mask: Optional[np.ndarray] = None) -> CostBreakdown:
+    """Assemble a CostBreakdown from a priced scene matrix"""
+    scene_totals = matrix.sum(axis=1)
+    column_totals = matrix.sum(axis=0) if len(matrix) else np.zeros(len(COST_COLUMNS))
+    included = np.ones(len(scene_totals), dtype=bool) if scene_mask is None else np.asarray(scene_mask, dtype=bool)
+
+    scene_costs = [
+        SceneCostBreakdown(
+            scene_number=int(number),
+            **{column: float(value) for column, value in zip(COST_COLUMNS, row)},
+            total_scene_cost=float(round(total, 2))
+        )
+        for number, row, total, keep in zip(factors.scene_numbers, matrix, scene_totals, included)
+        if keep
+    ]
+
+    total = float(round(scene_totals.sum(), 2))
+    return CostBreakdown(
+        scene_costs=scene_costs,
+        total_costs=total,
+        total_cast_costs=float(round(column_totals[0], 2)),
+        total_location_costs=float(round(column_totals[1], 2)),
+        total_props_costs=float(round(column_totals[2], 2)),
+        total_wardrobe_costs=float(round(column_totals[3], 2)),
+        total_crew_costs=float(round(column_totals[4], 2)),
+        total_equipment_costs=float(round(column_totals[5], 2)),
+        budget_category=budget_category_for(total)
+    )
+
+def build_provenance(factors: SceneCostFactors, rates: Optional[CostRates] = None) -> List[Dict[str, Any]]:
+    """One entry per priced line: which scene, which rate record, quantity and amount"""
+    rates = rates or factors.rates
+    source = factors.rate_card_source
+    days = factors.shoot_days
+    lines = []
+
+    def line(scene_idx, category, item, rate_key, quantity, unit_rate, confidence=1.0):
+        amount = round(float(quantity) * float(unit_rate), 2)
+        if amount:
+            lines.append({
+                "scene_number": int(factors.scene_numbers[scene_idx]),
+                "category": category,
+                "item": item,
+                "rate_key": rate_key,
+                "quantity": round(float(quantity), 4),
+                "unit_rate": float(unit_rate),
+                "amount": amount,
+                "source": source,
+                "match_confidence": round(float(confidence), 3)
+            })
+
+    scene_idx, cast_idx = np.nonzero(factors.cast_presence)
+    for s, c in zip(scene_idx, cast_idx):
+        line(s, "cast_cost", factors.cast_names[c], f"cast_rates.{factors.cast_roles[c]}", days[s], rates.cast_rates[c])
+
+    scene_idx, loc_idx = np.nonzero(factors.location_onehot)
+    for s, l in zip(scene_idx, loc_idx):
+        line(s, "location_cost", factors.location_names[s], f"location_costs.{factors.location_keys[l]}", days[s], rates.location_rates[l],
+             factors.location_confidence[s])
+
+    for s in range(len(days)):
+        line(s, "location_cost", "permit", "production_costs.permits", factors.permit_flags[s], rates.permit_cost)
+        line(s, "props_cost", "props", "props_costs.basic_props", factors.prop_counts[s], rates.prop_rate)
+        line(s, "wardrobe_cost", "costumes", "props_costs.wardrobe", factors.costume_counts[s], rates.wardrobe_rate)
+        line(s, "wardrobe_cost", "makeup", "props_costs.makeup", factors.makeup_counts[s], rates.makeup_rate)
+        line(s, "crew_cost", "crew", "cast_rates.crew", days[s], rates.crew_daily)
+        line(s, "crew_cost", "transportation", "production_costs.transportation", days[s], rates.transport_daily)
+        line(s, "crew_cost", "catering", "production_costs.catering", days[s] * factors.headcount[s], rates.catering_per_person)
+        line(s, "equipment_cost", "equipment packages", "equipment_costs.*", days[s], rates.equipment_daily)
+        line(s, "equipment_cost", "special effects", "props_costs.special_effects", factors.sfx_counts[s], rates.sfx_rate)
+
+    lines.sort(key=lambda entry: entry["scene_number"])
+    return lines
+
+def estimate_costs(analysis: Any, rate_card: RateCard, with_provenance: bool = True) -> CostEstimate:
+    """Deterministically price every scene of an analysis against a rate card"""
+    factors = build_scene_cost_factors(analysis, rate_card)
+    matrix = compute_scene_matrix(factors)
+    breakdown = breakdown_from_matrix(factors, matrix)
+    provenance = build_provenance(factors) if with_provenance else []
+
+    logger.info(f"Cost engine priced {len(factors.scene_numbers)} scenes: ${breakdown.total_costs:,.2f} ({breakdown.budget_category})")
+    return CostEstimate(breakdown=breakdown, provenance=provenance, scene_matrix=matrix)
+
+def apply_what_if(
+    factors: SceneCostFactors,
+    cast_rate_overrides: Optional[Dict[str, float]] = None,
+    location_rate_overrides: Optional[Dict[str, float]] = None,
+    location_swaps: Optional[Dict[str, str]] = None,
+    unit_rate_overrides: Optional[Dict[str, float]] = None,
+    include_scenes: Optional[List[int]] = None,
+    exclude_scenes: Optional[List[int]] = None
+) -> Dict[str, Any]:
+    """
+    Re-price cached factors under hypothetical changes without touching the model.
+
+    Args:
+        cast_rate_overrides: character name or cast role key (e.g. 'lead_actor') -> day rate
+        location_rate_overrides: location rate key -> day rate
+        location_swaps: location name as written in the analysis, or location rate key -> location rate key to shoot it as
+        unit_rate_overrides: CostRates scalar field (e.g. 'crew_daily', 'prop_rate') -> value
+        include_scenes: only price these scene numbers
+        exclude_scenes: drop these scene numbers
+
+    Returns:
+        Dictionary with the recalculated 'breakdown', the priced 'scene_matrix', the 'scene_mask' used
+        and the list of overrides that matched nothing in 'unmatched'.
+    """
+    rates = factors.rates.copy()
+    onehot = factors.location_onehot
+    unmatched = []
+
+    for name, value in (cast_rate_overrides or {}).items():
+        target = _base_name(name)
+        hits = [i for i, (n, role) in enumerate(zip(factors.cast_names, factors.cast_roles))
+                if n == target or role == normalize_key(name)]
+        if not hits:
+            unmatched.append(f"cast:{name}")
+        rates.cast_rates[hits] = float(value)
+
+    location_index = {key: i for i, key in enumerate(factors.location_keys)}
+
+    for key, value in (location_rate_overrides or {}).items():
+        idx = location_index.get(normalize_key(key))
+        if idx is None:
+            unmatched.append(f"location_rate:{key}")
+            continue
+        rates.location_rates[idx] = float(value)
+
+    if location_swaps:
+        onehot = onehot.copy()
+        names = np.array([str(n or "").strip().upper() for n in factors.location_names])
+        for source, target in location_swaps.items():
+            target_idx = location_index.get(normalize_key(target))
+            source_idx = location_index.get(normalize_key(source))
+            rows = names == str(source).strip().upper()
+            if source_idx is not None:
+                rows |= factors.location_onehot[:, source_idx] > 0
+            if target_idx is None or not rows.any():
+                unmatched.append(f"swap:{source}->{target}")
+                continue
+            onehot[rows] = 0.0
+            onehot[rows, target_idx] = 1.0
+
+    for field_name, value in (unit_rate_overrides or {}).items():
+        if field_name in ("cast_rates", "location_rates") or not hasattr(rates, field_name):
+            unmatched.append(f"unit_rate:{field_name}")
+            continue
+        setattr(rates, field_name, float(value))
+
+    mask = np.ones(len(factors.scene_numbers), dtype=bool)
+    if include_scenes:
+        mask &= np.isin(factors.scene_numbers, include_scenes)
+    if exclude_scenes:
+        mask &= ~np.isin(factors.scene_numbers, exclude_scenes)
+
+    scenario = replace(factors, location_onehot=onehot)
+    matrix = compute_scene_matrix(scenario, rates, mask)
+    return {
+        "breakdown": breakdown_from_matrix(scenario, matrix, mask),
+        "scene_matrix": matrix,
+        "scene_mask": mask,
+        "unmatched": unmatched
+    }
+
+class SceneFactorCache:
+    """Small LRU of SceneCostFactors keyed by script id and analysis version"""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, script_id: str, version: str, load_analysis: Callable[[], Any], rate_card: RateCard) -> SceneCostFactors:
+        """Cached factors for this script version; load_analysis is only called on a miss"""
+        key = f"{script_id}:{version}:{rate_card.loaded_at}"
+        with self._lock:
+            factors = self._entries.get(key)
+            if factors is not None:
+                self._entries.move_to_end(key)
+                return factors
+
+        factors = build_scene_cost_factors(load_analysis(), rate_card)
+
+        with self._lock:
+            # Drop stale versions of the same script before inserting
+            for stale in [k for k in self._entries if k.startswith(f"{script_id}:")]:
+                del self._entries[stale]
+            self._entries[key] = factors
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return factors
+
+    def invalidate(self, script_id: str) -> None:
+        with self._lock:
+            for stale in [k for k in self._entries if k.startswith(f"{script_id}:")]:
+                del self._entries[stale]
+
+scene_factor_cache = SceneFactorCache()
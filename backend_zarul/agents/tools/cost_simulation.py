@@ -0,0 +1,107 @@
+import numpy as np
+from agents.tools.cost_engine import SceneCostFactors, COST_COLUMNS
+from typing import Dict, Any, Optional
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+PERCENTILES = [10, 50, 90]
+
+MAX_ITERATIONS = 50_000
+
+# Rate draws are multiplied out in row blocks of at most this many values (8 MB of float64)
+DRAW_BLOCK_VALUES = 1_000_000
+
+def _draw(rng: np.random.Generator, low, high, size) -> np.ndarray:
+    """Uniform draws between the ends of a rate range; degenerate ranges return the point value"""
+    low = np.asarray(low, dtype=float)
+    high = np.asarray(high, dtype=float)
+    return low + (high - low) * rng.random(size)
+
+def _draw_weighted(rng: np.random.Generator, low, high, iterations: int, weights: np.ndarray) -> np.ndarray:
+    """
+    Per iteration, the sum of one uniform draw per column times its weight.
+
+    Equivalent to _draw(rng, low, high, (iterations, columns)) @ weights, but the
+    draws are made in blocks of rows so memory stays bounded for any iteration count.
+    """
+    columns = max(len(weights), 1)
+    block = max(DRAW_BLOCK_VALUES // columns, 1)
+    result = np.empty(iterations)
+    for start in range(0, iterations, block):
+        stop = min(start + block, iterations)
+        result[start:stop] = _draw(rng, low, high, (stop - start, len(weights))) @ weights
+    return result
+
+def simulate_budget(
+    factors: SceneCostFactors,
+    iterations: int = 10_000,
+    seed: Optional[int] = None,
+    scene_mask: Optional[np.ndarray] = None
+) -> Dict[str, Any]:
+    """
+    Monte Carlo simulation of a script's budget over the rate ranges of the rate card.
+
+    Each iteration draws every rate from its [low, high] range: one rate per character,
+    location type and scalar rate, and one props/wardrobe/makeup/special effects rate per
+    scene. Draws are made as (iterations, scenes) arrays in blocks of rows, so memory
+    stays bounded; iterations is capped at MAX_ITERATIONS.
+
+    Returns:
+        Dictionary with P10/P50/P90 and mean per cost category and for the total.
+    """
+    start_time = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    lo, hi = factors.low_rates, factors.high_rates
+    N = min(iterations, MAX_ITERATIONS)
+
+    mask = np.ones(len(factors.scene_numbers), dtype=float) if scene_mask is None else np.asarray(scene_mask, dtype=float)
+    days = factors.shoot_days * mask
+
+    # Shooting days each character / location type is booked for
+    cast_days = days @ factors.cast_presence
+    location_days = days @ factors.location_onehot
+    person_days = days @ factors.headcount
+    total_days = days.sum()
+
+    def per_scene(count: np.ndarray, low: float, high: float) -> np.ndarray:
+        return _draw_weighted(rng, low, high, N, count * mask)
+
+    cast = _draw_weighted(rng, lo.cast_rates, hi.cast_rates, N, cast_days)
+    location = (_draw_weighted(rng, lo.location_rates, hi.location_rates, N, location_days)
+                + _draw(rng, lo.permit_cost, hi.permit_cost, N) * (factors.permit_flags * mask).sum())
+    props = per_scene(factors.prop_counts, lo.prop_rate, hi.prop_rate)
+    wardrobe = (per_scene(factors.costume_counts, lo.wardrobe_rate, hi.wardrobe_rate)
+                + per_scene(factors.makeup_counts, lo.makeup_rate, hi.makeup_rate))
+    crew = (_draw(rng, lo.crew_daily, hi.crew_daily, N) * total_days
+            + _draw(rng, lo.transport_daily, hi.transport_daily, N) * total_days
+            + _draw(rng, lo.catering_per_person, hi.catering_per_person, N) * person_days)
+    equipment = (_draw(rng, lo.equipment_daily, hi.equipment_daily, N) * total_days
+                 + per_scene(factors.sfx_counts, lo.sfx_rate, hi.sfx_rate))
+
+    categories = np.vstack([cast, location, props, wardrobe, crew, equipment])
+    totals = categories.sum(axis=0)
+
+    def summarize(samples: np.ndarray) -> Dict[str, float]:
+        p10, p50, p90 = np.percentile(samples, PERCENTILES)
+        return {
+            "p10": round(float(p10), 2),
+            "p50": round(float(p50), 2),
+            "p90": round(float(p90), 2),
+            "mean": round(float(samples.mean()), 2)
+        }
+
+    elapsed_ms = (time.perf_counter() - start_time) * 1000
+    logger.info(f"Budget simulation: {N} iterations over {int(mask.sum())} scenes in {elapsed_ms:.1f} ms")
+
+    return {
+        "iterations": N,
+        "scenes_simulated": int(mask.sum()),
+        "categories": {
+            column.replace("_cost", ""): summarize(samples)
+            for column, samples in zip(COST_COLUMNS, categories)
+        },
+        "total": summarize(totals),
+        "computation_ms": round(elapsed_ms, 3)
+    }
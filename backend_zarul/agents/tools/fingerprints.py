@@ -0,0 +1,36 @@
+from typing import Optional
+import hashlib
+import re
+import unicodedata
+
+HASH_CHUNK_BYTES = 1024 * 1024
+
+_WHITESPACE = re.compile(r"\s+")
+
+def file_sha256(path: str) -> str:
+    """SHA-256 of a file's bytes, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def normalize_script_text(text: str) -> str:
+    """
+    Canonical form of extracted script text for fingerprinting.
+
+    Unicode is NFKC-normalized and every whitespace run (including line and page
+    breaks) becomes one space, so the same script exported to a different PDF
+    still matches.
+    """
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+def text_sha256(text: Optional[str]) -> Optional[str]:
+    """SHA-256 of the normalized script text; None when there is no text"""
+    normalized = normalize_script_text(text or "")
+    if not normalized:
+        return None
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+def is_sha256(value: str) -> bool:
+    return len(value) == 64 and all(c in "0123456789abcdef" for c in value)
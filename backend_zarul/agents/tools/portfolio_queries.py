@@ -0,0 +1,182 @@
+from agents.tools.script_queries import get_scenes, normalize_question
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Entity kinds stored per script in script_entities
+ENTITY_TYPES = ["character", "location", "special_requirement", "prop"]
+
+BUDGET_CATEGORIES = ["Low", "Medium", "High"]
+
+DEFAULT_TOP_N = 10
+
+# Trailing nouns that pin an entity search to one kind
+ENTITY_NOUNS = {
+    "location": "location", "locations": "location", "set": "location", "sets": "location",
+    "character": "character", "characters": "character", "actor": "character", "role": "character",
+    "prop": "prop", "props": "prop",
+    "stunt": "special_requirement", "stunts": "special_requirement", "effect": "special_requirement",
+    "effects": "special_requirement", "requirement": "special_requirement", "requirements": "special_requirement",
+}
+
+_ENTITY_QUESTION = re.compile(
+    r"\b(?:which|what|list|find|show)\s+(?:scripts?|projects?|films?)\s+"
+    r"(?:need|needs|have|has|use|uses|feature|features|include|includes|require|requires|with|contain|contains|are set in|set in|shot in|mention|mentions)\s+"
+    r"(?:an?\s+|the\s+|any\s+)?(.+?)$"
+)
+_SCRIPTS_WITH = re.compile(r"^(?:scripts?|projects?|films?)\s+(?:with|featuring|that need|needing|set in)\s+(?:an?\s+|the\s+)?(.+?)$")
+
+# Comparisons and measures are not entity names: those questions go to the LLM
+_NOT_AN_ENTITY = re.compile(r"\b(?:most|least|more|fewer|less|over|under|above|below|than|budgets?|costs?|\d+)\b")
+
+@dataclass
+class PortfolioIntent:
+    """Parsed portfolio question: which aggregate to run and with what parameters"""
+    name: str
+    params: Dict[str, Any] = field(default_factory=dict)
+
+def extract_script_entities(analysis: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Flatten one script's analysis into entity rows for the cross-script index.
+
+    Returns:
+        List of {"entity_type", "name", "normalized_name", "scene_count"} dicts, one per distinct entity.
+    """
+    counters = {entity_type: Counter() for entity_type in ENTITY_TYPES}
+    names: Dict[tuple, str] = {}
+
+    def add(entity_type: str, value: Any) -> None:
+        name = str(value or "").strip()
+        if not name:
+            return
+        key = normalize_question(name)
+        if not key:
+            return
+        counters[entity_type][key] += 1
+        names.setdefault((entity_type, key), name)
+
+    for scene in get_scenes(analysis):
+        for character in set(scene.get("characters_present", scene.get("characters", [])) or []):
+            add("character", character)
+        add("location", scene.get("location", scene.get("scene_location")))
+        for requirement in set(scene.get("special_requirements", []) or []):
+            add("special_requirement", requirement)
+        for prop in set(scene.get("props_mentioned", []) or []):
+            add("prop", prop)
+
+    return [
+        {"entity_type": entity_type, "name": names[(entity_type, key)], "normalized_name": key, "scene_count": count}
+        for entity_type, counter in counters.items()
+        for key, count in counter.items()
+    ]
+
+def _budget_category(normalized: str) -> Optional[str]:
+    match = re.search(r"\b(low|medium|mid|high)(?:[ -]budget)?\b", normalized)
+    if not match:
+        return None
+    return {"low": "Low", "medium": "Medium", "mid": "Medium", "high": "High"}[match.group(1)]
+
+def _top_n(normalized: str) -> int:
+    match = re.search(r"\b(?:top|first)\s+(\d{1,3})\b|\b(\d{1,3})\s+(?:most|least|cheapest|biggest|scripts)\b", normalized)
+    return max(1, min(int(match.group(1) or match.group(2)), 100)) if match else DEFAULT_TOP_N
+
+def _entity_search(term: str) -> PortfolioIntent:
+    words = term.split()
+    entity_type = None
+    if words and words[-1] in ENTITY_NOUNS:
+        entity_type = ENTITY_NOUNS[words[-1]]
+        if len(words) > 1:
+            words = words[:-1]
+    # Plurals are matched against the indexed names, not by trimming the term
+    return PortfolioIntent("entity_search", {"term": " ".join(words), "entity_type": entity_type})
+
+def parse_portfolio_question(question: str) -> Optional[PortfolioIntent]:
+    """
+    Route a slate-wide question to an aggregate the database can answer directly.
+
+    Returns:
+        PortfolioIntent, or None for open-ended questions that need the LLM. An
+        entity_search is only a candidate: callers fall back to the LLM when it
+        matches nothing in the index.
+    """
+    normalized = normalize_question(question)
+    if not normalized:
+        return None
+
+    if re.search(r"\b(most|least) expensive|biggest budgets?|largest budgets?|cheapest|smallest budgets?", normalized):
+        descending = not re.search(r"least expensive|cheapest|smallest", normalized)
+        return PortfolioIntent("top_budgets", {"top_n": _top_n(normalized), "descending": descending})
+
+    if re.search(r"\b(total|sum|combined|overall|average|avg|mean)\b", normalized) and "budget" in normalized:
+        measure = "average" if re.search(r"\b(average|avg|mean)\b", normalized) else "total"
+        return PortfolioIntent("budget_aggregate", {"category": _budget_category(normalized), "measure": measure})
+
+    if re.search(r"how many (scripts|projects|films)", normalized):
+        return PortfolioIntent("budget_aggregate", {"category": _budget_category(normalized), "measure": "count"})
+
+    match = _ENTITY_QUESTION.search(normalized) or _SCRIPTS_WITH.search(normalized)
+    if match and not _NOT_AN_ENTITY.search(match.group(1)):
+        return _entity_search(match.group(1).strip())
+
+    return None
+
+def format_entity_matches(params: Dict[str, Any], rows: List[Dict[str, Any]]) -> str:
+    subject = f"have a {params['entity_type'].replace('_', ' ')} matching" if params.get("entity_type") else "mention"
+    if not rows:
+        return f"No analyzed scripts {subject} '{params['term']}'."
+
+    lines = [
+        f"• {row['filename']}: {', '.join(row['matches'][:5])}" + (f" (+{len(row['matches']) - 5} more)" if len(row['matches']) > 5 else "")
+        + f" - {row['scene_count']} scene(s)"
+        for row in rows
+    ]
+    return f"{len(rows)} script(s) {subject} '{params['term']}':\n" + "\n".join(lines)
+
+def format_budget_aggregate(params: Dict[str, Any], aggregate: Dict[str, Any]) -> str:
+    scope = f"{params['category']} budget scripts" if params.get("category") else "all analyzed scripts"
+    if not aggregate["script_count"]:
+        return f"There are no {scope} with a budget estimate."
+
+    if params["measure"] == "count":
+        text = f"There are {aggregate['script_count']} {scope}."
+    elif params["measure"] == "average":
+        text = f"The average budget across {aggregate['script_count']} {scope} is ${aggregate['average_budget']:,.2f}."
+    else:
+        text = f"The total budget of {aggregate['script_count']} {scope} is ${aggregate['total_budget']:,.2f}."
+
+    if not params.get("category") and aggregate.get("by_category"):
+        text += "\n\nBy budget category:\n" + "\n".join(
+            f"• {row['budget_category'] or 'Uncategorized'}: {row['script_count']} script(s), ${row['total_budget']:,.2f} total"
+            for row in aggregate["by_category"]
+        )
+    return text
+
+def format_top_budgets(params: Dict[str, Any], rows: List[Dict[str, Any]]) -> str:
+    if not rows:
+        return "No analyzed scripts have a budget estimate yet."
+    label = "most" if params["descending"] else "least"
+    lines = [
+        f"{i}. {row['filename']}: ${row['estimated_budget']:,.2f} ({row['budget_category'] or 'Uncategorized'})"
+        for i, row in enumerate(rows, 1)
+    ]
+    return f"The {len(rows)} {label} expensive scripts:\n" + "\n".join(lines)
+
+def render_overview(overview: Dict[str, Any]) -> str:
+    """Compact slate summary for the LLM prompt; never includes per-script JSON"""
+    lines = [
+        f"Scripts analyzed: {overview['script_count']}",
+        f"Total estimated budget: ${overview['total_budget']:,.2f}",
+        "Budget categories: " + ", ".join(
+            f"{row['budget_category'] or 'Uncategorized'} {row['script_count']}" for row in overview["by_category"]
+        ),
+    ]
+    for entity_type, rows in overview["top_entities"].items():
+        lines.append(
+            f"Most common {entity_type.replace('_', ' ')}s: "
+            + ", ".join(f"{row['name']} ({row['script_count']} scripts)" for row in rows)
+        )
+    return "\n".join(lines)
@@ -0,0 +1,240 @@
+from pymongo import MongoClient
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Tuple
+import hashlib
+import json
+import os
+import re
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+COST_CATEGORIES = ["cast_rates", "location_costs", "equipment_costs", "props_costs", "production_costs"]
+
+# Fields that name a record inside its category, in lookup order
+KEY_FIELDS = ["role", "location_type", "equipment", "category", "name", "item"]
+
+# Numeric fields carrying the price of a record, in lookup order, with their unit
+VALUE_FIELDS = [
+    ("daily_rate", "daily"),
+    ("per_person_daily", "per_person_daily"),
+    ("daily_budget", "daily"),
+    ("average_cost", "flat"),
+    ("unit_cost", "flat"),
+    ("percentage_of_budget", "percentage"),
+]
+
+# Seconds a loaded rate card is reused before MongoDB is queried again
+RATE_CARD_TTL = int(os.getenv("RATE_CARD_TTL_SECONDS", "600"))
+
+@dataclass
+class RateRecord:
+    """Single priced line from the cost collection"""
+    category: str
+    key: str
+    rate: float
+    low: float
+    high: float
+    unit: str = "daily"
+    currency: str = "USD"
+    source: str = "fallback"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "category": self.category,
+            "key": self.key,
+            "rate": self.rate,
+            "low": self.low,
+            "high": self.high,
+            "unit": self.unit,
+            "currency": self.currency,
+            "source": self.source
+        }
+
+@dataclass
+class RateCard:
+    """Normalized view over the raw cost collection records"""
+    records: List[RateRecord] = field(default_factory=list)
+    source: str = "fallback"
+    loaded_at: float = field(default_factory=time.time)
+
+    def __post_init__(self):
+        self._index = {(r.category, r.key): r for r in self.records}
+
+    @classmethod
+    def from_cost_data(cls, cost_data: Dict[str, Any], source: str = None) -> "RateCard":
+        """Build a rate card from the dict returned by rag_mongodb_tool / fetch_cost_data"""
+        source = source or cost_data.get("data_source", "mongodb")
+        records = []
+        for category in COST_CATEGORIES:
+            for raw in cost_data.get(category, []) or []:
+                record = parse_rate_record(category, raw, source)
+                if record:
+                    records.append(record)
+        return cls(records=records, source=source)
+
+    def get(self, category: str, key: str) -> Optional[RateRecord]:
+        return self._index.get((category, normalize_key(key)))
+
+    def by_category(self, category: str) -> List[RateRecord]:
+        return [r for r in self.records if r.category == category]
+
+    def rate(self, category: str, key: str, default: float = 0.0, bound: str = "rate") -> float:
+        """Price of a record; bound selects the point estimate ('rate') or its 'low'/'high' end"""
+        record = self.get(category, key)
+        return getattr(record, bound) if record else default
+
+    @property
+    def version(self) -> str:
+        """Short content hash of the priced records, stamped on re-priced analyses"""
+        payload = json.dumps(
+            sorted([r.category, r.key, r.rate, r.low, r.high, r.unit] for r in self.records)
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+def normalize_key(value: Any) -> str:
+    """Lowercase snake_case key used to address rate records"""
+    return re.sub(r"[^a-z0-9]+", "_", str(value or "").lower()).strip("_")
+
+def parse_budget_range(value: Any) -> Optional[Tuple[float, float]]:
+    """Parse '100-500' / '$1,000 - $5,000' style ranges into (low, high)"""
+    numbers = re.findall(r"\d+(?:\.\d+)?", str(value or "").replace(",", ""))
+    if not numbers:
+        return None
+    low = float(numbers[0])
+    high = float(numbers[1]) if len(numbers) > 1 else low
+    return (min(low, high), max(low, high))
+
+def parse_rate_record(category: str, raw: Dict[str, Any], source: str = "mongodb") -> Optional[RateRecord]:
+    """Convert one raw cost document into a RateRecord, or None if it carries no price"""
+    if not isinstance(raw, dict):
+        return None
+
+    key = next((raw[f] for f in KEY_FIELDS if raw.get(f)), None)
+    if key is None:
+        return None
+
+    currency = raw.get("currency", "USD")
+
+    if raw.get("budget_range") is not None:
+        bounds = parse_budget_range(raw["budget_range"])
+        if bounds:
+            low, high = bounds
+            return RateRecord(category, normalize_key(key), (low + high) / 2, low, high,
+                              raw.get("unit", "per_item"), currency, source)
+
+    for field_name, unit in VALUE_FIELDS:
+        value = raw.get(field_name)
+        if isinstance(value, (int, float)):
+            value = float(value)
+            return RateRecord(category, normalize_key(key), value, value, value, unit, currency, source)
+
+    return None
+
+def get_fallback_cost_data() -> dict:
+    """Provide fallback cost data when MongoDB is unavailable"""
+    return {
+        "cast_rates": [
+            {"role": "lead_actor", "daily_rate": 5000, "currency": "USD"},
+            {"role": "supporting_actor", "daily_rate": 1500, "currency": "USD"},
+            {"role": "background_actor", "daily_rate": 200, "currency": "USD"},
+            {"role": "director", "daily_rate": 3000, "currency": "USD"},
+            {"role": "cinematographer", "daily_rate": 2000, "currency": "USD"}
+        ],
+        "location_costs": [
+            {"location_type": "interior_house", "daily_rate": 800, "currency": "USD"},
+            {"location_type": "exterior_street", "daily_rate": 1200, "currency": "USD"},
+            {"location_type": "office_building", "daily_rate": 1500, "currency": "USD"},
+            {"location_type": "restaurant", "daily_rate": 2000, "currency": "USD"},
+            {"location_type": "studio", "daily_rate": 3000, "currency": "USD"}
+        ],
+        "equipment_costs": [
+            {"equipment": "camera_package", "daily_rate": 800, "currency": "USD"},
+            {"equipment": "lighting_package", "daily_rate": 600, "currency": "USD"},
+            {"equipment": "sound_package", "daily_rate": 400, "currency": "USD"},
+            {"equipment": "grip_package", "daily_rate": 500, "currency": "USD"}
+        ],
+        "props_costs": [
+            {"category": "basic_props", "budget_range": "100-500", "currency": "USD"},
+            {"category": "wardrobe", "budget_range": "200-1000", "currency": "USD"},
+            {"category": "makeup", "budget_range": "150-800", "currency": "USD"},
+            {"category": "special_effects", "budget_range": "500-5000", "currency": "USD"}
+        ],
+        "production_costs": [
+            {"category": "catering", "per_person_daily": 25, "currency": "USD"},
+            {"category": "transportation", "daily_budget": 300, "currency": "USD"},
+            {"category": "insurance", "percentage_of_budget": 3, "currency": "USD"},
+            {"category": "permits", "average_cost": 500, "currency": "USD"}
+        ],
+        "total_records": 20,
+        "data_source": "fallback"
+    }
+
+def fetch_cost_data(limit_per_category: int = 10) -> Dict[str, Any]:
+    """
+    Query the cost collection in MongoDB.
+
+    Returns:
+        Dictionary with one list per cost category plus total_records and data_source.
+        Falls back to built-in rates when MongoDB is not configured, unreachable or empty.
+    """
+    client = None
+    try:
+        mongodb_uri = os.getenv("MONGODB_ATLAS_CLUSTER_URI")
+        if not mongodb_uri:
+            logger.error("MONGODB_ATLAS_CLUSTER_URI environment variable not set")
+            return get_fallback_cost_data()
+
+        client = MongoClient(
+            mongodb_uri,
+            serverSelectionTimeoutMS=5000,
+            connectTimeoutMS=5000,
+            socketTimeoutMS=5000
+        )
+
+        DB_NAME = os.getenv("MONGODB_DB_NAME", "test_db")
+        COLLECTION_NAME = os.getenv("MONGODB_COLLECTION_NAME", "cost_collection_pdf")
+        collection = client[DB_NAME][COLLECTION_NAME]
+
+        client.admin.command('ping')
+        logger.info(f"✅ Connected to MongoDB: {DB_NAME}.{COLLECTION_NAME}")
+
+        cost_data = {
+            category: list(collection.find({"category": category}, {"_id": 0}).limit(limit_per_category))
+            for category in COST_CATEGORIES
+        }
+        cost_data["total_records"] = sum(len(cost_data[c]) for c in COST_CATEGORIES)
+        cost_data["data_source"] = "mongodb"
+
+        if cost_data["total_records"] == 0:
+            logger.warning("No cost data found in MongoDB, using fallback data")
+            return get_fallback_cost_data()
+
+        logger.info(f"✅ Retrieved {cost_data['total_records']} cost records from MongoDB")
+        return cost_data
+
+    except Exception as e:
+        logger.error(f"❌ MongoDB cost query failed: {str(e)}")
+        return get_fallback_cost_data()
+
+    finally:
+        if client:
+            try:
+                client.close()
+            except Exception as close_error:
+                logger.warning(f"Error closing MongoDB connection: {close_error}")
+
+_rate_card_cache: Dict[str, Any] = {"card": None}
+
+def load_rate_card(force_refresh: bool = False) -> RateCard:
+    """Return the current rate card, reusing the cached copy for RATE_CARD_TTL seconds"""
+    card = _rate_card_cache["card"]
+    if card is not None and not force_refresh and (time.time() - card.loaded_at) < RATE_CARD_TTL:
+        return card
+
+    cost_data = fetch_cost_data()
+    card = RateCard.from_cost_data(cost_data, cost_data.get("data_source"))
+    _rate_card_cache["card"] = card
+    logger.info(f"Rate card loaded: {len(card.records)} records from {card.source}")
+    return card
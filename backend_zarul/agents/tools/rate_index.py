@@ -0,0 +1,195 @@
+import numpy as np
+from agents.tools.rate_card import RateCard, RateRecord, normalize_key
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional, Tuple
+import re
+import zlib
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Hashed character n-gram space; collisions are rare at this size for short rate keys
+NGRAM_SIZE = 3
+NGRAM_DIMENSIONS = 2048
+QUERY_BLOCK = 1024
+
+# Matches scoring below this are reported as unmatched
+MIN_CONFIDENCE = 0.45
+
+# Extra phrases that should resolve to a rate key, per cost category
+SYNONYMS: Dict[str, Dict[str, List[str]]] = {
+    "location_costs": {
+        "studio": ["studio", "stage", "sound stage", "soundstage", "backlot", "set"],
+        "restaurant": ["restaurant", "cafe", "coffee shop", "diner", "bar", "pub", "bistro", "canteen", "kitchen"],
+        "office_building": ["office", "bank", "lobby", "conference room", "boardroom", "precinct", "police station", "hospital", "school", "classroom"],
+        "interior_house": ["house", "home", "apartment", "flat", "bedroom", "living room", "bathroom", "hallway", "basement", "attic"],
+        "exterior_street": ["street", "road", "alley", "highway", "sidewalk", "park", "parking lot", "city", "town square", "bridge"],
+    },
+    "cast_rates": {
+        "lead_actor": ["lead", "lead actor", "protagonist", "star", "principal", "main character", "hero"],
+        "supporting_actor": ["supporting", "supporting actor", "featured", "secondary", "day player"],
+        "background_actor": ["background", "extra", "extras", "crowd", "passerby", "bystander", "patron", "guest", "waiter", "officer", "nurse"],
+        "director": ["director"],
+        "cinematographer": ["cinematographer", "dp", "director of photography", "camera operator"],
+    },
+    "equipment_costs": {
+        "camera_package": ["camera", "cameras", "crane", "drone", "steadicam"],
+        "lighting_package": ["lighting", "lights", "generator"],
+        "sound_package": ["sound", "audio", "microphone", "boom"],
+        "grip_package": ["grip", "dolly", "rigging", "track"],
+    },
+    "props_costs": {
+        "basic_props": ["props", "prop", "set dressing", "set decoration"],
+        "wardrobe": ["wardrobe", "costume", "costumes", "uniform"],
+        "makeup": ["makeup", "hair", "prosthetics"],
+        "special_effects": ["special effects", "sfx", "vfx", "explosion", "fire", "stunt", "stunts", "gunfire", "rain"],
+    },
+}
+
+# Screenplay noise stripped before matching
+_SLUG_PREFIX = re.compile(r"^\s*(int\.?\s*/\s*ext\.?|ext\.?\s*/\s*int\.?|int\.?|ext\.?|i\s*/\s*e\.?)\s+", re.IGNORECASE)
+_TIME_SUFFIX = re.compile(r"\s+-\s+(day|night|dawn|dusk|morning|evening|later|continuous|moments later)\b.*$", re.IGNORECASE)
+
+@dataclass
+class RateMatch:
+    """Resolution of one free-text attribute to a rate record"""
+    query: str
+    record: Optional[RateRecord]
+    confidence: float
+    matched_alias: Optional[str] = None
+
+    @property
+    def key(self) -> Optional[str]:
+        return self.record.key if self.record else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "query": self.query,
+            "rate_key": self.key,
+            "category": self.record.category if self.record else None,
+            "confidence": round(self.confidence, 3),
+            "matched_alias": self.matched_alias
+        }
+
+def normalize_text(value: Any) -> str:
+    """Lowercase, strip INT./EXT. slug prefixes, time-of-day suffixes and punctuation"""
+    text = _TIME_SUFFIX.sub("", _SLUG_PREFIX.sub("", str(value or "")))
+    text = re.sub(r"'s\b", "", text.lower())
+    return re.sub(r"[^a-z0-9]+", " ", text).strip()
+
+def _ngram_ids(text: str) -> List[int]:
+    ids = []
+    for word in text.split():
+        padded = f" {word} "
+        for i in range(max(len(padded) - NGRAM_SIZE + 1, 1)):
+            ids.append(zlib.crc32(padded[i:i + NGRAM_SIZE].encode()) % NGRAM_DIMENSIONS)
+    return ids
+
+def _ngram_matrix(texts: List[str]) -> np.ndarray:
+    """Binary (len(texts), NGRAM_DIMENSIONS) n-gram occurrence matrix"""
+    matrix = np.zeros((len(texts), NGRAM_DIMENSIONS), dtype=np.float32)
+    for row, text in enumerate(texts):
+        ids = _ngram_ids(text)
+        if ids:
+            matrix[row, ids] = 1.0
+    return matrix
+
+class RateCardIndex:
+    """Compiled lookup of rate records by normalized key, synonym and character n-gram similarity"""
+
+    def __init__(self, rate_card: RateCard):
+        self.version = rate_card.version
+        self._categories: Dict[str, Dict[str, Any]] = {}
+
+        for category in {r.category for r in rate_card.records}:
+            records = rate_card.by_category(category)
+            aliases, owners = [], []
+            for idx, record in enumerate(records):
+                phrases = {record.key.replace("_", " ")}
+                phrases.update(SYNONYMS.get(category, {}).get(record.key, []))
+                for phrase in sorted(phrases):
+                    aliases.append(normalize_text(phrase))
+                    owners.append(idx)
+
+            matrix = _ngram_matrix(aliases)
+            self._categories[category] = {
+                "records": records,
+                "aliases": aliases,
+                "owners": np.array(owners, dtype=int),
+                "exact": {alias: (owner, alias) for alias, owner in zip(aliases, owners)},
+                "matrix": matrix,
+                "sizes": np.maximum(matrix.sum(axis=1), 1.0),
+            }
+
+    def resolve(self, category: str, queries: List[str], min_confidence: float = MIN_CONFIDENCE) -> Tuple[List[RateMatch], List[str]]:
+        """
+        Resolve free-text attributes to rate records of one category in a single vectorized pass.
+
+        Exact normalized keys and synonyms score 1.0. Everything else is scored against every
+        alias with n-gram overlap: the mean of containment (alias n-grams found in the query)
+        and Dice similarity, so 'JOHN'S APARTMENT - BEDROOM' still lands on interior_house.
+
+        Returns:
+            (matches aligned with queries, distinct queries that scored below min_confidence)
+        """
+        entry = self._categories.get(category)
+        if not entry or not queries:
+            return [RateMatch(q, None, 0.0) for q in queries], sorted({q for q in queries if q})
+
+        normalized = [normalize_text(q) for q in queries]
+        unique, inverse = np.unique(np.array(normalized, dtype=object), return_inverse=True)
+
+        best_alias = np.zeros(len(unique), dtype=int)
+        best_score = np.zeros(len(unique), dtype=np.float32)
+
+        for start in range(0, len(unique), QUERY_BLOCK):
+            block = list(unique[start:start + QUERY_BLOCK])
+            q = _ngram_matrix(block)
+            overlap = q @ entry["matrix"].T                                 # (B, A) shared n-grams
+            q_sizes = np.maximum(q.sum(axis=1), 1.0)[:, None]
+            containment = overlap / entry["sizes"][None, :]
+            dice = 2 * overlap / (q_sizes + entry["sizes"][None, :])
+            scores = (containment + dice) / 2
+
+            best_alias[start:start + len(block)] = scores.argmax(axis=1)
+            best_score[start:start + len(block)] = scores.max(axis=1)
+
+        matches, unmatched = [], set()
+        for i, (query, text) in enumerate(zip(queries, normalized)):
+            u = inverse[i]
+            exact = entry["exact"].get(text) or entry["exact"].get(normalize_key(text).replace("_", " "))
+            if exact:
+                owner, alias = exact
+                matches.append(RateMatch(query, entry["records"][owner], 1.0, alias))
+                continue
+
+            score = float(best_score[u])
+            alias_idx = int(best_alias[u])
+            if score >= min_confidence:
+                record = entry["records"][entry["owners"][alias_idx]]
+                matches.append(RateMatch(query, record, min(score, 0.99), entry["aliases"][alias_idx]))
+            else:
+                matches.append(RateMatch(query, None, score))
+                if query:
+                    unmatched.add(query)
+
+        return matches, sorted(unmatched)
+
+    def resolve_one(self, category: str, query: str, min_confidence: float = MIN_CONFIDENCE) -> RateMatch:
+        return self.resolve(category, [query], min_confidence)[0][0]
+
+_index_cache: Dict[str, RateCardIndex] = {}
+_index_lock = threading.Lock()
+
+def get_rate_index(rate_card: RateCard) -> RateCardIndex:
+    """Return the compiled index for a rate card, building it once per rate card version"""
+    version = rate_card.version
+    with _index_lock:
+        index = _index_cache.get(version)
+        if index is None:
+            index = RateCardIndex(rate_card)
+            _index_cache.clear()
+            _index_cache[version] = index
+            logger.info(f"Rate card index compiled for version {version}")
+        return index
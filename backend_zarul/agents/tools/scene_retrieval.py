@@ -0,0 +1,201 @@
+import numpy as np
+from agents.tools.chat_history import estimate_tokens
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+import os
+import re
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+DEFAULT_TOP_K = 12
+SCENE_TOKEN_BUDGET = int(os.getenv("CHAT_SCENE_TOKEN_BUDGET", "1500"))
+
+# Optional local embeddings (sentence-transformers); lexical search only when unset
+EMBEDDING_MODEL = os.getenv("SCENE_EMBEDDING_MODEL")
+EMBEDDING_WEIGHT = 0.5
+
+# Field weights: repeated tokens raise term frequency in the scene document
+FIELD_WEIGHTS = {
+    "scene_header": 2,
+    "location": 2,
+    "characters_present": 2,
+    "props_mentioned": 1,
+    "special_requirements": 1,
+    "time_of_day": 1,
+    "scene_type": 1,
+}
+
+STOPWORDS = {
+    "a", "an", "and", "are", "at", "be", "by", "do", "does", "for", "from", "has", "have", "in", "is",
+    "it", "of", "on", "or", "s", "that", "the", "their", "there", "this", "to", "was", "what", "when",
+    "where", "which", "who", "with", "scene", "scenes", "me", "tell", "about", "how", "many", "much",
+}
+
+_SCENE_REFERENCE = re.compile(r"\bscenes?\s+(\d+(?:\s*(?:,|and|&|-|to)\s*\d+)*)", re.IGNORECASE)
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in re.findall(r"[a-z0-9]+", (text or "").lower()) if t not in STOPWORDS]
+
+def _scene_document(scene: Dict[str, Any]) -> List[str]:
+    tokens = []
+    for field, weight in FIELD_WEIGHTS.items():
+        value = scene.get(field)
+        if isinstance(value, list):
+            value = " ".join(str(v) for v in value)
+        tokens.extend(tokenize(str(value or "")) * weight)
+    return tokens
+
+def referenced_scene_numbers(question: str) -> List[int]:
+    """Scene numbers named in the question: 'scene 12', 'scenes 3, 5 and 9', 'scenes 10-12'"""
+    numbers = []
+    for match in _SCENE_REFERENCE.finditer(question or ""):
+        for part in re.split(r"\s*(?:,|and|&)\s*", match.group(1)):
+            bounds = re.split(r"\s*(?:-|to)\s*", part)
+            if len(bounds) == 2 and bounds[0].isdigit() and bounds[1].isdigit():
+                low, high = int(bounds[0]), int(bounds[1])
+                if 0 <= high - low <= 50:
+                    numbers.extend(range(low, high + 1))
+            elif part.isdigit():
+                numbers.append(int(part))
+    return numbers
+
+def _get_embedder():
+    """Load the sentence-transformers model once; None if not configured or not installed"""
+    global _embedder
+    if not EMBEDDING_MODEL:
+        return None
+    with _embedder_lock:
+        if _embedder is None:
+            try:
+                from sentence_transformers import SentenceTransformer
+                _embedder = SentenceTransformer(EMBEDDING_MODEL)
+                logger.info(f"Scene embeddings enabled with {EMBEDDING_MODEL}")
+            except ImportError:
+                logger.warning("SCENE_EMBEDDING_MODEL is set but sentence-transformers is not installed. Use: pip install sentence-transformers")
+                _embedder = False
+            except Exception as e:
+                logger.warning(f"Failed to load scene embedding model {EMBEDDING_MODEL}: {e}")
+                _embedder = False
+        return _embedder or None
+
+class SceneIndex:
+    """BM25 index over one script's scene records, with optional dense embeddings"""
+
+    def __init__(self, scenes: List[Dict[str, Any]], rows: List[str]):
+        self.scenes = scenes
+        self.rows = rows
+        self.numbers = [scene.get("scene_number") for scene in scenes]
+        self.row_tokens = np.array([estimate_tokens(row) for row in rows], dtype=int)
+
+        documents = [_scene_document(scene) for scene in scenes]
+        self.vocabulary: Dict[str, int] = {}
+        for document in documents:
+            for token in document:
+                self.vocabulary.setdefault(token, len(self.vocabulary))
+
+        # (scenes, vocabulary) term frequencies; 300 scenes x a few thousand terms stays small
+        tf = np.zeros((len(documents), max(len(self.vocabulary), 1)), dtype=np.float32)
+        for row, document in enumerate(documents):
+            for token in document:
+                tf[row, self.vocabulary[token]] += 1
+
+        lengths = tf.sum(axis=1)
+        average_length = max(float(lengths.mean()) if len(lengths) else 0.0, 1.0)
+        df = (tf > 0).sum(axis=0)
+        self.idf = np.log(1 + (len(documents) - df + 0.5) / (df + 0.5)).astype(np.float32)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / average_length)
+        self.weights = tf * (BM25_K1 + 1) / (tf + norm[:, None])           # BM25 term saturation
+
+        self.embeddings = None
+        embedder = _get_embedder()
+        if embedder is not None and rows:
+            self.embeddings = embedder.encode(rows, normalize_embeddings=True, convert_to_numpy=True)
+
+    def score(self, question: str) -> np.ndarray:
+        """Relevance of every scene to the question, in [0, 1]"""
+        ids = [self.vocabulary[t] for t in set(tokenize(question)) if t in self.vocabulary]
+        scores = np.zeros(len(self.scenes), dtype=np.float32)
+        if ids:
+            scores = self.weights[:, ids] @ self.idf[ids]
+            if scores.max() > 0:
+                scores = scores / scores.max()
+
+        if self.embeddings is not None:
+            query = _get_embedder().encode([question], normalize_embeddings=True, convert_to_numpy=True)[0]
+            dense = np.clip(self.embeddings @ query, 0, 1)
+            scores = (1 - EMBEDDING_WEIGHT) * scores + EMBEDDING_WEIGHT * dense
+        return scores
+
+    def select(self, question: str, top_k: int = DEFAULT_TOP_K, token_budget: int = SCENE_TOKEN_BUDGET) -> Dict[str, Any]:
+        """
+        Pick the scene rows most relevant to the question within a token budget.
+
+        Scenes named by number come first, then the top-k scored scenes. Questions that
+        match nothing get the opening scenes. Rows are returned in script order.
+        """
+        if not self.scenes:
+            return {"rows": [], "scene_numbers": [], "total_scenes": 0}
+
+        position = {number: i for i, number in enumerate(self.numbers)}
+        named = [position[n] for n in referenced_scene_numbers(question) if n in position]
+
+        scores = self.score(question)
+        ranked = [int(i) for i in np.argsort(-scores, kind="stable")[:top_k] if scores[i] > 0]
+        if not named and not ranked:
+            ranked = list(range(min(top_k, len(self.scenes))))
+
+        chosen, used = [], 0
+        for i in dict.fromkeys(named + ranked):
+            if used + self.row_tokens[i] > token_budget and chosen:
+                break
+            chosen.append(i)
+            used += int(self.row_tokens[i])
+
+        chosen.sort()
+        return {
+            "rows": [self.rows[i] for i in chosen],
+            "scene_numbers": [self.numbers[i] for i in chosen],
+            "total_scenes": len(self.scenes)
+        }
+
+class SceneIndexCache:
+    """LRU of scene indexes keyed by script id, valid for one chat artifact build"""
+
+    def __init__(self, max_entries: int = 128):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, script_id: str, chat_context: Dict[str, Any]) -> SceneIndex:
+        version = chat_context.get("built_at")
+        with self._lock:
+            entry = self._entries.get(script_id)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(script_id)
+                return entry[1]
+
+        scenes = chat_context["analysis"]["script_data"]["scenes"]
+        rows = chat_context["scene_table"].split("\n")[1:]
+        index = SceneIndex(scenes, rows)
+
+        with self._lock:
+            self._entries[script_id] = (version, index)
+            self._entries.move_to_end(script_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return index
+
+    def invalidate(self, script_id: str) -> None:
+        with self._lock:
+            self._entries.pop(script_id, None)
+
+scene_index_cache = SceneIndexCache()
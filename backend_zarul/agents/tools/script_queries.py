@@ -0,0 +1,560 @@
+from dataclasses import dataclass, field
+from collections import Counter, defaultdict
+from typing import Dict, Any, List, Optional
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOP_N = 5
+
+# Questions containing these are open-ended and always go to the LLM
+OPEN_ENDED_MARKERS = [
+    "why", "suggest", "recommend", "should", "improve", "opinion", "think", "advice", "idea",
+    "explain", "describe", "summar", "compare", "how can", "how do i", "what if", "tone", "theme", "story",
+]
+
+@dataclass
+class QueryAnswer:
+    """Answer produced locally from the stored analysis"""
+    intent: str
+    text: str
+    data: Any = None
+
+@dataclass
+class QueryContext:
+    """Question plus the pieces of the analysis the handlers work on"""
+    question: str
+    normalized: str
+    analysis: Dict[str, Any]
+    script_title: str
+    scenes: List[Dict[str, Any]] = field(default_factory=list)
+    top_n: int = DEFAULT_TOP_N
+    # Entities named in the question, in the order they appear
+    characters: List[str] = field(default_factory=list)
+    locations: List[str] = field(default_factory=list)
+    filters: List[str] = field(default_factory=list)
+
+def get_scenes(analysis: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Find the scene list in the analysis regardless of which layout it was stored with"""
+    if not analysis or not isinstance(analysis, dict):
+        return []
+    if isinstance(analysis.get("script_data"), dict) and "scenes" in analysis["script_data"]:
+        return analysis["script_data"]["scenes"] or []
+    if "scenes" in analysis:
+        return analysis["scenes"] or []
+    if isinstance(analysis.get("script_breakdown"), dict):
+        return analysis["script_breakdown"].get("scenes", []) or []
+    return []
+
+def _scene_characters(scene: Dict[str, Any]) -> List[str]:
+    return [c for c in scene.get("characters_present", scene.get("characters", [])) or [] if c]
+
+def _scene_number(scene: Dict[str, Any], default: Any = "Unknown") -> Any:
+    return scene.get("scene_number", scene.get("number", default))
+
+def _scene_header(scene: Dict[str, Any]) -> str:
+    return scene.get("scene_header", scene.get("heading", f"Scene {_scene_number(scene)}"))
+
+def _scene_location(scene: Dict[str, Any]) -> str:
+    return scene.get("location", scene.get("scene_location", "")) or ""
+
+def _scene_line(scene: Dict[str, Any]) -> str:
+    return f"• Scene {_scene_number(scene)}: {_scene_header(scene)}"
+
+def _mentions(text: str, name: str) -> bool:
+    return bool(name) and re.search(rf"(?<![a-z0-9]){re.escape(name.lower())}(?![a-z0-9])", text) is not None
+
+def unique_characters(scenes: List[Dict[str, Any]]) -> List[str]:
+    return sorted({c.strip() for scene in scenes for c in _scene_characters(scene)})
+
+def unique_locations(scenes: List[Dict[str, Any]]) -> List[str]:
+    return sorted({_scene_location(s).strip() for s in scenes if _scene_location(s).strip()})
+
+def analyze_scenes_with_same_location_and_characters(scenes_data: list, script_title: str) -> str:
+    """Analyze scenes that have the same location with the exact same characters"""
+    if not scenes_data:
+        return f"No scene data available for '{script_title}'"
+
+    # Group scenes by location and characters
+    location_character_groups = {}
+
+    for scene in scenes_data:
+        # Get scene info
+        scene_num = scene.get("scene_number", scene.get("number", "Unknown"))
+        location = scene.get("location", scene.get("scene_location", "Unknown Location"))
+        characters = scene.get("characters_present", scene.get("characters", []))
+        scene_header = scene.get("scene_header", scene.get("heading", f"Scene {scene_num}"))
+
+        # Normalize location and characters for comparison
+        location_normalized = location.strip().upper() if location else "UNKNOWN"
+        characters_set = frozenset(char.strip().upper() for char in characters if char) if characters else frozenset()
+
+        # Create a key combining location and characters
+        key = (location_normalized, characters_set)
+
+        if key not in location_character_groups:
+            location_character_groups[key] = []
+
+        location_character_groups[key].append({
+            "scene_number": scene_num,
+            "scene_header": scene_header,
+            "location": location,
+            "characters": characters
+        })
+
+    # Find groups with multiple scenes
+    matching_groups = []
+    for (location, characters_set), scenes in location_character_groups.items():
+        if len(scenes) > 1 and location != "UNKNOWN" and len(characters_set) > 0:
+            matching_groups.append({
+                "location": location,
+                "characters": sorted(list(characters_set)),
+                "scenes": scenes,
+                "scene_count": len(scenes)
+            })
+
+    # Generate response
+    if not matching_groups:
+        return f"In '{script_title}', no scenes share the exact same location with the exact same characters. Each scene appears to have a unique combination of location and cast."
+
+    response = f"In '{script_title}', I found {len(matching_groups)} location(s) where multiple scenes involve the same characters:\n\n"
+
+    total_matching_scenes = 0
+    for group in matching_groups:
+        total_matching_scenes += group["scene_count"]
+        location_name = group["location"].title() if group["location"] != "UNKNOWN" else "Unknown Location"
+
+        response += f"📍 **{location_name}**\n"
+        response += f"   Characters: {', '.join(group['characters'])}\n"
+        response += f"   Scenes ({group['scene_count']}):\n"
+
+        for scene in group["scenes"]:
+            response += f"   • Scene {scene['scene_number']}: {scene['scene_header']}\n"
+        response += "\n"
+
+    response += f"**Summary**: {total_matching_scenes} scenes total involve the same location with the exact same characters across {len(matching_groups)} different location(s)."
+
+    return response
+
+# Structured lookups shared with the chatbot agent tools
+
+def scene_costs_by_number(analysis: Dict[str, Any]) -> Dict[Any, Any]:
+    return {
+        c.get("scene_number"): c.get("total_scene_cost")
+        for c in (analysis.get("cost_breakdown") or {}).get("scene_costs", []) or []
+    }
+
+def scene_record(scene: Dict[str, Any], cost: Optional[float] = None) -> Dict[str, Any]:
+    """Compact, uniformly keyed view of one scene"""
+    return {
+        "scene_number": _scene_number(scene),
+        "scene_header": _scene_header(scene),
+        "location": _scene_location(scene),
+        "scene_type": scene.get("scene_type"),
+        "time_of_day": scene.get("time_of_day"),
+        "characters": _scene_characters(scene),
+        "props": scene.get("props_mentioned", []) or [],
+        "special_requirements": scene.get("special_requirements", []) or [],
+        "estimated_cost": cost
+    }
+
+def select_scenes(
+    scenes: List[Dict[str, Any]],
+    filters: Optional[List[str]] = None,
+    character: Optional[str] = None,
+    location: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Scenes matching every SCENE_FILTERS name, a character (exact, case-insensitive) and a location (substring)"""
+    filters = [FILTER_ALIASES.get(f.lower(), f.lower()) for f in filters or []]
+    unknown = [f for f in filters if f not in SCENE_FILTERS]
+    if unknown:
+        raise ValueError(f"Unknown scene filter(s): {', '.join(unknown)}. Use: {', '.join(SCENE_FILTERS)}")
+
+    selected = []
+    for scene in scenes:
+        if not all(SCENE_FILTERS[name](scene) for name in filters):
+            continue
+        if character and character.strip().upper() not in {c.strip().upper() for c in _scene_characters(scene)}:
+            continue
+        if location and location.strip().upper() not in _scene_location(scene).upper():
+            continue
+        selected.append(scene)
+    return selected
+
+# Query handlers: each returns a QueryAnswer, or None to let the next intent try
+
+def same_location_and_characters(ctx: QueryContext) -> Optional[QueryAnswer]:
+    text = analyze_scenes_with_same_location_and_characters(ctx.scenes, ctx.script_title)
+    return QueryAnswer("same_location_and_characters", text)
+
+def scene_details(ctx: QueryContext) -> Optional[QueryAnswer]:
+    numbers = [int(n) for n in re.findall(r"\bscenes? (?:number |no )?(\d{1,4})\b", ctx.normalized)]
+    scenes = [s for s in ctx.scenes if str(_scene_number(s)) in {str(n) for n in numbers}]
+    if not scenes:
+        return None
+
+    costs = {
+        c.get("scene_number"): c.get("total_scene_cost")
+        for c in (ctx.analysis.get("cost_breakdown") or {}).get("scene_costs", []) or []
+    }
+    sections = []
+    for scene in scenes:
+        number = _scene_number(scene)
+        lines = [
+            f"**Scene {number}: {_scene_header(scene)}**",
+            f"• Location: {_scene_location(scene) or 'Unknown'} ({scene.get('scene_type', '')}, {scene.get('time_of_day', '')})",
+            f"• Characters ({len(_scene_characters(scene))}): {', '.join(_scene_characters(scene)) or 'None'}",
+            f"• Props: {', '.join(scene.get('props_mentioned', []) or []) or 'None'}",
+            f"• Special requirements: {', '.join(scene.get('special_requirements', []) or []) or 'None'}",
+        ]
+        if costs.get(number) is not None:
+            lines.append(f"• Estimated cost: ${costs[number]:,.2f}")
+        sections.append("\n".join(lines))
+
+    return QueryAnswer("scene_details", "\n\n".join(sections), [_scene_number(s) for s in scenes])
+
+def character_scenes(ctx: QueryContext) -> Optional[QueryAnswer]:
+    names = ctx.characters
+    if not names:
+        return None
+
+    sections, data = [], {}
+    for name in names:
+        scenes = [s for s in ctx.scenes if name.upper() in {c.strip().upper() for c in _scene_characters(s)}]
+        data[name] = [_scene_number(s) for s in scenes]
+        sections.append(f"**{name}** appears in {len(scenes)} scene(s):\n" + "\n".join(_scene_line(s) for s in scenes))
+
+    return QueryAnswer("character_scenes", f"In '{ctx.script_title}':\n\n" + "\n\n".join(sections), data)
+
+def location_scenes(ctx: QueryContext) -> Optional[QueryAnswer]:
+    locations = ctx.locations
+    if not locations:
+        return None
+
+    sections, data = [], {}
+    for location in locations:
+        scenes = [s for s in ctx.scenes if _scene_location(s).strip().upper() == location.upper()]
+        data[location] = [_scene_number(s) for s in scenes]
+        sections.append(f"📍 **{location}** ({len(scenes)} scene(s)):\n" + "\n".join(_scene_line(s) for s in scenes))
+
+    return QueryAnswer("location_scenes", f"In '{ctx.script_title}':\n\n" + "\n\n".join(sections), data)
+
+def top_expensive_scenes(ctx: QueryContext) -> Optional[QueryAnswer]:
+    scene_costs = (ctx.analysis.get("cost_breakdown") or {}).get("scene_costs", []) or []
+    if not scene_costs:
+        return None
+
+    headers = {_scene_number(s): _scene_header(s) for s in ctx.scenes}
+    ranked = sorted(scene_costs, key=lambda c: c.get("total_scene_cost", 0) or 0, reverse=True)[:ctx.top_n]
+    lines = [
+        f"{i}. Scene {c.get('scene_number')}: {headers.get(c.get('scene_number'), '')} (${c.get('total_scene_cost', 0):,.2f})"
+        for i, c in enumerate(ranked, 1)
+    ]
+    return QueryAnswer(
+        "top_expensive_scenes",
+        f"The {len(ranked)} most expensive scenes in '{ctx.script_title}':\n" + "\n".join(lines),
+        [c.get("scene_number") for c in ranked]
+    )
+
+def top_characters(ctx: QueryContext) -> Optional[QueryAnswer]:
+    counts = Counter(c.strip() for s in ctx.scenes for c in set(_scene_characters(s)))
+    if not counts:
+        return None
+
+    ranked = counts.most_common(ctx.top_n)
+    lines = [f"{i}. {name}: {count} scene(s)" for i, (name, count) in enumerate(ranked, 1)]
+    return QueryAnswer(
+        "top_characters",
+        f"Characters with the most scenes in '{ctx.script_title}':\n" + "\n".join(lines),
+        dict(ranked)
+    )
+
+def top_locations(ctx: QueryContext) -> Optional[QueryAnswer]:
+    counts = Counter(_scene_location(s).strip() for s in ctx.scenes if _scene_location(s).strip())
+    if not counts:
+        return None
+
+    ranked = counts.most_common(ctx.top_n)
+    lines = [f"{i}. {location}: {count} scene(s)" for i, (location, count) in enumerate(ranked, 1)]
+    return QueryAnswer(
+        "top_locations",
+        f"Most used locations in '{ctx.script_title}':\n" + "\n".join(lines),
+        dict(ranked)
+    )
+
+def group_by_location(ctx: QueryContext) -> Optional[QueryAnswer]:
+    groups = defaultdict(list)
+    for scene in ctx.scenes:
+        groups[_scene_location(scene).strip() or "Unknown Location"].append(scene)
+    if not groups:
+        return None
+
+    sections = [
+        f"📍 **{location}** ({len(scenes)} scene(s)): " + ", ".join(str(_scene_number(s)) for s in scenes)
+        for location, scenes in sorted(groups.items(), key=lambda item: -len(item[1]))
+    ]
+    return QueryAnswer(
+        "group_by_location",
+        f"Scenes grouped by location in '{ctx.script_title}':\n\n" + "\n".join(sections),
+        {location: [_scene_number(s) for s in scenes] for location, scenes in groups.items()}
+    )
+
+SCENE_FILTERS = {
+    "night": lambda s: "NIGHT" in str(s.get("time_of_day", "")).upper(),
+    "day": lambda s: "DAY" in str(s.get("time_of_day", "")).upper(),
+    "dawn": lambda s: "DAWN" in str(s.get("time_of_day", "")).upper(),
+    "dusk": lambda s: "DUSK" in str(s.get("time_of_day", "")).upper(),
+    "exterior": lambda s: "EXT" in str(s.get("scene_type", "")).upper(),
+    "interior": lambda s: "INT" in str(s.get("scene_type", "")).upper(),
+    "special requirements": lambda s: bool(s.get("special_requirements")),
+}
+
+FILTER_ALIASES = {
+    "night": "night", "day": "day", "daytime": "day", "dawn": "dawn", "dusk": "dusk",
+    "exterior": "exterior", "ext": "exterior", "outdoor": "exterior", "outside": "exterior",
+    "interior": "interior", "int": "interior", "indoor": "interior", "inside": "interior",
+    "stunt": "special requirements", "stunts": "special requirements", "sfx": "special requirements",
+    "special effects": "special requirements", "special requirements": "special requirements",
+}
+
+def filtered_scenes(ctx: QueryContext) -> Optional[QueryAnswer]:
+    active = sorted(set(ctx.filters))
+    if not active:
+        return None
+
+    scenes = [s for s in ctx.scenes if all(SCENE_FILTERS[name](s) for name in active)]
+    label = " ".join(active)
+    text = f"'{ctx.script_title}' has {len(scenes)} {label} scene(s)"
+    text += ":\n" + "\n".join(_scene_line(s) for s in scenes) if scenes else "."
+    return QueryAnswer("filtered_scenes", text, [_scene_number(s) for s in scenes])
+
+def budget_totals(ctx: QueryContext) -> Optional[QueryAnswer]:
+    cost = ctx.analysis.get("cost_breakdown") or {}
+    if not cost:
+        return None
+
+    categories = [
+        ("Cast", "total_cast_costs"), ("Locations", "total_location_costs"), ("Props", "total_props_costs"),
+        ("Wardrobe", "total_wardrobe_costs"), ("Crew", "total_crew_costs"), ("Equipment", "total_equipment_costs"),
+    ]
+    lines = [f"• {label}: ${cost.get(key, 0) or 0:,.2f}" for label, key in categories]
+    text = (
+        f"The estimated total budget for '{ctx.script_title}' is ${cost.get('total_costs', 0) or 0:,.2f} "
+        f"({cost.get('budget_category', 'Unknown')} budget category).\n\nBreakdown:\n" + "\n".join(lines)
+    )
+    return QueryAnswer("budget_totals", text, {key: cost.get(key) for _, key in categories + [("Total", "total_costs")]})
+
+def count_characters(ctx: QueryContext) -> Optional[QueryAnswer]:
+    names = unique_characters(ctx.scenes)
+    if not names:
+        return None
+    return QueryAnswer(
+        "count_characters",
+        f"Based on the script analysis for '{ctx.script_title}', there are {len(names)} characters in this script: {', '.join(names)}.",
+        names
+    )
+
+def count_scenes(ctx: QueryContext) -> Optional[QueryAnswer]:
+    return QueryAnswer("count_scenes", f"'{ctx.script_title}' has {len(ctx.scenes)} scenes.", len(ctx.scenes))
+
+def count_locations(ctx: QueryContext) -> Optional[QueryAnswer]:
+    locations = unique_locations(ctx.scenes)
+    if not locations:
+        return None
+    return QueryAnswer(
+        "count_locations",
+        f"'{ctx.script_title}' uses {len(locations)} locations: {', '.join(locations)}.",
+        locations
+    )
+
+# Whole-question patterns. Questions are matched after the entities they name are
+# replaced by slots (<char>, <loc>, <filter>), so a pattern only matches when its
+# handler consumes every qualifier in the question; anything else goes to the LLM.
+_N = r"(?:(?:the )?(?:top |first )?\d{1,3} )?"
+# One character only: "scenes John and Mary are in" asks for scenes they share
+_CHARS = r"<char>"
+_LOCS = r"<loc>(?:(?:,| and|,? and) <loc>)*"
+_FILTERS = r"<filter>(?:(?:,| and|,? and)? <filter>)*"
+_SCRIPT = r"(?:the |this |my )?(?:script|film|movie|screenplay|story|project)"
+
+# Intent table, tried in order: (intent name, whole-question patterns, handler)
+INTENTS: List[tuple] = [
+    ("same_location_and_characters", [
+        r"(?:(?:which|what|find|list|show|are there(?: any)?) )?(?:the )?scenes? (?:that |which )?"
+        r"(?:have|share|with|take place (?:in|at)|are (?:in|at)|happen (?:in|at)) (?:the )?same location "
+        r"(?:with|and) (?:the )?same (?:characters?|cast)",
+    ], same_location_and_characters),
+    ("top_expensive_scenes", [
+        rf"(?:(?:what|which) (?:are|is) |list |show )?{_N}(?:the )?(?:most expensive|costliest|priciest|highest cost) scenes?",
+        r"(?:what|which) scenes? (?:is|are|costs?) (?:the )?most(?: expensive)?",
+    ], top_expensive_scenes),
+    ("top_characters", [
+        r"(?:which|what) (?:characters?|cast members?) (?:appears?|is|are) (?:in )?(?:the )?most(?: scenes)?",
+        r"who (?:appears?|is) (?:in )?(?:the )?most(?: scenes)?",
+        r"(?:who|which characters?) (?:has|have) (?:the )?most (?:scenes|screen time)",
+        rf"{_N}(?:the )?(?:characters?|cast members?) (?:with|by) (?:the )?most scenes",
+        rf"{_N}(?:the )?(?:most frequent|biggest|main) (?:characters?|roles?)",
+    ], top_characters),
+    ("top_locations", [
+        r"(?:which|what) locations? (?:is|are) (?:used )?(?:the )?most(?: used| common| frequent| often)?",
+        r"(?:which|what) locations? (?:has|have) (?:the )?most scenes",
+        rf"(?:(?:what|which) (?:are|is) )?{_N}(?:the )?(?:most (?:used|common|frequent)|busiest) locations?",
+    ], top_locations),
+    ("scene_details", [
+        r"(?:(?:what happens|what is|what's|who is|who's|who appears) in |(?:details|breakdown) (?:of|for) |(?:tell me )?about |show )?"
+        r"(?:the )?scenes? (?:number |no )?\d{1,4}(?:(?:,| and|,? and) (?:scene )?\d{1,4})*(?: details)?",
+    ], scene_details),
+    ("character_scenes", [
+        rf"(?:(?:in )?(?:which|what)|list(?: all)?(?: the)?|show(?: all)?(?: the)?) scenes? (?:is|are|does|do) {_CHARS} (?:in|appear in|show up in)",
+        rf"(?:in )?(?:which|what) scenes? (?:does|do) {_CHARS} appears?",
+        rf"(?:(?:which|what|list|show) )?(?:all )?(?:the )?scenes? (?:with|featuring|including|that (?:have|feature|include)) {_CHARS}",
+        rf"where (?:is|does|do|are) {_CHARS}(?: appear| show up)?",
+        rf"how many scenes (?:is|are|does|do) {_CHARS} (?:in|appear in)",
+        rf"{_CHARS}(?:'s|') scenes",
+    ], character_scenes),
+    ("location_scenes", [
+        rf"(?:(?:which|what|list|show|how many) )?(?:all )?(?:the )?scenes? (?:are |take place |happen |is |are set |is set )?(?:in|at) (?:the )?{_LOCS}",
+        rf"{_LOCS} scenes",
+    ], location_scenes),
+    ("group_by_location", [
+        r"(?:(?:group|list|show)(?: the)? )?(?:the )?scenes (?:grouped )?(?:by|per) location",
+        r"(?:group(?: the)? )?scenes? by location",
+        r"(?:the )?shooting groups?",
+    ], group_by_location),
+    ("filtered_scenes", [
+        rf"(?:which|what|list|show|how many)(?: of)?(?: all)?(?: the)? {_FILTERS} scenes?(?: are there| do we have)?",
+        rf"(?:(?:which|what|list|show) )?(?:all )?(?:the )?scenes? (?:with|that (?:have|need|require)|requiring|needing) {_FILTERS}",
+        rf"(?:which|what|how many) scenes? (?:are|take place|happen)(?: at| during| in the)? {_FILTERS}",
+    ], filtered_scenes),
+    ("budget_totals", [
+        r"(?:(?:what is|what's|show|give me) )?(?:the )?(?:total |overall |estimated |full )*(?:budget|cost)(?: breakdown| estimate)?",
+        r"(?:(?:what is|what's|show|give me) )?(?:the )?(?:budget|cost) breakdown",
+        rf"how much (?:does|will|would) (?:it|this|the production|{_SCRIPT}) cost(?: in total| overall| to make| to produce)?",
+        r"what (?:is|'s) (?:the )?(?:total |overall )?cost",
+    ], budget_totals),
+    ("count_characters", [
+        r"(?:how many|(?:what is |what's )?the (?:total )?number of|count(?: the)?|list(?: all)?(?: the)?|"
+        r"who are(?: all)?(?: the)?|what are(?: all)?(?: the)?) (?:characters|cast(?: members)?)(?: are there| does it have)?",
+        r"who(?: is|'s) in the cast",
+    ], count_characters),
+    ("count_scenes", [
+        r"(?:how many|(?:what is |what's )?the (?:total )?number of|total number of|count(?: the)?) (?:total )?scenes"
+        r"(?: are there| does it have| in total| total)?",
+    ], count_scenes),
+    ("count_locations", [
+        r"(?:how many|(?:what is |what's )?the (?:total )?number of|count(?: the)?|list(?: all)?(?: the)?|what are(?: all)?(?: the)?) "
+        r"(?:different |unique )?locations(?: are there| are used| does it have)?",
+        r"(?:which|what) locations are used",
+    ], count_locations),
+]
+
+_COMPILED_INTENTS = [
+    (intent, [re.compile(pattern) for pattern in patterns], handler)
+    for intent, patterns, handler in INTENTS
+]
+
+# Negated questions ("scenes John is NOT in") invert what every handler answers
+_NEGATION = re.compile(r"\b(?:not|never|without|except|excluding|none|nobody|no one|neither|nor)\b|n't\b")
+
+_COURTESY_PREFIX = re.compile(r"^(?:(?:please|can you|could you|would you|tell me|show me|give me|let me know|do you know|i want to know) )+")
+_SCRIPT_SUFFIX = re.compile(rf"(?: (?:in|of|for|does) {_SCRIPT}(?: have)?)?(?: please)?$")
+
+def _slot_entities(normalized: str, scenes: List[Dict[str, Any]]) -> tuple:
+    """
+    Replace the locations, characters and scene filters named in a question by slots.
+
+    Longer names go first, so a location containing a character name or a filter word
+    ("night club") is one location. Returns (slotted question, {slot: names in order}).
+    """
+    found: Dict[str, List[tuple]] = {"<loc>": [], "<char>": [], "<filter>": []}
+    candidates = (
+        [("<loc>", normalize_question(loc), loc) for loc in unique_locations(scenes)]
+        + [("<char>", normalize_question(name), name) for name in unique_characters(scenes)]
+        + [("<filter>", alias, FILTER_ALIASES[alias]) for alias in FILTER_ALIASES]
+    )
+    slotted = normalized
+    for slot, needle, value in sorted(candidates, key=lambda c: -len(c[1])):
+        if not needle:
+            continue
+        pattern = re.compile(rf"(?<![a-z0-9<]){re.escape(needle)}(?![a-z0-9>])")
+        slotted, count = pattern.subn(slot, slotted)
+        if count:
+            found[slot].append((normalized.find(needle), value))
+
+    names = {
+        slot: list(dict.fromkeys(value for _, value in sorted(matches)))
+        for slot, matches in found.items()
+    }
+    return slotted, names
+
+def route_question(normalized: str, scenes: List[Dict[str, Any]]) -> tuple:
+    """
+    Match a normalized question against the intent patterns.
+
+    Returns:
+        (intents whose pattern matches the whole question, slotted names); no intents
+        means the question is not one a local handler answers exactly.
+    """
+    if _NEGATION.search(normalized):
+        return [], {}
+
+    slotted, names = _slot_entities(normalized, scenes)
+    slotted = _SCRIPT_SUFFIX.sub("", _COURTESY_PREFIX.sub("", slotted)).strip()
+    matched = [
+        (intent, handler) for intent, patterns, handler in _COMPILED_INTENTS
+        if any(pattern.fullmatch(slotted) for pattern in patterns)
+    ]
+    return matched, names
+
+def _parse_top_n(question: str) -> int:
+    match = re.search(r"\b(?:top|first|best|worst)\s+(\d{1,3})\b|\b(\d{1,3})\s+(?:most|scenes|characters|locations)\b", question)
+    if match:
+        return max(1, min(int(match.group(1) or match.group(2)), 100))
+    return DEFAULT_TOP_N
+
+def normalize_question(question: str) -> str:
+    return re.sub(r"\s+", " ", re.sub(r"[^a-z0-9$'\s]", " ", str(question or "").lower())).strip()
+
+def is_open_ended(normalized: str) -> bool:
+    return any(re.search(rf"\b{re.escape(marker)}", normalized) for marker in OPEN_ENDED_MARKERS)
+
+def answer_question(question: str, analysis: Dict[str, Any], script_title: str) -> Optional[QueryAnswer]:
+    """
+    Route a chat question to a local query handler over the stored analysis.
+
+    Returns:
+        QueryAnswer when a handler recognised the question, None when it should go to the LLM.
+    """
+    normalized = normalize_question(question)
+    scenes = get_scenes(analysis)
+    if not normalized or not scenes or is_open_ended(normalized):
+        return None
+
+    matched, names = route_question(normalized, scenes)
+    if not matched:
+        return None
+
+    ctx = QueryContext(
+        question=question,
+        normalized=normalized,
+        analysis=analysis,
+        script_title=script_title,
+        scenes=scenes,
+        top_n=_parse_top_n(normalized),
+        characters=names["<char>"],
+        locations=names["<loc>"],
+        filters=names["<filter>"]
+    )
+
+    for intent, handler in matched:
+        try:
+            answer = handler(ctx)
+        except Exception as e:
+            logger.warning(f"Local query handler '{intent}' failed: {e}")
+            continue
+        if answer is not None:
+            logger.info(f"Answered locally with intent '{intent}'")
+            return answer
+
+    return None
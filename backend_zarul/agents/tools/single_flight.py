@@ -0,0 +1,74 @@
+from typing import Any, Awaitable, Callable, Dict, Tuple
+import asyncio
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls with the same key into one running task.
+
+    The first caller for a key starts the work; callers arriving while it runs await
+    the same task and receive the same result or exception. The task is shielded, so
+    a waiter that gives up does not cancel it for the others. It is cancelled only
+    when every waiter has given up. Event-loop only; keys are not remembered after
+    the task finishes (this is not a cache).
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: Dict[str, Tuple[asyncio.Task, list]] = {}
+        self._lock = threading.Lock()
+        self.started = 0
+        self.coalesced = 0
+        self.cancelled = 0
+
+    async def do(self, key: str, start: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Run start() for key, or join the run already in flight.
+
+        Returns:
+            (result, shared) where shared is True if this caller joined an existing run.
+        """
+        flight = self._flights.get(key)
+        shared = flight is not None
+        if shared:
+            task, waiters = flight
+            waiters[0] += 1
+            with self._lock:
+                self.coalesced += 1
+            logger.info(f"🔗 {self.name}: joined in-flight run {key[:16]} ({waiters[0]} waiting)")
+        else:
+            task, waiters = asyncio.create_task(start()), [1]
+            self._flights[key] = (task, waiters)
+            task.add_done_callback(lambda done: self._forget(key, done))
+            with self._lock:
+                self.started += 1
+
+        try:
+            return await asyncio.shield(task), shared
+        except asyncio.CancelledError:
+            if not task.done():
+                waiters[0] -= 1
+                if waiters[0] == 0:
+                    task.cancel()
+                    with self._lock:
+                        self.cancelled += 1
+            raise
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        flight = self._flights.get(key)
+        if flight is not None and flight[0] is task:
+            del self._flights[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            requests = self.started + self.coalesced
+            return {
+                "runs_started": self.started,
+                "requests_coalesced": self.coalesced,
+                "runs_cancelled": self.cancelled,
+                "in_flight": len(self._flights),
+                "coalesce_rate": round(self.coalesced / requests, 4) if requests else 0.0
+            }
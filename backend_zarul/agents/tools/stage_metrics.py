@@ -0,0 +1,166 @@
+import numpy as np
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, List, Optional
+import os
+import random
+import threading
+import time
+import tracemalloc
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Fraction of analyses traced with tracemalloc; tracing slows allocation-heavy code down
+MEMORY_SAMPLE_RATE = float(os.getenv("STAGE_MEMORY_SAMPLE_RATE", "0.1"))
+
+PERCENTILES = (50, 95, 99)
+STAGE_FIELDS = ("wall_ms", "cpu_ms", "peak_memory_kb")
+
+_current_recorder: ContextVar[Optional["StageRecorder"]] = ContextVar("stage_recorder", default=None)
+
+# tracemalloc is process-wide: started by the first sampled run, stopped by the last
+_tracing_lock = threading.Lock()
+_tracing_runs = 0
+_tracing_started_here = False
+
+def _start_tracing() -> None:
+    global _tracing_runs, _tracing_started_here
+    with _tracing_lock:
+        _tracing_runs += 1
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracing_started_here = True
+
+def _stop_tracing() -> None:
+    global _tracing_runs, _tracing_started_here
+    with _tracing_lock:
+        _tracing_runs -= 1
+        if _tracing_runs == 0 and _tracing_started_here:
+            tracemalloc.stop()
+            _tracing_started_here = False
+
+class StageRecorder:
+    """
+    Stage timings of one analysis run.
+
+    Each stage records wall time, process CPU time and, for memory-sampled runs, the
+    peak traced allocation above the stage's starting point. Stages may nest (a graph
+    node contains the model call, which contains PDF extraction); each is reported on
+    its own. CPU time and memory are process-wide, so concurrent runs blur them.
+    on_stage, if given, is called with each stage name as the stage starts.
+    """
+
+    def __init__(
+        self,
+        sample_memory: bool = False,
+        stages: Optional[List[Dict[str, Any]]] = None,
+        on_stage: Optional[Callable[[str], None]] = None
+    ):
+        self.sample_memory = sample_memory
+        self.stages: List[Dict[str, Any]] = stages if stages is not None else []
+        self.on_stage = on_stage
+        self._open: List[Dict[str, Any]] = []  # Running peak of every unfinished stage
+
+    def _fold_peak(self) -> None:
+        """Credit the traced peak so far to every open stage before it is reset"""
+        if not self._open or not tracemalloc.is_tracing():
+            return
+        peak = tracemalloc.get_traced_memory()[1]
+        for frame in self._open:
+            frame["peak"] = max(frame["peak"], peak)
+
+    @contextmanager
+    def stage(self, name: str):
+        if self.on_stage is not None:
+            self.on_stage(name)
+        memory = self.sample_memory and tracemalloc.is_tracing()
+        frame = {"peak": 0, "start_memory": 0}
+        if memory:
+            self._fold_peak()
+            frame["start_memory"] = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            self._open.append(frame)
+
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            record = {
+                "stage": name,
+                "wall_ms": round((time.perf_counter() - wall_start) * 1000, 2),
+                "cpu_ms": round((time.process_time() - cpu_start) * 1000, 2),
+            }
+            if memory:
+                self._fold_peak()
+                self._open.remove(frame)
+                record["peak_memory_kb"] = round(max(frame["peak"] - frame["start_memory"], 0) / 1024, 1)
+            self.stages.append(record)
+
+@contextmanager
+def track_run(recorder: Optional[StageRecorder] = None, on_stage: Optional[Callable[[str], None]] = None):
+    """
+    Make a recorder current for this task and everything it awaits or spawns.
+
+    A new recorder is memory-sampled at MEMORY_SAMPLE_RATE. Yields the recorder.
+    """
+    if recorder is None:
+        recorder = StageRecorder(sample_memory=random.random() < MEMORY_SAMPLE_RATE, on_stage=on_stage)
+    if recorder.sample_memory:
+        _start_tracing()
+    token = _current_recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _current_recorder.reset(token)
+        if recorder.sample_memory:
+            _stop_tracing()
+
+def current_recorder() -> Optional[StageRecorder]:
+    return _current_recorder.get()
+
+@contextmanager
+def track_stage(name: str):
+    """Time a stage of the current run; a no-op outside track_run"""
+    recorder = _current_recorder.get()
+    if recorder is None:
+        yield
+        return
+    with recorder.stage(name):
+        yield
+
+def instrument_node(name: str, node: Callable) -> Callable:
+    """Wrap an async graph node so each execution is recorded as stage node:<name>"""
+
+    @wraps(node)
+    async def instrumented(state):
+        with track_stage(f"node:{name}"):
+            return await node(state)
+
+    return instrumented
+
+def summarize_stages(runs: Iterable[Optional[List[Dict[str, Any]]]]) -> Dict[str, Dict[str, Any]]:
+    """
+    p50/p95/p99 per stage and measure over many runs' stage lists.
+
+    Returns:
+        {stage: {"count": n, "wall_ms": {"p50": .., "p95": .., "p99": ..}, ...}}
+    """
+    samples: Dict[str, Dict[str, List[float]]] = {}
+    for stages in runs:
+        for record in stages or []:
+            measures = samples.setdefault(record.get("stage", "unknown"), {field: [] for field in STAGE_FIELDS})
+            for field in STAGE_FIELDS:
+                if record.get(field) is not None:
+                    measures[field].append(float(record[field]))
+
+    summary = {}
+    for stage, measures in sorted(samples.items()):
+        summary[stage] = {"count": len(measures["wall_ms"])}
+        for field, values in measures.items():
+            if values:
+                points = np.percentile(np.asarray(values), PERCENTILES)
+                summary[stage][field] = {f"p{p}": round(float(v), 2) for p, v in zip(PERCENTILES, points)}
+    return summary
@@ -1,12 +1,18 @@
 from pydantic_ai.models.gemini import GeminiModel
 from pydantic_ai.providers.google_gla import GoogleGLAProvider
 from dotenv import load_dotenv
+import asyncio
 import os
 import logging
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+# Process-wide cap on concurrent analysis model calls, shared by every entry point
+# (single uploads, jobs, batches) so bursts queue here instead of hitting provider rate limits
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+llm_semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
 def get_model():
     """Get configured Gemini model with proper error handling"""
     try:
@@ -1,23 +1,47 @@
-from fastapi import FastAPI, HTTPException, UploadFile, Depends, File, Query, Body
+from fastapi import FastAPI, HTTPException, UploadFile, Depends, File, Query, Body, Request, BackgroundTasks
 from fastapi.responses import JSONResponse
+from sse_starlette.sse import EventSourceResponse
 from pydantic import BaseModel
 from sqlalchemy import desc
 from sqlalchemy.orm import Session
 from typing import List, Optional, Dict, Any
 from dotenv import load_dotenv
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import os
+import hashlib
 import tempfile
 import time
+import uuid
 import asyncio
 import logging
 import json
+import numpy as np
 from agents.agent.chatbot_agent import chatbot_agent
 
-from database.database import get_db, create_tables
-from database.services import AnalyzedScriptService
-from database.models import AnalyzedScript
-from main import run_optimized_script_analysis
+from database.database import get_db, create_tables, SessionLocal
+from database.services import AnalyzedScriptService, ChatSessionService, PortfolioService, AnalysisJobService, SAVING_STATUS
+from database.models import AnalyzedScript, ChatSession
+from main import run_deduplicated_analysis, resume_with_feedback, analysis_flights
+from graph.workflow import warm_workflows, open_checkpointer, close_checkpointer
+from agents.tools.cost_engine import apply_what_if, compute_scene_matrix, scene_factor_cache
+from agents.tools.cost_simulation import simulate_budget, MAX_ITERATIONS
+from agents.tools.rate_index import get_rate_index
+from agents.tools.script_queries import answer_question
+from agents.tools.rate_card import load_rate_card
+from agents.tools.chat_history import render_history
+from agents.tools.scene_retrieval import scene_index_cache
+from agents.tools.answer_cache import chat_answer_cache
+from agents.tools.stage_metrics import StageRecorder, track_run, summarize_stages
+from .jobs import JobManager, AnalysisJob, QueueFullError, FINISHED_STATUSES
+from .analysis import render_analysis, build_analysis_response, stored_analysis_response, analyze_pdf, parse_fields
+from agents.tools.artifact_store import artifact_store
+from agents.states.states import ComprehensiveAnalysis
+from agents.tools.fingerprints import is_sha256
+from .batch import run_batch, stage_uploads, discard_staged
+from starlette.background import BackgroundTask
+from agents.tools.portfolio_queries import (
+    parse_portfolio_question, format_entity_matches, format_budget_aggregate, format_top_budgets, render_overview
+)
 from .serializers import ResultSerializer
 from .validators import (
     FileValidator, 
@@ -27,6 +51,7 @@ from .validators import (
     AnalysisValidator,
     SaveAnalysisRequest,
     SaveAnalysisResponse,
+    AnalysisJobResponse,
 )
 from .middleware import setup_middleware
 
@@ -41,6 +66,43 @@ app = FastAPI(
 
 setup_middleware(app)
 
+ARTIFACT_PURGE_INTERVAL_SECONDS = int(os.getenv("ARTIFACT_PURGE_INTERVAL_SECONDS", str(6 * 3600)))
+
+@app.on_event("startup")
+async def warm_workflow_registry():
+    """Compile the analysis workflow before the first request arrives"""
+    timings = warm_workflows()
+    logger.info(f"Workflow registry warmed: {timings}")
+    # Fails startup when durable checkpoints are unavailable, rather than on the first feedback
+    await open_checkpointer()
+
+@app.on_event("startup")
+async def start_analysis_jobs():
+    """Start the in-process analysis worker pool (durable jobs run in worker.py instead)"""
+    if not DURABLE_JOBS:
+        job_manager.start()
+
+async def purge_expired_artifacts() -> None:
+    """Drop workflow artifacts past their retention period, on startup and then periodically"""
+    while True:
+        try:
+            removed = await asyncio.to_thread(artifact_store.purge_expired)
+            if removed:
+                logger.info(f"🧹 Purged {removed} workflow artifacts unused for {artifact_store.retention_days} days")
+        except Exception as e:
+            logger.warning(f"Failed to purge expired workflow artifacts: {str(e)}")
+        await asyncio.sleep(ARTIFACT_PURGE_INTERVAL_SECONDS)
+
+@app.on_event("startup")
+async def start_artifact_purge():
+    app.state.artifact_purge = asyncio.create_task(purge_expired_artifacts())
+
+@app.on_event("shutdown")
+async def stop_analysis_jobs():
+    app.state.artifact_purge.cancel()
+    await job_manager.stop()
+    await close_checkpointer()
+
 # Main route endpoint
 @app.get("/")
 async def root():
@@ -82,34 +144,52 @@ async def health_check(db: Session = Depends(get_db)):
 # Analysis endpoint
 @app.post("/analyze-script", response_model=AnalyzeScriptResponse)
 async def analyze_script(
-    file: UploadFile = File(...)
+    file: UploadFile = File(...),
+    reuse_existing: bool = Query(True, description="Return the saved analysis when this exact PDF was analyzed before"),
+    compact: bool = Query(False, description="Return the analysis once, with a handle for /save-analysis"),
+    fields: Optional[str] = Query(None, description="Comma-separated analysis sections to return; implies compact"),
+    db: Session = Depends(get_db)
 ):
     """
     Analyze a script PDF file with save-compatible output structure
+    
+    An upload whose bytes match a saved analysis returns that analysis without running
+    the workflow (unless reuse_existing is false). metadata.duplicate_of names the saved
+    analysis of the same PDF or the same script text, so clients can skip saving again.
+    
+    The default response repeats the analysis in data, analysis_data and save_request.
+    In compact mode it is sent once (only the requested sections when fields is given)
+    and save_request carries metadata.analysis_handle instead.
     """
     
     # Validate file
     validator = FileValidator()
     validator.validate_file(file)
+    selected_fields = parse_fields(fields)
     
     temp_file_path = None
     file_size = 0
     
     try:
-        # Create temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-            content = await file.read()
-            file_size = validator.validate_file_size(content)
-            temp_file.write(content)
-            temp_file_path = temp_file.name
+        temp_file_path, file_size, content_sha256 = await spool_upload(file, validator)
         
         start_time = time.time()
+        existing = AnalyzedScriptService.find_by_hash(db, content_sha256)
+        if existing and reuse_existing:
+            logger.info(f"♻️ {file.filename} matches saved analysis {existing.id}, skipping the workflow")
+            return JSONResponse(
+                status_code=200,
+                content=stored_analysis_response(
+                    existing, file.filename, file_size, time.time() - start_time, compact, selected_fields
+                )
+            )
+        
         logger.info(f"Starting save-compatible analysis for {file.filename} ({file_size} bytes)")
         
         # Perform analysis with timeout
         try:
             result = await asyncio.wait_for(
-                run_optimized_script_analysis(temp_file_path),
+                run_deduplicated_analysis(temp_file_path, content_sha256=content_sha256),
                 timeout=300.0
             )
         except asyncio.TimeoutError:
@@ -121,77 +201,13 @@ async def analyze_script(
         processing_time = time.time() - start_time
         logger.info(f"Analysis completed in {processing_time:.2f} seconds")
         
-        # ✅ FIXED: Extract comprehensive_analysis correctly
-        comprehensive_analysis = result.get('comprehensive_analysis')
-        
-        if not comprehensive_analysis:
-            raise HTTPException(
-                status_code=500,
-                detail="Analysis completed but no comprehensive analysis data found"
-            )
-        
-        # ✅ FIXED: Convert to dict if it's a Pydantic object
-        if hasattr(comprehensive_analysis, 'model_dump'):
-            analysis_data = comprehensive_analysis.model_dump()
-        elif hasattr(comprehensive_analysis, 'dict'):
-            analysis_data = comprehensive_analysis.dict()
-        else:
-            analysis_data = comprehensive_analysis
-        
-        # Validate analysis result
-        try:
-            from agents.states.states import ComprehensiveAnalysis
-            # Validate by creating a temporary object
-            temp_analysis = ComprehensiveAnalysis(**analysis_data)
-            logger.info("✅ Analysis validation passed")
-        except Exception as validation_error:
-            logger.warning(f"Analysis validation warning: {validation_error}")
-            # Continue despite validation warnings
-        
-        # Enhanced metadata
-        enhanced_metadata = {
-            "filename": file.filename,
-            "original_filename": file.filename,
-            "file_size_bytes": file_size,
-            "processing_time_seconds": round(processing_time, 2),
-            "timestamp": datetime.now().isoformat(),
-            "api_calls_used": result.get('api_calls_used', 2)
-        }
-        
-        # ✅ FIXED: Pre-built save request object with correct structure
-        save_request_data = {
-            "filename": file.filename,
-            "original_filename": file.filename,
-            "file_size_bytes": file_size,
-            "analysis_data": analysis_data,  # ✅ Use the extracted dict
-            "processing_time_seconds": round(processing_time, 2),
-            "api_calls_used": result.get('api_calls_used', 2)
-        }
-        
-        # ✅ ENHANCED: Response with correct structure
-        response_data = {
-            "success": True,
-            "message": "Script analysis completed successfully",
-            
-            # Optimization info
-            "optimization_info": {
-                "actual_calls_used": result.get('api_calls_used', 2),
-                "expected_calls": 2
-            },
-            
-            # Enhanced metadata
-            "metadata": enhanced_metadata,
-            
-            # ✅ FIXED: Both keys point to the same correct data
-            "data": analysis_data,           # Backward compatibility
-            "analysis_data": analysis_data,  # Save endpoint compatibility
-            
-            # ✅ FIXED: Ready-to-use save request object
-            "save_request": save_request_data
-        }
+        response_data = build_analysis_response(result, file.filename, file_size, processing_time, compact, selected_fields)
         
-        logger.info("✅ Analysis completed with save-compatible structure")
-        logger.info(f"Analysis data keys: {list(analysis_data.keys()) if isinstance(analysis_data, dict) else 'Not a dict'}")
+        # A re-exported PDF of an analyzed script differs in bytes but not in text
+        if not existing and result.get("text_sha256"):
+            existing = AnalyzedScriptService.find_by_hash(db, result["text_sha256"])
+        if existing:
+            response_data["metadata"]["duplicate_of"] = existing.id
         
         return JSONResponse(status_code=200, content=response_data)
         
@@ -218,6 +234,316 @@ async def analyze_script(
             except Exception as cleanup_error:
                 logger.warning(f"Failed to cleanup temp file: {cleanup_error}")
 
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+def _copy_upload(source, destination, validator: FileValidator) -> tuple:
+    """Copy an upload in chunks, hashing as it goes and stopping at the size limit. Returns (size, sha256)"""
+    digest = hashlib.sha256()
+    file_size = 0
+    source.seek(0)
+    for chunk in iter(lambda: source.read(UPLOAD_CHUNK_BYTES), b""):
+        file_size += len(chunk)
+        validator.validate_size(file_size, complete=False)
+        digest.update(chunk)
+        destination.write(chunk)
+    validator.validate_size(file_size)
+    return file_size, digest.hexdigest()
+
+async def spool_upload(file: UploadFile, validator: FileValidator) -> tuple:
+    """
+    Stream a validated upload to a temporary PDF; the caller deletes it.
+    
+    Only one chunk is in memory at a time and the SHA-256 is computed during the
+    copy, so the PDF is not read again to fingerprint it.
+    
+    Returns:
+        (path, size, content_sha256)
+    """
+    validator.validate_size(file.size, complete=False)  # Size declared by the multipart parser
+    
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
+        try:
+            file_size, content_sha256 = await asyncio.to_thread(_copy_upload, file.file, temp_file, validator)
+        except Exception:
+            temp_file.close()
+            os.unlink(temp_file.name)
+            raise
+    return temp_file.name, file_size, content_sha256
+
+# Job-based analysis: submit returns immediately and workers run the workflow.
+# "memory" runs jobs on an in-process worker pool; "database" queues them in
+# analysis_jobs for worker.py processes, which may run on other machines.
+ANALYSIS_QUEUE_BACKEND = os.getenv("ANALYSIS_QUEUE_BACKEND", "memory")
+DURABLE_JOBS = ANALYSIS_QUEUE_BACKEND == "database"
+JOB_EVENTS_POLL_SECONDS = 2
+
+async def run_analysis_job(job: AnalysisJob) -> Dict[str, Any]:
+    return await analyze_pdf(
+        job.pdf_path,
+        job.filename,
+        job.file_size_bytes,
+        on_stage=lambda stage: job_manager.set_stage(job, stage),
+        content_sha256=job.content_sha256
+    )
+
+job_manager = JobManager(run_analysis_job)
+
+def job_snapshot(db: Session, job_id: str) -> tuple:
+    """
+    Current view of a job from the configured backend.
+    
+    Returns:
+        (status dict, analysis_response() parts or None, HTTP status code of a failure)
+    """
+    if DURABLE_JOBS:
+        record = AnalysisJobService.get(db, job_id, with_result=True)
+        if not record:
+            raise HTTPException(status_code=404, detail="Analysis job not found")
+        status = {"success": True, **record.to_dict(AnalysisJobService.queue_position(db, record))}
+        return status, record.result, record.error_status_code or 500
+    
+    job = job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Analysis job not found")
+    return {"success": True, **job.to_dict(job_manager.queue_position(job))}, job.result, job.error_status_code
+
+def poll_durable_job(job_id: str) -> tuple:
+    db = SessionLocal()
+    try:
+        return job_snapshot(db, job_id)
+    finally:
+        db.close()
+
+@app.post("/analysis-jobs", response_model=AnalysisJobResponse, status_code=202)
+async def submit_analysis_job(
+    file: UploadFile = File(...),
+    priority: int = Query(0, ge=-10, le=10, description="Higher priorities run first"),
+    db: Session = Depends(get_db)
+):
+    """
+    Queue a script PDF for analysis and return its job ID immediately.
+    
+    Poll /analysis-jobs/{job_id} (or stream /analysis-jobs/{job_id}/events) and fetch
+    /analysis-jobs/{job_id}/result once completed; the result has the same shape as
+    /analyze-script. Returns 503 when the in-process queue is full.
+    """
+    
+    validator = FileValidator()
+    validator.validate_file(file)
+    
+    try:
+        temp_file_path, file_size, content_sha256 = await spool_upload(file, validator)
+        if DURABLE_JOBS:
+            # The queue row holds the PDF itself, so it is read back once the upload passed validation
+            try:
+                with open(temp_file_path, "rb") as pdf_file:
+                    content = await asyncio.to_thread(pdf_file.read)
+            finally:
+                os.unlink(temp_file_path)
+            record = AnalysisJobService.enqueue(db, file.filename, file_size, content, priority=priority, content_sha256=content_sha256)
+            status = {"success": True, **record.to_dict(AnalysisJobService.queue_position(db, record))}
+        else:
+            try:
+                job = job_manager.submit(file.filename, file_size, temp_file_path, priority=priority, content_sha256=content_sha256)
+            except QueueFullError as e:
+                os.unlink(temp_file_path)
+                raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+            status = {"success": True, **job.to_dict(job_manager.queue_position(job))}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to queue analysis job: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to queue analysis job: {str(e)}")
+    
+    job_id = status["job_id"]
+    return JSONResponse(status_code=202, content={
+        **status,
+        "status_url": f"/analysis-jobs/{job_id}",
+        "result_url": f"/analysis-jobs/{job_id}/result",
+        "events_url": f"/analysis-jobs/{job_id}/events"
+    })
+
+@app.get("/analysis-jobs/stats")
+async def get_analysis_job_stats(db: Session = Depends(get_db)):
+    """Queue backend and job counts by status (plus pool size and queue depth in memory mode)"""
+    stats = AnalysisJobService.stats(db) if DURABLE_JOBS else job_manager.stats()
+    return {"success": True, "backend": ANALYSIS_QUEUE_BACKEND, **stats}
+
+@app.get("/analysis-jobs/{job_id}", response_model=AnalysisJobResponse)
+async def get_analysis_job(job_id: str, db: Session = Depends(get_db)):
+    """Status, current stage and queue position of an analysis job"""
+    status, _, _ = job_snapshot(db, job_id)
+    return status
+
+@app.get("/analysis-jobs/{job_id}/result", response_model=AnalyzeScriptResponse)
+async def get_analysis_job_result(
+    job_id: str,
+    compact: bool = Query(False, description="Return the analysis once, with a handle for /save-analysis"),
+    fields: Optional[str] = Query(None, description="Comma-separated analysis sections to return; implies compact"),
+    db: Session = Depends(get_db)
+):
+    """Result of a completed job; 202 with the job status while it is still queued or running"""
+    selected_fields = parse_fields(fields)
+    status, parts, error_status_code = job_snapshot(db, job_id)
+    
+    if status["status"] == "failed":
+        raise HTTPException(status_code=error_status_code, detail=status["error"])
+    if status["status"] != "completed":
+        return JSONResponse(status_code=202, content=status)
+    return JSONResponse(status_code=200, content=render_analysis(parts, compact, selected_fields))
+
+@app.get("/analysis-jobs/{job_id}/events")
+async def stream_analysis_job(job_id: str, http_request: Request):
+    """Server-Sent Events: a "status" event on every queue position, stage or status change, then "done" """
+    
+    if DURABLE_JOBS:
+        status, _, _ = await asyncio.to_thread(poll_durable_job, job_id)
+        
+        async def event_stream():
+            nonlocal status
+            last = None
+            while True:
+                if status != last:
+                    yield sse_event("status", status)
+                    last = status
+                if status["status"] in FINISHED_STATUSES:
+                    yield sse_event("done", status)
+                    return
+                if await http_request.is_disconnected():
+                    return
+                await asyncio.sleep(JOB_EVENTS_POLL_SECONDS)
+                status, _, _ = await asyncio.to_thread(poll_durable_job, job_id)
+        
+        return EventSourceResponse(event_stream(), ping=CHAT_STREAM_PING_SECONDS)
+    
+    job = job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Analysis job not found")
+    
+    async def event_stream():
+        while True:
+            changed = job.changed
+            status = {"success": True, **job.to_dict(job_manager.queue_position(job))}
+            yield sse_event("status", status)
+            if job.finished:
+                yield sse_event("done", status)
+                return
+            
+            while not changed.is_set():
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout=CHAT_STREAM_PING_SECONDS)
+                except asyncio.TimeoutError:
+                    if await http_request.is_disconnected():
+                        return
+    
+    return EventSourceResponse(event_stream(), ping=CHAT_STREAM_PING_SECONDS)
+
+# Batch analysis of a whole slate: many PDFs and/or zip archives in one request
+def save_analysis_parts(parts: Dict[str, Any], script_id: Optional[str] = None, record_errors: bool = True) -> AnalyzedScript:
+    """Save analysis_parts() output on a session of its own (for batches and write-behind)"""
+    metadata = parts["metadata"]
+    db = SessionLocal()
+    try:
+        with track_run(StageRecorder()):
+            return AnalyzedScriptService.create_analyzed_script(
+                db=db,
+                filename=metadata["filename"],
+                original_filename=metadata["original_filename"],
+                file_size_bytes=metadata["file_size_bytes"],
+                analysis_data=parts["analysis_data"],
+                processing_time=metadata["processing_time_seconds"],
+                api_calls_used=metadata["api_calls_used"],
+                workflow_thread_id=metadata.get("workflow_thread_id"),
+                stage_metrics=metadata.get("stage_metrics"),
+                content_sha256=metadata.get("content_sha256"),
+                text_sha256=metadata.get("text_sha256"),
+                rate_card_version=metadata.get("rate_card_version"),
+                script_id=script_id,
+                record_errors=record_errors
+            )
+    finally:
+        db.close()
+
+def find_saved_duplicate(content_sha256: str) -> Optional[str]:
+    db = SessionLocal()
+    try:
+        return AnalyzedScriptService.find_by_hash(db, content_sha256, id_only=True)
+    finally:
+        db.close()
+
+@app.post("/analyze-batch")
+async def analyze_batch(
+    files: List[UploadFile] = File(...)
+):
+    """
+    Analyze and save a batch of script PDFs (zip archives are expanded), streamed over Server-Sent Events.
+    
+    A fixed number of scripts run at once (BATCH_CONCURRENCY) and every model call still
+    goes through the process-wide LLM limit. Each analysis is saved as soon as it finishes.
+    Events: "file" per finished file (status saved, duplicate, failed, rejected or skipped,
+    plus database_id when saved or already saved), then "summary" with counts and
+    throughput. Disconnecting cancels files that have not finished; saved ones stay saved.
+    """
+    
+    validator = FileValidator()
+    events: asyncio.Queue = asyncio.Queue()
+    
+    # The uploads are closed when this function returns, before the stream starts
+    try:
+        staged = await asyncio.to_thread(stage_uploads, files)
+    except Exception as e:
+        logger.error(f"Failed to stage batch uploads: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to read uploaded files: {str(e)}")
+    
+    async def process(filename: str, pdf_path: str, size: int, content_sha256: str) -> Dict[str, Any]:
+        duplicate_id = await asyncio.to_thread(find_saved_duplicate, content_sha256)
+        if duplicate_id:
+            return {"status": "duplicate", "database_id": duplicate_id}
+        
+        parts = await analyze_pdf(pdf_path, filename, size, content_sha256=content_sha256)
+        saved = await asyncio.to_thread(save_analysis_parts, parts)
+        if saved.status == "error":
+            return {"status": "failed", "error": saved.error_message, "database_id": saved.id}
+        
+        return {
+            "status": "saved",
+            "database_id": saved.id,
+            "total_scenes": saved.total_scenes,
+            "estimated_budget": saved.estimated_budget,
+            "budget_category": saved.budget_category
+        }
+    
+    async def emit(event: str, data: Dict[str, Any]) -> None:
+        await events.put((event, data))
+    
+    async def run() -> None:
+        try:
+            await run_batch(staged, process, emit, validator.min_file_size, validator.max_file_size)
+        except Exception as e:
+            logger.error(f"Batch analysis failed: {str(e)}")
+            await emit("error", {"error": str(e)})
+    
+    async def event_stream():
+        batch = asyncio.create_task(run())
+        try:
+            while True:
+                event, data = await events.get()
+                yield sse_event(event, data)
+                if event in ("summary", "error"):
+                    return
+        finally:
+            if not batch.done():
+                logger.info("Batch analysis cancelled by client")
+                batch.cancel()
+    
+    # Covers streams that never start or end before the reader finished with the uploads
+    return EventSourceResponse(
+        event_stream(),
+        ping=CHAT_STREAM_PING_SECONDS,
+        background=BackgroundTask(discard_staged, staged)
+    )
+
 # Save analyzed script to DB endpoint
 @app.post("/save-analysis", response_model=SaveAnalysisResponse)
 async def save_analysis_to_database(
@@ -227,26 +553,43 @@ async def save_analysis_to_database(
     try:
         logger.info(f"Saving analysis for {request.filename} to database")
         
-        # Enhanced validation of analysis data
-        try:
-            from agents.states.states import ComprehensiveAnalysis
-            temp_analysis = ComprehensiveAnalysis(**request.analysis_data)  # ✅ FIXED
-            AnalysisValidator.validate_comprehensive_analysis(temp_analysis)
-            logger.info("Analysis data validation passed")
-        except Exception as validation_error:
-            logger.warning(f"Analysis validation warning: {validation_error}")
-            # Continue with save despite validation warnings
-        
-        # Save to database
-        saved_script = AnalyzedScriptService.create_analyzed_script(
-            db=db,
-            filename=request.filename,
-            original_filename=request.original_filename or request.filename,
-            file_size_bytes=request.file_size_bytes,
-            analysis_data=request.analysis_data,  # ✅ FIXED: Direct assignment
-            processing_time=request.processing_time_seconds,
-            api_calls_used=request.api_calls_used
-        )
+        # Save-side stages (validation, db_prepare, db_insert) are stored with the analysis stages
+        with track_run(StageRecorder()) as recorder:
+            analysis_data = request.analysis_data
+            if analysis_data is None:
+                # Compact responses hand out the artifact key of an already validated analysis
+                try:
+                    with recorder.stage("handle_load"):
+                        analysis = await asyncio.to_thread(artifact_store.get_model, request.analysis_handle, ComprehensiveAnalysis)
+                        analysis_data = analysis.model_dump()
+                except (KeyError, ValueError):
+                    raise HTTPException(status_code=404, detail="Analysis handle not found; analyze the script again or send analysis_data")
+            
+            # Enhanced validation of analysis data
+            try:
+                with recorder.stage("save_validation"):
+                    temp_analysis = analysis if request.analysis_data is None else ComprehensiveAnalysis(**analysis_data)  # ✅ FIXED
+                    AnalysisValidator.validate_comprehensive_analysis(temp_analysis)
+                logger.info("Analysis data validation passed")
+            except Exception as validation_error:
+                logger.warning(f"Analysis validation warning: {validation_error}")
+                # Continue with save despite validation warnings
+            
+            # Save to database
+            saved_script = AnalyzedScriptService.create_analyzed_script(
+                db=db,
+                filename=request.filename,
+                original_filename=request.original_filename or request.filename,
+                file_size_bytes=request.file_size_bytes,
+                analysis_data=analysis_data,  # ✅ FIXED: Direct assignment
+                processing_time=request.processing_time_seconds,
+                api_calls_used=request.api_calls_used,
+                workflow_thread_id=request.workflow_thread_id,
+                stage_metrics=request.stage_metrics,
+                content_sha256=request.content_sha256,
+                text_sha256=request.text_sha256,
+                rate_card_version=request.rate_card_version
+            )
         
         response_data = {
             "success": True,
@@ -269,6 +612,8 @@ async def save_analysis_to_database(
         logger.info(f"Analysis saved to database with ID: {saved_script.id}")
         return JSONResponse(status_code=201, content=response_data)
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Failed to save analysis: {str(e)}")
         raise HTTPException(
@@ -276,6 +621,109 @@ async def save_analysis_to_database(
             detail=f"Failed to save analysis to database: {str(e)}"
         )
 
+# Analyze and save in one request; the database write happens after the response is sent
+WRITE_BEHIND_ATTEMPTS = int(os.getenv("WRITE_BEHIND_ATTEMPTS", "3"))
+WRITE_BEHIND_RETRY_SECONDS = float(os.getenv("WRITE_BEHIND_RETRY_SECONDS", "1"))
+
+# A placeholder still saving after this long lost its save (e.g. the process restarted)
+WRITE_BEHIND_STALE_SECONDS = int(os.getenv("WRITE_BEHIND_STALE_SECONDS", "600"))
+
+def write_behind_save(script_id: str, parts: Dict[str, Any]) -> None:
+    """
+    Fill in the placeholder row reserved under script_id, retrying with backoff.
+    
+    The last attempt stores an error record under the same id if the save still
+    fails; a save lost with its process is expired by get_analyzed_script, so the
+    id handed to the client always resolves in the end.
+    """
+    for attempt in range(1, WRITE_BEHIND_ATTEMPTS + 1):
+        try:
+            saved = save_analysis_parts(parts, script_id=script_id, record_errors=attempt == WRITE_BEHIND_ATTEMPTS)
+            logger.info(f"💾 Write-behind save of {script_id} finished ({saved.status}, attempt {attempt})")
+            return
+        except Exception as e:
+            # A commit that succeeded before the error must not be retried over
+            db = SessionLocal()
+            try:
+                script = AnalyzedScriptService.get_analyzed_script_by_id(db, script_id)
+                if script and script.status != SAVING_STATUS:
+                    return
+            except Exception:
+                pass
+            finally:
+                db.close()
+            
+            if attempt == WRITE_BEHIND_ATTEMPTS:
+                logger.error(f"❌ Write-behind save of {script_id} failed for good: {str(e)}")
+                return
+            delay = WRITE_BEHIND_RETRY_SECONDS * 2 ** (attempt - 1)
+            logger.warning(f"Write-behind save of {script_id} failed (attempt {attempt}), retrying in {delay:.0f}s: {str(e)}")
+            time.sleep(delay)
+
+@app.post("/analyze-and-save", response_model=AnalyzeScriptResponse)
+async def analyze_and_save_script(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    reuse_existing: bool = Query(True, description="Return the saved analysis when this exact PDF was analyzed before"),
+    compact: bool = Query(True, description="Return the analysis once instead of the save-compatible payload"),
+    fields: Optional[str] = Query(None, description="Comma-separated analysis sections to return; implies compact"),
+    db: Session = Depends(get_db)
+):
+    """
+    Analyze a script PDF and save the analysis server-side, in one request.
+    
+    The response carries the database_id the analysis is saved under. A placeholder row
+    is written first; the analysis itself is written after the response is sent and
+    retried on failure. Until it lands, /analyzed-scripts/{database_id} answers 202
+    from any API process. An exact duplicate of a saved script
+    returns that script's analysis and id without a new save.
+    """
+    
+    validator = FileValidator()
+    validator.validate_file(file)
+    selected_fields = parse_fields(fields)
+    
+    temp_file_path = None
+    
+    try:
+        temp_file_path, file_size, content_sha256 = await spool_upload(file, validator)
+        
+        start_time = time.time()
+        existing = AnalyzedScriptService.find_by_hash(db, content_sha256)
+        if existing and reuse_existing:
+            logger.info(f"♻️ {file.filename} matches saved analysis {existing.id}, skipping the workflow")
+            return JSONResponse(
+                status_code=200,
+                content=stored_analysis_response(
+                    existing, file.filename, file_size, time.time() - start_time, compact, selected_fields
+                )
+            )
+        
+        parts = await analyze_pdf(temp_file_path, file.filename, file_size, content_sha256=content_sha256)
+        
+        script_id = str(uuid.uuid4())
+        AnalyzedScriptService.create_placeholder(db, script_id, file.filename, file_size)
+        background_tasks.add_task(write_behind_save, script_id, parts)
+        
+        response_data = render_analysis(parts, compact, selected_fields)
+        response_data["message"] = "Script analysis completed; saving to database"
+        response_data["database_id"] = script_id
+        response_data["persistence"] = "pending"
+        return JSONResponse(status_code=200, content=response_data)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Analyze-and-save failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+    
+    finally:
+        if temp_file_path and os.path.exists(temp_file_path):
+            try:
+                os.unlink(temp_file_path)
+            except Exception as cleanup_error:
+                logger.warning(f"Failed to cleanup temp file: {cleanup_error}")
+
 # Read all analyzed scripts from DB endpoint
 @app.get("/analyzed-scripts", response_model=ScriptListResponse)
 async def get_all_analyzed_scripts(
@@ -334,6 +782,31 @@ async def get_all_analyzed_scripts(
         raise HTTPException(status_code=500, detail=f"Failed to retrieve scripts: {str(e)}")
 
 # Read analyzed script from DB by ID
+@app.api_route("/analyzed-scripts/by-hash/{sha256}", methods=["GET", "HEAD"])
+async def get_script_by_hash(
+    sha256: str,
+    db: Session = Depends(get_db)
+):
+    """
+    Check whether a PDF (SHA-256 of its bytes) or script text was already analyzed.
+    
+    Lets clients skip the upload entirely: HEAD answers 200 with the saved id in
+    X-Analysis-Id, or 404. The body of GET carries the same id.
+    """
+    sha256 = sha256.lower()
+    if not is_sha256(sha256):
+        raise HTTPException(status_code=400, detail="Expected a hex-encoded SHA-256 digest")
+    
+    script_id = AnalyzedScriptService.find_by_hash(db, sha256, id_only=True)
+    if not script_id:
+        raise HTTPException(status_code=404, detail="No saved analysis with this hash")
+    
+    return JSONResponse(
+        status_code=200,
+        content={"success": True, "database_id": script_id},
+        headers={"X-Analysis-Id": script_id}
+    )
+
 @app.get("/analyzed-scripts/{script_id}", response_model=DatabaseScriptResponse)
 async def get_analyzed_script(
     script_id: str,
@@ -347,6 +820,16 @@ async def get_analyzed_script(
         if not script:
             raise HTTPException(status_code=404, detail="Analyzed script not found")
         
+        if script.status == SAVING_STATUS:
+            stale_before = datetime.now(timezone.utc) - timedelta(seconds=WRITE_BEHIND_STALE_SECONDS)
+            if not AnalyzedScriptService.expire_placeholder(db, script_id, stale_before):
+                return JSONResponse(status_code=202, content={
+                    "success": True,
+                    "data": None,
+                    "message": "Analysis is still being saved"
+                })
+            db.refresh(script)
+        
         return {
             "success": True,
             "data": script.to_dict(),
@@ -386,6 +869,130 @@ async def delete_analyzed_script(
     
 
 
+# What-if budget recalculation from cached cost factors
+from .validators import WhatIfRequest, WhatIfResponse, BudgetSimulationResponse, RateResolveRequest
+
+def load_scene_factors(db: Session, script_id: str, rate_card):
+    """Cost factors of a saved script; the full row is only read when the cache misses its current version"""
+    
+    version = AnalyzedScriptService.get_analysis_version(db, script_id)
+    if version is None:
+        raise HTTPException(status_code=404, detail="Analyzed script not found")
+    
+    def load_analysis():
+        script = AnalyzedScriptService.get_analyzed_script_by_id(db, script_id)
+        if not script:
+            raise HTTPException(status_code=404, detail="Analyzed script not found")
+        return script.to_analysis_dict()
+    
+    return scene_factor_cache.get_or_build(script_id, version, load_analysis, rate_card)
+
+@app.post("/analyzed-scripts/{script_id}/what-if", response_model=WhatIfResponse)
+async def what_if_budget(
+    script_id: str,
+    request: WhatIfRequest,
+    db: Session = Depends(get_db)
+):
+    """Recompute a saved script's CostBreakdown under rate overrides and scene selection, without the model"""
+    
+    try:
+        rate_card = await asyncio.to_thread(load_rate_card)
+        
+        start_time = time.perf_counter()
+        factors = load_scene_factors(db, script_id, rate_card)
+        
+        scenario = apply_what_if(
+            factors,
+            cast_rate_overrides=request.cast_rate_overrides,
+            location_rate_overrides=request.location_rate_overrides,
+            location_swaps=request.location_swaps,
+            unit_rate_overrides=request.unit_rate_overrides,
+            include_scenes=request.include_scenes,
+            exclude_scenes=request.exclude_scenes
+        )
+        baseline_total = float(compute_scene_matrix(factors).sum())
+        computation_ms = (time.perf_counter() - start_time) * 1000
+        
+        breakdown = scenario["breakdown"].model_dump()
+        if not request.include_scene_costs:
+            breakdown.pop("scene_costs", None)
+        
+        return {
+            "success": True,
+            "script_id": script_id,
+            "cost_breakdown": breakdown,
+            "baseline_total": round(baseline_total, 2),
+            "delta_total": round(breakdown["total_costs"] - baseline_total, 2),
+            "scenes_priced": int(scenario["scene_mask"].sum()),
+            "unmatched_overrides": scenario["unmatched"],
+            "computation_ms": round(computation_ms, 3)
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"What-if recalculation failed for script {script_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"What-if recalculation failed: {str(e)}")
+
+@app.get("/analyzed-scripts/{script_id}/budget-simulation", response_model=BudgetSimulationResponse)
+async def simulate_script_budget(
+    script_id: str,
+    iterations: int = Query(10000, ge=100, le=MAX_ITERATIONS, description="Number of simulated budgets"),
+    seed: Optional[int] = Query(None, description="Random seed for reproducible results"),
+    exclude_scenes: Optional[List[int]] = Query(None, description="Scene numbers to leave out"),
+    db: Session = Depends(get_db)
+):
+    """Monte Carlo budget range (P10/P50/P90) sampled from the rate card ranges"""
+    
+    try:
+        rate_card = await asyncio.to_thread(load_rate_card)
+        factors = load_scene_factors(db, script_id, rate_card)
+        
+        scene_mask = None
+        if exclude_scenes:
+            scene_mask = ~np.isin(factors.scene_numbers, exclude_scenes)
+        
+        simulation = await asyncio.to_thread(simulate_budget, factors, iterations, seed, scene_mask)
+        point_estimate = float(compute_scene_matrix(factors, scene_mask=scene_mask).sum())
+        
+        return {
+            "success": True,
+            "script_id": script_id,
+            "point_estimate": round(point_estimate, 2),
+            **simulation
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Budget simulation failed for script {script_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Budget simulation failed: {str(e)}")
+
+@app.post("/rate-card/resolve")
+async def resolve_rate_records(request: RateResolveRequest):
+    """Resolve free-text locations/roles to rate-card records with confidence scores"""
+    
+    try:
+        rate_card = await asyncio.to_thread(load_rate_card)
+        index = get_rate_index(rate_card)
+        
+        start_time = time.perf_counter()
+        matches, unmatched = index.resolve(request.category, request.queries, request.min_confidence)
+        computation_ms = (time.perf_counter() - start_time) * 1000
+        
+        return {
+            "success": True,
+            "category": request.category,
+            "rate_card_version": index.version,
+            "matches": [match.to_dict() for match in matches],
+            "unmatched": unmatched,
+            "computation_ms": round(computation_ms, 3)
+        }
+        
+    except Exception as e:
+        logger.error(f"Rate resolution failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Rate resolution failed: {str(e)}")
+
 # Manual human-in-the-loop
 from .validators import HumanFeedbackRequest, HumanFeedbackResponse
 
@@ -397,7 +1004,10 @@ async def provide_human_feedback(
 ):
     """
     Provide human feedback for a specific analysis
-    This can trigger re-analysis if needed
+    
+    If the analysis run was checkpointed, the workflow is resumed at the human feedback
+    step with its stored state; requested re-analysis re-runs only the analyst step and
+    the revised analysis replaces the stored one.
     """
     try:
         # Get the script from database
@@ -406,29 +1016,52 @@ async def provide_human_feedback(
         if not script:
             raise HTTPException(status_code=404, detail="Script not found")
         
+        # Resume the checkpointed run instead of starting the analysis over
+        resumed_state = None
+        resume_error = None
+        if script.workflow_thread_id:
+            try:
+                resumed_state = await resume_with_feedback(
+                    script.workflow_thread_id,
+                    feedback.feedback_text,
+                    feedback.approved,
+                    request_reanalysis=feedback.request_reanalysis
+                )
+            except Exception as e:
+                resume_error = str(e)
+                logger.warning(f"Could not resume workflow {script.workflow_thread_id} for script {script_id}: {resume_error}")
+        
         # If feedback indicates issues and re-analysis is requested
         if not feedback.approved and feedback.request_reanalysis:
             logger.info(f"Re-analysis requested for script {script_id}")
             
-            # Create workflow state from stored data
-            workflow_state = {
-                "pdf_path": f"temp_reanalysis_{script_id}",  # You'd need to handle file storage
-                "comprehensive_analysis": script.to_dict(),
-                "human_feedback_provided": True,
-                "feedback_text": feedback.feedback_text,
-                "feedback_approved": feedback.approved,
-                "force_human_review": False,
-                "status": "reanalysis_requested"
-            }
-            
-            # Run workflow again (optional - only if you want automatic re-analysis)
-            # workflow = create_workflow()
-            # updated_result = await workflow.ainvoke(workflow_state)
+            revised_analysis = (resumed_state or {}).get("comprehensive_analysis")
+            if revised_analysis and (resumed_state or {}).get("status") in ("analysis_completed", "analysis_completed_with_approval"):
+                if hasattr(revised_analysis, 'model_dump'):
+                    revised_analysis = revised_analysis.model_dump()
+                
+                script = AnalyzedScriptService.update_analysis(
+                    db, script_id, revised_analysis,
+                    status="completed_with_feedback",
+                    rate_card_version=resumed_state.get("rate_card_version")
+                )
+                
+                logger.info(f"✅ Script {script_id} re-analyzed from its workflow checkpoint")
+                return {
+                    "success": True,
+                    "message": "Feedback applied. The analysis was revised from the saved workflow state.",
+                    "script_id": script_id,
+                    "feedback_processed": True,
+                    "action_taken": "reanalyzed",
+                    "status": script.status,
+                    "workflow_resumed": True
+                }
             
-            # Update database record
+            # No checkpoint to resume (or the revision failed): leave it for manual re-analysis
             script.status = "pending_revision"
             script.error_message = f"Human feedback: {feedback.feedback_text}"
             db.commit()
+            chat_answer_cache.invalidate(script_id)
             
             return {
                 "success": True,
@@ -436,7 +1069,9 @@ async def provide_human_feedback(
                 "script_id": script_id,
                 "feedback_processed": True,
                 "action_taken": "marked_for_revision",
-                "status": "pending_revision"
+                "status": "pending_revision",
+                "workflow_resumed": resumed_state is not None,
+                "workflow_resume_error": resume_error
             }
         
         else:
@@ -447,6 +1082,7 @@ async def provide_human_feedback(
                 script.error_message = f"{existing_error}\nHuman feedback: {feedback.feedback_text}".strip()
             
             db.commit()
+            chat_answer_cache.invalidate(script_id)
             
             return {
                 "success": True,
@@ -454,7 +1090,9 @@ async def provide_human_feedback(
                 "script_id": script_id,
                 "feedback_processed": True,
                 "action_taken": "feedback_recorded",
-                "status": script.status
+                "status": script.status,
+                "workflow_resumed": resumed_state is not None,
+                "workflow_resume_error": resume_error
             }
             
     except HTTPException:
@@ -463,6 +1101,35 @@ async def provide_human_feedback(
         logger.error(f"Failed to process feedback for script {script_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to process feedback: {str(e)}")
 
+# Pipeline stage metrics
+@app.get("/metrics/stages")
+async def get_stage_metrics(
+    window_hours: int = Query(24, ge=1, le=24 * 90),
+    db: Session = Depends(get_db)
+):
+    """p50/p95/p99 wall time, CPU time and sampled peak memory per pipeline stage over a time window"""
+    
+    try:
+        since = datetime.now(timezone.utc) - timedelta(hours=window_hours)
+        runs = AnalyzedScriptService.get_stage_metrics(db, since)
+        
+        return {
+            "success": True,
+            "window_hours": window_hours,
+            "since": since.isoformat(),
+            "scripts": len(runs),
+            "stages": summarize_stages(runs)
+        }
+        
+    except Exception as e:
+        logger.error(f"Failed to compute stage metrics: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to compute stage metrics: {str(e)}")
+
+@app.get("/metrics/coalescing")
+async def get_coalescing_metrics():
+    """How often identical concurrent analyses were served by a single run"""
+    return {"success": True, "analysis": analysis_flights.stats()}
+
 # Helper function while waiting for human_feedback
 @app.get("/scripts-awaiting-feedback", response_model=ScriptListResponse)
 async def get_scripts_awaiting_feedback(
@@ -500,6 +1167,7 @@ async def get_scripts_awaiting_feedback(
     
 class ChatRequest(BaseModel):
     message: str
+    session_id: Optional[str] = None  # Continue an existing conversation; omitted starts a new one
 
 async def llm_based_fallback_response(user_message: str, script_data: dict, script_title: str) -> str:
     """Use LLM to analyze script data and provide intelligent responses"""
@@ -587,167 +1255,142 @@ Answer the user's question based on your analysis of this script data. Be specif
         # Only use hardcoded fallback as last resort
         return generate_simple_fallback_response(user_message, script_data, script_title)
 
-def analyze_scenes_with_same_location_and_characters(scenes_data: list, script_title: str) -> str:
-    """Analyze scenes that have the same location with the exact same characters"""
-    if not scenes_data:
-        return f"No scene data available for '{script_title}'"
+def generate_simple_fallback_response(user_message: str, script_data: dict, script_title: str) -> str:
+    """Last resort fallback when both main chatbot and LLM fallback fail"""
+    return f"I'm experiencing technical difficulties analyzing '{script_title}'. Both my main AI system and backup analysis are currently unavailable. Please try your question again in a moment, or contact support if the issue persists."
+
+# Scenes embedded directly in the prompt; the rest is reachable through the chatbot tools
+CHAT_PROMPT_SCENES = 6
+
+def prepare_chat(db: Session, script_id: str, request: ChatRequest) -> Dict[str, Any]:
+    """
+    Load the chat artifact and session, try a local answer and otherwise build the agent prompt.
+    Shared by the plain and streaming chat endpoints.
+    """
+    # Precomputed summary, scene table and indexes; built once per analysis version
+    chat_context = AnalyzedScriptService.get_chat_context(db, script_id)
+    if not chat_context:
+        raise HTTPException(status_code=404, detail="Script not found")
     
-    # Group scenes by location and characters
-    location_character_groups = {}
+    session = ChatSessionService.get_or_create_session(db, script_id, request.session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Chat session not found for this script")
     
-    for scene in scenes_data:
-        # Get scene info
-        scene_num = scene.get("scene_number", scene.get("number", "Unknown"))
-        location = scene.get("location", scene.get("scene_location", "Unknown Location"))
-        characters = scene.get("characters_present", scene.get("characters", []))
-        scene_header = scene.get("scene_header", scene.get("heading", f"Scene {scene_num}"))
-        
-        # Normalize location and characters for comparison
-        location_normalized = location.strip().upper() if location else "UNKNOWN"
-        characters_set = frozenset(char.strip().upper() for char in characters if char) if characters else frozenset()
-        
-        # Create a key combining location and characters
-        key = (location_normalized, characters_set)
-        
-        if key not in location_character_groups:
-            location_character_groups[key] = []
-        
-        location_character_groups[key].append({
-            "scene_number": scene_num,
-            "scene_header": scene_header,
-            "location": location,
-            "characters": characters
-        })
+    script_title = chat_context["script_title"]
+    comprehensive_analysis = chat_context["analysis"]
+    prepared = {
+        "session": session,
+        "script_title": script_title,
+        "analysis": comprehensive_analysis,
+        "analysis_version": chat_context.get("analysis_version", ""),
+        "local_answer": None,
+        "cached": None,
+        "cacheable": False,
+        "prompt": None,
+        "deps": None
+    }
     
-    # Find groups with multiple scenes
-    matching_groups = []
-    for (location, characters_set), scenes in location_character_groups.items():
-        if len(scenes) > 1 and location != "UNKNOWN" and len(characters_set) > 0:
-            matching_groups.append({
-                "location": location,
-                "characters": sorted(list(characters_set)),
-                "scenes": scenes,
-                "scene_count": len(scenes)
-            })
+    # Counts, groupings, filters and totals are answered from the stored analysis without the LLM
+    prepared["local_answer"] = answer_question(request.message, comprehensive_analysis, script_title)
+    if prepared["local_answer"]:
+        return prepared
     
-    # Generate response
-    if not matching_groups:
-        return f"In '{script_title}', no scenes share the exact same location with the exact same characters. Each scene appears to have a unique combination of location and cast."
+    # Agent answers are reused only for opening questions, where no earlier turns shape the answer
+    if not session.message_count:
+        prepared["cacheable"] = True
+        prepared["cached"] = chat_answer_cache.get(script_id, prepared["analysis_version"], request.message)
+        if prepared["cached"]:
+            return prepared
     
-    response = f"In '{script_title}', I found {len(matching_groups)} location(s) where multiple scenes involve the same characters:\n\n"
+    # Recent turns verbatim plus a bounded summary of older ones
+    history_summary, recent_messages = ChatSessionService.get_history_window(db, session)
+    conversation = render_history(history_summary, recent_messages)
     
-    total_matching_scenes = 0
-    for group in matching_groups:
-        total_matching_scenes += group["scene_count"]
-        location_name = group["location"].title() if group["location"] != "UNKNOWN" else "Unknown Location"
-        
-        response += f"📍 **{location_name}**\n"
-        response += f"   Characters: {', '.join(group['characters'])}\n"
-        response += f"   Scenes ({group['scene_count']}):\n"
-        
-        for scene in group["scenes"]:
-            response += f"   • Scene {scene['scene_number']}: {scene['scene_header']}\n"
-        response += "\n"
+    # Prepare comprehensive context for chatbot
+    prepared["deps"] = {
+        "comprehensive_analysis": comprehensive_analysis,
+        "indexes": chat_context["indexes"],
+        "user_message": request.message,
+        "script_title": script_title,
+        "script_id": script_id
+    }
     
-    response += f"**Summary**: {total_matching_scenes} scenes total involve the same location with the exact same characters across {len(matching_groups)} different location(s)."
+    # Only the scenes most relevant to this question; the agent's tools fetch anything else
+    retrieved = scene_index_cache.get_or_build(script_id, chat_context).select(request.message, top_k=CHAT_PROMPT_SCENES)
+    table_header = chat_context["scene_table"].split("\n", 1)[0]
+    scene_table = "\n".join([table_header] + retrieved["rows"])
     
-    return response
+    prepared["prompt"] = f"""You are chatting with a user about their analyzed script titled "{script_title}".
 
-def generate_simple_fallback_response(user_message: str, script_data: dict, script_title: str) -> str:
-    """Last resort fallback when both main chatbot and LLM fallback fail"""
-    return f"I'm experiencing technical difficulties analyzing '{script_title}'. Both my main AI system and backup analysis are currently unavailable. Please try your question again in a moment, or contact support if the issue persists."
-
-@app.post("/chat/{script_id}")
-async def chat_about_script(
-    script_id: str,
-    request: ChatRequest,
-    db: Session = Depends(get_db)
-):
-    """Chat about a specific analyzed script with intelligent conversation capability"""
-    
-    try:
-        logger.info(f"Chat request for script {script_id}: {request.message}")
-        
-        # Get the script analysis
-        script = AnalyzedScriptService.get_analyzed_script_by_id(db, script_id)
-        if not script:
-            raise HTTPException(status_code=404, detail="Script not found")
-        
-        # Get full script analysis data
-        script_data = script.to_dict()
-        logger.info(f"Script data keys: {list(script_data.keys())}")
-        
-        # Extract the comprehensive analysis from script data
-        comprehensive_analysis = script_data.get('comprehensive_analysis') or script_data.get('analysis_data')
-        if not comprehensive_analysis:
-            logger.warning("No comprehensive analysis found in script data")
-            comprehensive_analysis = script_data
-        
-        # Prepare comprehensive context for chatbot
-        context = {
-            "script_analysis": script_data,
-            "comprehensive_analysis": comprehensive_analysis,
-            "user_message": request.message,
-            "script_title": script.filename or script.original_filename,
-            "script_id": script_id
-        }
-        
-        # Import the helper function
-        from agents.agent.chatbot_agent import get_script_analysis_context
-        
-        # Create a detailed prompt that includes script context and full data
-        script_title = script.filename or script.original_filename
-        script_context = get_script_analysis_context(comprehensive_analysis)
-        
-        # Extract scene data for specific analysis
-        scenes_data = []
-        if comprehensive_analysis and isinstance(comprehensive_analysis, dict):
-            # Try different paths to find scenes
-            if 'script_data' in comprehensive_analysis and 'scenes' in comprehensive_analysis['script_data']:
-                scenes_data = comprehensive_analysis['script_data']['scenes']
-            elif 'scenes' in comprehensive_analysis:
-                scenes_data = comprehensive_analysis['scenes']
-            elif 'script_breakdown' in comprehensive_analysis:
-                scenes_data = comprehensive_analysis['script_breakdown'].get('scenes', [])
-        
-        logger.info(f"Found {len(scenes_data)} scenes for analysis")
-        
-        prompt = f"""You are chatting with a user about their analyzed script titled "{script_title}".
+Conversation so far:
+{conversation or "(this is the first message)"}
 
 User's message: {request.message}
 
 Script Analysis Summary:
-{script_context}
+{chat_context["summary_text"]}
 
 IMPORTANT: You have access to the complete script analysis data. For specific questions about scenes, characters, locations, or budget, analyze the actual data provided.
 
 Script Details:
 - Title: {script_title}
-- Number of scenes: {len(scenes_data)}
 - Script ID: {script_id}
 
-Scene Data Available: {json.dumps(scenes_data[:3] if scenes_data else [], indent=2)}... (showing first 3 scenes)
-
-Full Analysis Data Available:
-{json.dumps(comprehensive_analysis, indent=2)[:2000]}... (truncated for brevity)
+Relevant Scenes ({len(retrieved["rows"])} of {retrieved["total_scenes"]}, selected for this question):
+{scene_table}
 
 Instructions:
+0. Use your tools (list_scenes, get_scenes_by_number, character_appearances, location_groups, cost_lookup) for any data not shown above
 1. For questions about cast/characters, count unique characters across all scenes
 2. For questions about scenes with same locations and characters, analyze each scene's location and character list  
 3. For budget questions, look at cost breakdown data
 4. For location questions, analyze location data from scenes
 5. Provide specific answers with scene numbers, character names, and other details from the analysis
 6. Be conversational and helpful while being accurate to the data
+7. Resolve follow-up questions ("that scene", "those characters") against the conversation so far
 
 Please provide a helpful response that addresses the user's question using the actual script analysis data."""
+    
+    return prepared
 
+@app.post("/chat/{script_id}")
+async def chat_about_script(
+    script_id: str,
+    request: ChatRequest,
+    db: Session = Depends(get_db)
+):
+    """Chat about a specific analyzed script with intelligent conversation capability"""
+    
+    try:
+        logger.info(f"Chat request for script {script_id}: {request.message}")
+        
+        prepared = prepare_chat(db, script_id, request)
+        session = prepared["session"]
+        script_title = prepared["script_title"]
+        comprehensive_analysis = prepared["analysis"]
+        
+        local_answer = prepared["local_answer"]
+        if local_answer:
+            result = {
+                "success": True,
+                "response": local_answer.text,
+                "script_id": script_id,
+                "script_title": script_title,
+                "answered_locally": True,
+                "intent": local_answer.intent
+            }
+            return record_chat_turn(db, session.id, request.message, result)
+        
+        if prepared["cached"]:
+            logger.info(f"💾 Chat answer cache hit for script {script_id}")
+            return record_chat_turn(db, session.id, request.message, {**prepared["cached"], "cache_hit": True})
+        
         # Get chatbot response with enhanced error handling
         try:
             logger.info("🤖 Calling main chatbot agent...")
             logger.info(f"🤖 User message: {request.message}")
-            logger.info(f"🤖 Script context preview: {script_context[:500]}...")
             
-            response = await chatbot_agent.run(prompt, deps=context)
+            response = await chatbot_agent.run(prepared["prompt"], deps=prepared["deps"])
             logger.info(f"🤖 Chatbot response type: {type(response)}")
             
             # Extract response text properly
@@ -763,41 +1406,20 @@ Please provide a helpful response that addresses the user's question using the a
             
             logger.info(f"✅ Main chatbot SUCCESS: {response_text[:200]}...")
             
-            return {
+            result = {
                 "success": True,
                 "response": response_text,
                 "script_id": script_id,
                 "script_title": script_title
             }
+            if prepared["cacheable"]:
+                chat_answer_cache.put(script_id, prepared["analysis_version"], request.message, result)
             
         except Exception as agent_error:
             logger.error(f"❌ Main chatbot FAILED: {str(agent_error)}")
-            logger.info("🔄 Trying LLM-based fallback...")
-            
-            # Use LLM-based fallback that actually analyzes the script data
-            try:
-                fallback_response = await llm_based_fallback_response(request.message, comprehensive_analysis, script_title)
-                logger.info(f"✅ LLM fallback SUCCESS: {fallback_response[:200]}...")
-                
-                return {
-                    "success": True,
-                    "response": fallback_response,
-                    "script_id": script_id,
-                    "script_title": script_title,
-                    "fallback": True
-                }
-            except Exception as fallback_error:
-                logger.error(f"❌ LLM fallback FAILED: {str(fallback_error)}")
-                logger.info("🆘 Using last resort fallback...")
-                
-                last_resort = generate_simple_fallback_response(request.message, comprehensive_analysis, script_title)
-                return {
-                    "success": True,
-                    "response": last_resort,
-                    "script_id": script_id,
-                    "script_title": script_title,
-                    "last_resort": True
-                }
+            result = await chat_fallback(request.message, comprehensive_analysis, script_id, script_title)
+        
+        return record_chat_turn(db, session.id, request.message, result)
         
     except HTTPException:
         raise
@@ -805,6 +1427,255 @@ Please provide a helpful response that addresses the user's question using the a
         logger.error(f"Chat endpoint error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Chat failed: {str(e)}")
 
+async def chat_fallback(user_message: str, analysis: Dict[str, Any], script_id: str, script_title: str) -> Dict[str, Any]:
+    """LLM-based fallback, then the last resort reply, when the main chatbot agent fails"""
+    logger.info("🔄 Trying LLM-based fallback...")
+    
+    # Use LLM-based fallback that actually analyzes the script data
+    try:
+        fallback_response = await llm_based_fallback_response(user_message, analysis, script_title)
+        logger.info(f"✅ LLM fallback SUCCESS: {fallback_response[:200]}...")
+        
+        return {
+            "success": True,
+            "response": fallback_response,
+            "script_id": script_id,
+            "script_title": script_title,
+            "fallback": True
+        }
+    except Exception as fallback_error:
+        logger.error(f"❌ LLM fallback FAILED: {str(fallback_error)}")
+        logger.info("🆘 Using last resort fallback...")
+        
+        last_resort = generate_simple_fallback_response(user_message, analysis, script_title)
+        return {
+            "success": True,
+            "response": last_resort,
+            "script_id": script_id,
+            "script_title": script_title,
+            "last_resort": True
+        }
+
+# Seconds between SSE keep-alive comments while the model is thinking
+CHAT_STREAM_PING_SECONDS = 15
+
+def sse_event(event: str, data: Dict[str, Any]) -> Dict[str, str]:
+    return {"event": event, "data": json.dumps(data)}
+
+@app.post("/chat/{script_id}/stream")
+async def chat_about_script_stream(
+    script_id: str,
+    request: ChatRequest,
+    http_request: Request,
+    db: Session = Depends(get_db)
+):
+    """
+    Streaming variant of /chat/{script_id} over Server-Sent Events.
+    
+    Events: "session" (ids), "token" ({"delta": ...}) as the agent produces text,
+    "fallback" when the agent fails mid-stream (clients should discard partial
+    tokens and render the fallback tokens that follow) and "done" with the same
+    payload the plain endpoint returns. The agent call is cancelled when the
+    client disconnects.
+    """
+    
+    try:
+        logger.info(f"Streaming chat request for script {script_id}: {request.message}")
+        prepared = prepare_chat(db, script_id, request)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Chat stream setup error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Chat failed: {str(e)}")
+    
+    # Read while the request's db session is open; it is closed before the stream runs
+    session_id = prepared["session"].id
+    script_title = prepared["script_title"]
+    
+    async def event_stream():
+        yield sse_event("session", {"session_id": session_id, "script_id": script_id, "script_title": script_title})
+        
+        local_answer = prepared["local_answer"]
+        if local_answer:
+            result = {
+                "success": True,
+                "response": local_answer.text,
+                "script_id": script_id,
+                "script_title": script_title,
+                "answered_locally": True,
+                "intent": local_answer.intent
+            }
+            yield sse_event("token", {"delta": local_answer.text})
+            yield sse_event("done", record_streamed_turn(session_id, request.message, result))
+            return
+        
+        if prepared["cached"]:
+            logger.info(f"💾 Chat answer cache hit for script {script_id}")
+            result = {**prepared["cached"], "cache_hit": True}
+            yield sse_event("token", {"delta": result["response"]})
+            yield sse_event("done", record_streamed_turn(session_id, request.message, result))
+            return
+        
+        chunks = []
+        try:
+            async with chatbot_agent.run_stream(prepared["prompt"], deps=prepared["deps"]) as response:
+                async for delta in response.stream_text(delta=True):
+                    if await http_request.is_disconnected():
+                        logger.info(f"Chat stream for script {script_id} cancelled by client")
+                        return
+                    chunks.append(delta)
+                    yield sse_event("token", {"delta": delta})
+            
+            result = {
+                "success": True,
+                "response": "".join(chunks),
+                "script_id": script_id,
+                "script_title": script_title
+            }
+            if prepared["cacheable"]:
+                chat_answer_cache.put(script_id, prepared["analysis_version"], request.message, result)
+            
+        except asyncio.CancelledError:
+            logger.info(f"Chat stream for script {script_id} cancelled by client")
+            raise
+        except Exception as agent_error:
+            logger.error(f"❌ Streaming chatbot FAILED after {len(chunks)} chunks: {str(agent_error)}")
+            yield sse_event("fallback", {"discard_partial": bool(chunks)})
+            
+            result = await chat_fallback(request.message, prepared["analysis"], script_id, script_title)
+            yield sse_event("token", {"delta": result["response"]})
+        
+        yield sse_event("done", record_streamed_turn(session_id, request.message, result))
+    
+    return EventSourceResponse(event_stream(), ping=CHAT_STREAM_PING_SECONDS)
+
+def record_chat_turn(db: Session, session_id: str, user_message: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    """Persist the exchange to the chat session and tag the response with its session id"""
+    result.setdefault("cache_hit", False)
+    try:
+        ChatSessionService.record_turn(db, session_id, user_message, result["response"])
+    except Exception as e:
+        logger.warning(f"Failed to record chat turn for session {session_id}: {str(e)}")
+    result["session_id"] = session_id
+    return result
+
+def record_streamed_turn(session_id: str, user_message: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    """record_chat_turn on a session of its own; the request's db is closed before a stream ends"""
+    db = SessionLocal()
+    try:
+        return record_chat_turn(db, session_id, user_message, result)
+    finally:
+        db.close()
+
+@app.get("/chat/cache/stats")
+async def get_chat_cache_stats():
+    """Hit/miss counters of the chat answer cache"""
+    return {"success": True, "answer_cache": chat_answer_cache.stats()}
+
+@app.get("/chat/sessions/{session_id}")
+async def get_chat_session(
+    session_id: str,
+    db: Session = Depends(get_db)
+):
+    """Get the stored messages and rolling summary of a chat session"""
+    try:
+        messages = ChatSessionService.get_messages(db, session_id)
+        session = db.query(ChatSession).filter(ChatSession.id == session_id).first()
+        if not session:
+            raise HTTPException(status_code=404, detail="Chat session not found")
+        
+        return {
+            "success": True,
+            "session": session.to_dict(),
+            "messages": [message.to_dict() for message in messages]
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to get chat session {session_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to get chat session: {str(e)}")
+
+from .validators import PortfolioChatRequest
+
+@app.post("/portfolio/chat")
+async def chat_about_portfolio(
+    request: PortfolioChatRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    Answer questions across all analyzed scripts.
+    
+    Entity and budget questions run as SQL over the script_entities index and the
+    summary columns of analyzed_scripts; anything else goes to the LLM with a
+    compact slate overview. Per-script analysis JSON is never loaded.
+    """
+    try:
+        logger.info(f"Portfolio chat request: {request.message}")
+        PortfolioService.backfill_script_entities(db)
+        
+        intent = parse_portfolio_question(request.message)
+        if intent and intent.name == "entity_search":
+            data = PortfolioService.find_scripts_with_entity(db, intent.params["term"], intent.params["entity_type"])
+            if not data:
+                # Nothing indexed under that name: the question was probably not an entity lookup
+                intent = None
+        
+        if intent:
+            if intent.name == "entity_search":
+                text = format_entity_matches(intent.params, data)
+            elif intent.name == "budget_aggregate":
+                data = PortfolioService.budget_aggregate(db, intent.params["category"])
+                text = format_budget_aggregate(intent.params, data)
+            else:
+                data = PortfolioService.top_budgets(db, intent.params["top_n"], intent.params["descending"])
+                text = format_top_budgets(intent.params, data)
+            
+            return {
+                "success": True,
+                "response": text,
+                "answered_locally": True,
+                "intent": intent.name,
+                "data": data
+            }
+        
+        overview = render_overview(PortfolioService.overview(db))
+        prompt = f"""A line producer is asking about their whole slate of analyzed scripts.
+
+Question: {request.message}
+
+Slate overview:
+{overview}
+
+Answer from the overview. If the question needs per-script details that are not in the overview, say which specific question (for example "which scripts need a hospital location") would get an exact answer."""
+        
+        try:
+            from agents.utils.gemini_model import get_model
+            from pydantic_ai import Agent
+            
+            portfolio_agent = Agent(
+                model=get_model(),
+                system_prompt="You are a film production portfolio analyst. Answer concisely and only from the data given."
+            )
+            response = await portfolio_agent.run(prompt)
+            response_text = str(response.data) if hasattr(response, 'data') else str(response)
+            
+        except Exception as agent_error:
+            logger.error(f"❌ Portfolio LLM FAILED: {str(agent_error)}")
+            response_text = f"I couldn't reach the assistant right now. Here is the slate overview:\n\n{overview}"
+        
+        return {
+            "success": True,
+            "response": response_text,
+            "answered_locally": False
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Portfolio chat error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Portfolio chat failed: {str(e)}")
+
 @app.get("/test-llm")
 async def test_llm_connection():
     """Test the LLM connection"""
@@ -0,0 +1,210 @@
+from fastapi import UploadFile
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+from agents.utils.gemini_model import LLM_MAX_CONCURRENCY
+import asyncio
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+import logging
+
+logger = logging.getLogger(__name__)
+
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "100"))
+
+# Scripts analyzed at once per batch; model calls are further capped by LLM_MAX_CONCURRENCY
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", str(LLM_MAX_CONCURRENCY)))
+
+COPY_CHUNK_BYTES = 1024 * 1024
+
+# (filename, opener returning a readable binary file as a context manager, declared size or None)
+BatchSource = Tuple[str, Callable[[], Any], Optional[int]]
+
+# (upload filename, path of the batch's own copy of the upload)
+StagedUpload = Tuple[str, str]
+
+class BatchFileError(Exception):
+    """A file in the batch cannot be analyzed (wrong type, too large, bad archive)"""
+
+def stage_uploads(uploads: List[UploadFile]) -> List[StagedUpload]:
+    """
+    Copy every upload to a temporary file owned by the batch.
+
+    The request's UploadFiles are closed once the endpoint returns, before a streamed
+    batch reads them, so the batch works from these copies. run_batch deletes each
+    one when it is done with it.
+    """
+    staged: List[StagedUpload] = []
+    try:
+        for upload in uploads:
+            filename = upload.filename or "unnamed"
+            suffix = os.path.splitext(filename)[1].lower()
+            with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as temp_file:
+                staged.append((filename, temp_file.name))
+                upload.file.seek(0)
+                shutil.copyfileobj(upload.file, temp_file, COPY_CHUNK_BYTES)
+    except Exception:
+        discard_staged(staged)
+        raise
+    return staged
+
+def discard_staged(staged: List[StagedUpload]) -> None:
+    """Delete whatever staged uploads are left (after a cancelled or failed batch)"""
+    for _, path in staged:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        except Exception as cleanup_error:
+            logger.warning(f"Failed to cleanup staged upload: {cleanup_error}")
+
+def _archive_sources(filename: str, path: str) -> Iterator[BatchSource]:
+    try:
+        archive = zipfile.ZipFile(path)
+    except zipfile.BadZipFile:
+        raise BatchFileError(f"{filename} is not a valid zip archive")
+
+    with archive:
+        for member in archive.infolist():
+            name = os.path.basename(member.filename)
+            if member.is_dir() or not name or member.filename.startswith("__MACOSX/") or name.startswith("."):
+                continue
+            yield name, (lambda member=member: archive.open(member)), member.file_size
+
+def upload_sources(filename: str, path: str) -> Iterator[BatchSource]:
+    """The files of one staged upload, expanding a zip archive; non-PDFs come through as-is and fail validation"""
+    if filename.lower().endswith(".zip"):
+        yield from _archive_sources(filename, path)
+    else:
+        yield filename, (lambda: open(path, "rb")), os.path.getsize(path)
+
+def spool_source(filename: str, opener: Callable[[], Any], declared_size: Optional[int], min_size: int, max_size: int) -> Tuple[str, int, str]:
+    """
+    Copy one batch file to a temporary PDF, enforcing the upload size limits and hashing it while copying.
+
+    Returns:
+        (temporary path, size, SHA-256 of the bytes); the caller deletes the file.
+    """
+    if not filename.lower().endswith(".pdf"):
+        raise BatchFileError("Only .pdf files are supported")
+    if declared_size is not None and declared_size > max_size:
+        raise BatchFileError(f"File too large. Maximum size is {max_size // (1024 * 1024)}MB")
+
+    size = 0
+    digest = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
+        try:
+            with opener() as source:
+                while True:
+                    chunk = source.read(COPY_CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    # Archive headers can lie about sizes; count the bytes actually written
+                    if size > max_size:
+                        raise BatchFileError(f"File too large. Maximum size is {max_size // (1024 * 1024)}MB")
+                    digest.update(chunk)
+                    temp_file.write(chunk)
+            if size < min_size:
+                raise BatchFileError("File too small. Please provide a valid PDF script")
+        except Exception:
+            temp_file.close()
+            os.unlink(temp_file.name)
+            raise
+    return temp_file.name, size, digest.hexdigest()
+
+async def run_batch(
+    uploads: List[StagedUpload],
+    process: Callable[[str, str, int, str], Awaitable[Dict[str, Any]]],
+    emit: Callable[[str, Dict[str, Any]], Awaitable[None]],
+    min_size: int,
+    max_size: int,
+    concurrency: int = BATCH_CONCURRENCY
+) -> Dict[str, Any]:
+    """
+    Analyze every PDF of a batch with a fixed number of concurrent workers.
+
+    uploads come from stage_uploads() and are deleted once expanded. Their files are
+    copied out (of the archive) only when a worker is about to need them: the queue
+    between the reader and the workers holds at most `concurrency` files.
+    process(filename, pdf_path, size, content_sha256) returns the per-file result; emit(event, data)
+    is awaited with a "file" event for each finished file and the final "summary".
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency)
+    results: List[Dict[str, Any]] = []
+    start_time = time.time()
+
+    async def report(result: Dict[str, Any]) -> None:
+        results.append(result)
+        await emit("file", {**result, "completed": len(results)})
+
+    async def reader() -> None:
+        count = 0
+        try:
+            for upload_name, upload_path in uploads:
+                try:
+                    for filename, opener, declared_size in upload_sources(upload_name, upload_path):
+                        count += 1
+                        if count > BATCH_MAX_FILES:
+                            await report({"filename": filename, "status": "skipped", "error": f"Batch limit of {BATCH_MAX_FILES} files reached"})
+                            continue
+                        try:
+                            pdf_path, size, content_sha256 = await asyncio.to_thread(spool_source, filename, opener, declared_size, min_size, max_size)
+                        except BatchFileError as e:
+                            await report({"filename": filename, "status": "rejected", "error": str(e)})
+                            continue
+                        await queue.put((filename, pdf_path, size, content_sha256))  # Waits while every worker is busy
+                except BatchFileError as e:
+                    await report({"filename": upload_name, "status": "rejected", "error": str(e)})
+                finally:
+                    discard_staged([(upload_name, upload_path)])
+        finally:
+            for _ in range(concurrency):
+                await queue.put(None)
+
+    async def worker() -> None:
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            filename, pdf_path, size, content_sha256 = item
+            file_start = time.time()
+            try:
+                result = await process(filename, pdf_path, size, content_sha256)
+            except Exception as e:
+                logger.error(f"❌ Batch analysis of {filename} failed: {getattr(e, 'detail', None) or e}")
+                result = {"status": "failed", "error": getattr(e, "detail", None) or str(e)}
+            finally:
+                if os.path.exists(pdf_path):
+                    try:
+                        os.unlink(pdf_path)
+                    except Exception as cleanup_error:
+                        logger.warning(f"Failed to cleanup temp file: {cleanup_error}")
+            await report({
+                "filename": filename,
+                "file_size_bytes": size,
+                "processing_time_seconds": round(time.time() - file_start, 2),
+                **result
+            })
+
+    await asyncio.gather(reader(), *(worker() for _ in range(concurrency)))
+
+    elapsed = time.time() - start_time
+    counts: Dict[str, int] = {}
+    for result in results:
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+    analyzed = counts.get("saved", 0)
+    summary = {
+        "files": len(results),
+        "by_status": counts,
+        "concurrency": concurrency,
+        "elapsed_seconds": round(elapsed, 2),
+        "scripts_per_minute": round(analyzed / elapsed * 60, 2) if elapsed > 0 else 0,
+        "total_bytes_analyzed": sum(r.get("file_size_bytes", 0) for r in results if r["status"] == "saved"),
+        "results": results
+    }
+    logger.info(f"Batch finished: {len(results)} files, {counts} in {elapsed:.1f}s")
+    await emit("summary", summary)
+    return summary
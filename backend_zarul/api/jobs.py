@@ -0,0 +1,224 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import asyncio
+import itertools
+import os
+import time
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Concurrent analyses and queued submissions; submissions beyond the queue are rejected
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "2"))
+ANALYSIS_QUEUE_SIZE = int(os.getenv("ANALYSIS_QUEUE_SIZE", "50"))
+
+# Finished jobs stay readable this long (and at most MAX_FINISHED_JOBS of them)
+JOB_RETENTION_SECONDS = int(os.getenv("ANALYSIS_JOB_RETENTION_SECONDS", "3600"))
+MAX_FINISHED_JOBS = 500
+
+FINISHED_STATUSES = ("completed", "failed")
+
+class QueueFullError(Exception):
+    """Raised when the analysis queue has no room for another job"""
+
+@dataclass
+class AnalysisJob:
+    """One submitted analysis and everything a client can ask about it"""
+    id: str
+    filename: str
+    file_size_bytes: int
+    pdf_path: str
+    content_sha256: Optional[str] = None
+    priority: int = 0  # Higher runs first
+    sequence: int = 0  # Submission order among equal priorities
+    status: str = "queued"  # queued -> running -> completed | failed
+    stage: Optional[str] = None
+    created_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    error_status_code: int = 500
+    changed: asyncio.Event = field(default_factory=asyncio.Event)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def to_dict(self, queue_position: Optional[int] = None) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "filename": self.filename,
+            "file_size_bytes": self.file_size_bytes,
+            "priority": self.priority,
+            "status": self.status,
+            "stage": self.stage,
+            "queue_position": queue_position,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "error": self.error
+        }
+
+JobRunner = Callable[[AnalysisJob], Awaitable[Dict[str, Any]]]
+
+class JobManager:
+    """
+    In-process priority queue of analyses drained by a fixed pool of worker tasks.
+
+    The runner does the actual work and returns the job result; it can report
+    progress through set_stage(). Jobs live in memory only, so they do not
+    survive a restart.
+    """
+
+    def __init__(self, runner: JobRunner, max_workers: int = ANALYSIS_WORKERS, max_queue: int = ANALYSIS_QUEUE_SIZE):
+        self.runner = runner
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._jobs: "OrderedDict[str, AnalysisJob]" = OrderedDict()
+        self._queued: List[str] = []  # Waiting job ids
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._sequence = itertools.count()
+        self._workers: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def start(self) -> None:
+        """Start the worker tasks; call from the serving event loop"""
+        if self._workers:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.PriorityQueue(maxsize=self.max_queue)
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(self.max_workers)]
+        logger.info(f"🧵 Analysis job pool started: {self.max_workers} workers, queue of {self.max_queue}")
+
+    async def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def submit(
+        self,
+        filename: str,
+        file_size_bytes: int,
+        pdf_path: str,
+        priority: int = 0,
+        content_sha256: Optional[str] = None
+    ) -> AnalysisJob:
+        """Queue an analysis of the PDF at pdf_path; the job owns (and deletes) that file"""
+        if self._queue is None:
+            self.start()
+        self._prune()
+
+        job = AnalysisJob(
+            id=str(uuid.uuid4()),
+            filename=filename,
+            file_size_bytes=file_size_bytes,
+            pdf_path=pdf_path,
+            content_sha256=content_sha256,
+            priority=priority,
+            sequence=next(self._sequence)
+        )
+        try:
+            self._queue.put_nowait((-priority, job.sequence, job.id))
+        except asyncio.QueueFull:
+            raise QueueFullError(f"Analysis queue is full ({self.max_queue} jobs waiting)")
+
+        self._jobs[job.id] = job
+        self._queued.append(job.id)
+        logger.info(f"Queued analysis job {job.id} for {filename} (priority {priority}, position {self.queue_position(job)})")
+        return job
+
+    def get(self, job_id: str) -> Optional[AnalysisJob]:
+        return self._jobs.get(job_id)
+
+    def queue_position(self, job: AnalysisJob) -> Optional[int]:
+        """1-based position among waiting jobs; None once the job has started"""
+        if job.id not in self._queued:
+            return None
+        order = (-job.priority, job.sequence)
+        return 1 + sum(
+            1 for job_id in self._queued
+            if (-self._jobs[job_id].priority, self._jobs[job_id].sequence) < order
+        )
+
+    def set_stage(self, job: AnalysisJob, stage: str) -> None:
+        """Record the job's current stage; safe to call from worker threads"""
+        job.stage = stage
+        if self._loop is not None and self._loop.is_running():
+            self._loop.call_soon_threadsafe(self._notify, job)
+
+    def stats(self) -> Dict[str, Any]:
+        counts: Dict[str, int] = {}
+        for job in self._jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {
+            "workers": self.max_workers,
+            "queue_capacity": self.max_queue,
+            "queued": len(self._queued),
+            "jobs": counts
+        }
+
+    def _notify(self, job: AnalysisJob) -> None:
+        """Wake every listener waiting on the job, then arm a fresh event for the next change"""
+        changed, job.changed = job.changed, asyncio.Event()
+        changed.set()
+
+    def _notify_all_queued(self) -> None:
+        for job_id in self._queued:
+            self._notify(self._jobs[job_id])
+
+    def _prune(self) -> None:
+        now = time.time()
+        finished = [job for job in self._jobs.values() if job.finished]
+        expired = [
+            job for job in finished
+            if now - job.finished_at.timestamp() > JOB_RETENTION_SECONDS
+        ]
+        expired += finished[:max(len(finished) - len(expired) - MAX_FINISHED_JOBS, 0)]
+        for job in expired:
+            self._jobs.pop(job.id, None)
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            _, _, job_id = await self._queue.get()
+            job = self._jobs.get(job_id)
+            try:
+                if job is not None:
+                    await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: AnalysisJob) -> None:
+        self._queued.remove(job.id)
+        self._notify_all_queued()  # Everyone behind this job moved up
+
+        job.status = "running"
+        job.started_at = datetime.now(timezone.utc)
+        self._notify(job)
+        logger.info(f"Running analysis job {job.id} for {job.filename}")
+
+        try:
+            job.result = await self.runner(job)
+            job.status = "completed"
+            logger.info(f"✅ Analysis job {job.id} completed")
+        except asyncio.CancelledError:
+            job.status = "failed"
+            job.error = "Analysis was cancelled"
+            raise
+        except Exception as e:
+            job.status = "failed"
+            job.error = getattr(e, "detail", None) or str(e)
+            job.error_status_code = getattr(e, "status_code", 500)
+            logger.error(f"❌ Analysis job {job.id} failed: {job.error}")
+        finally:
+            job.finished_at = datetime.now(timezone.utc)
+            self._notify(job)
+            if job.pdf_path and os.path.exists(job.pdf_path):
+                try:
+                    os.unlink(job.pdf_path)
+                except Exception as cleanup_error:
+                    logger.warning(f"Failed to cleanup temp file: {cleanup_error}")
@@ -1,14 +1,34 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from .validators import FileValidator
+
+# Single-PDF upload routes; their bodies are the PDF plus a little multipart framing
+SINGLE_UPLOAD_PATHS = ("/analyze-script", "/analysis-jobs")
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
 
 def setup_middleware(app: FastAPI):
-    """Setup all middleware for the FastAPI app"""
+    """Setup all middleware for the FastAPI app (the last one added runs outermost)"""
+    
+    max_upload_bytes = FileValidator().max_file_size + MULTIPART_OVERHEAD_BYTES
+    
+    @app.middleware("http")
+    async def reject_oversized_uploads(request: Request, call_next):
+        """Refuse an oversized upload from its Content-Length, before the body is received"""
+        if request.method == "POST" and request.url.path in SINGLE_UPLOAD_PATHS:
+            content_length = request.headers.get("content-length")
+            if content_length and content_length.isdigit() and int(content_length) > max_upload_bytes:
+                return JSONResponse(
+                    status_code=413,
+                    content={"detail": f"File too large. Maximum size is {FileValidator().max_file_size // (1024*1024)}MB"}
+                )
+        return await call_next(request)
     
-    # Add CORS middleware
+    # Added last so it wraps everything above: early rejections like the 413 carry CORS headers too
     app.add_middleware(
         CORSMiddleware,
         allow_origins=["*"],
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
-    )
\ No newline at end of file
+    )
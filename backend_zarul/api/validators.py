@@ -1,5 +1,5 @@
 from fastapi import HTTPException, UploadFile
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, Field, field_validator, model_validator
 from typing import Optional, Dict, Any, List
 from agents.states.states import ComprehensiveAnalysis
 from datetime import datetime
@@ -30,7 +30,15 @@ class FileValidator:
     
     def validate_file_size(self, content: bytes) -> int:
         """Validate file size after reading content"""
-        file_size = len(content)
+        return self.validate_size(len(content))
+    
+    def validate_size(self, file_size: Optional[int], complete: bool = True) -> Optional[int]:
+        """
+        Validate a byte count. Partial counts of an upload that is still being
+        streamed (complete=False) are only checked against the maximum.
+        """
+        if file_size is None:
+            return None
         
         if file_size > self.max_file_size:
             raise HTTPException(
@@ -38,7 +46,7 @@ class FileValidator:
                 detail=f"File too large. Maximum size is {self.max_file_size // (1024*1024)}MB"
             )
         
-        if file_size < self.min_file_size:
+        if complete and file_size < self.min_file_size:
             raise HTTPException(
                 status_code=400,
                 detail="File too small. Please provide a valid PDF script"
@@ -52,9 +60,15 @@ class SaveAnalysisRequest(BaseModel):
     filename: str = Field(description="Original filename")
     original_filename: Optional[str] = Field(None, description="Original filename if different")
     file_size_bytes: int = Field(description="File size in bytes", gt=0)
-    analysis_data: Dict[str, Any] = Field(description="Complete analysis results as dict")  # ✅ CHANGED
+    analysis_data: Optional[Dict[str, Any]] = Field(None, description="Complete analysis results as dict")  # ✅ CHANGED
+    analysis_handle: Optional[str] = Field(None, description="Handle from a compact analysis response, instead of analysis_data")
     processing_time_seconds: Optional[float] = Field(None, description="Processing time", ge=0)
     api_calls_used: int = Field(default=2, description="Number of API calls used", ge=1)
+    workflow_thread_id: Optional[str] = Field(None, description="Checkpoint thread of the analysis run, enables resuming it with feedback")
+    stage_metrics: Optional[List[Dict[str, Any]]] = Field(None, description="Per-stage timings of the analysis run")
+    content_sha256: Optional[str] = Field(None, description="SHA-256 of the analyzed PDF")
+    text_sha256: Optional[str] = Field(None, description="SHA-256 of the normalized script text")
+    rate_card_version: Optional[str] = Field(None, description="Version of the rate card the costs were priced with")
     
     @field_validator('filename')
     @classmethod
@@ -72,6 +86,12 @@ class SaveAnalysisRequest(BaseModel):
             raise ValueError('File size too large')
         return v
     
+    @model_validator(mode='after')
+    def validate_analysis_source(self):
+        if self.analysis_data is None and not self.analysis_handle:
+            raise ValueError('Either analysis_data or analysis_handle is required')
+        return self
+    
     # ✅ NEW: Validate analysis_data structure
     @field_validator('analysis_data')
     @classmethod
@@ -104,6 +124,9 @@ class AnalysisMetadata(BaseModel):
     processing_time_seconds: float = Field(description="Processing time")
     timestamp: str = Field(description="Analysis timestamp")
     api_calls_used: int = Field(default=2, description="Number of API calls used")
+    coalesced: bool = Field(default=False, description="Served by an identical analysis already in flight")
+    duplicate_of: Optional[str] = Field(None, description="Saved analysis of the same PDF or script text")
+    analysis_handle: Optional[str] = Field(None, description="Server-side handle of the analysis for /save-analysis")
 
 class OptimizationInfo(BaseModel):
     """Optimization information"""
@@ -116,9 +139,30 @@ class AnalyzeScriptResponse(BaseModel):
     message: str = Field(description="Response message")
     optimization_info: OptimizationInfo = Field(description="API optimization details")
     metadata: AnalysisMetadata = Field(description="Analysis metadata")
-    data: ComprehensiveAnalysis = Field(description="Complete analysis results")
+    data: Optional[ComprehensiveAnalysis] = Field(None, description="Complete analysis results (omitted in compact mode)")
+    analysis_data: Optional[Dict[str, Any]] = Field(None, description="Analysis, limited to the requested fields in compact mode")
     database_id: Optional[str] = Field(None, description="Database record ID if saved")
     database_error: Optional[str] = Field(None, description="Database error if occurred")
+    cost_provenance: List[Dict[str, Any]] = Field(default=[], description="Rate-card lines behind every scene cost")
+
+class AnalysisJobResponse(BaseModel):
+    """Status of a queued analysis job"""
+    success: bool = Field(default=True, description="Request success status")
+    job_id: str = Field(description="Job ID")
+    filename: str = Field(description="Uploaded filename")
+    file_size_bytes: int = Field(description="File size in bytes")
+    priority: int = Field(default=0, description="Higher priorities run first")
+    status: str = Field(description="queued, running, completed or failed")
+    stage: Optional[str] = Field(None, description="Pipeline stage currently running")
+    queue_position: Optional[int] = Field(None, description="1-based position among waiting jobs, null once started")
+    attempts: Optional[int] = Field(None, description="Attempts so far (durable queue only)")
+    created_at: str = Field(description="Submission time")
+    started_at: Optional[str] = Field(None, description="Start time")
+    finished_at: Optional[str] = Field(None, description="Completion time")
+    error: Optional[str] = Field(None, description="Failure reason")
+    status_url: Optional[str] = Field(None, description="Poll this for status")
+    result_url: Optional[str] = Field(None, description="Analysis result once completed")
+    events_url: Optional[str] = Field(None, description="Server-Sent Events stream of status changes")
 
 class DatabaseScriptResponse(BaseModel):
     """Response model for database operations"""
@@ -195,4 +239,70 @@ class HumanFeedbackResponse(BaseModel):
     script_id: str = Field(description="Script ID")
     feedback_processed: bool = Field(description="Whether feedback was processed")
     action_taken: str = Field(description="Action taken based on feedback")
-    status: str = Field(description="Updated script status")
\ No newline at end of file
+    status: str = Field(description="Updated script status")
+    workflow_resumed: bool = Field(default=False, description="Whether the checkpointed analysis workflow was resumed")
+
+# What-if budget recalculation
+class WhatIfRequest(BaseModel):
+    """Request model for recalculating a saved budget under hypothetical changes"""
+    cast_rate_overrides: Dict[str, float] = Field(default={}, description="Character name or cast role key (e.g. lead_actor) -> day rate")
+    location_rate_overrides: Dict[str, float] = Field(default={}, description="Location rate key (e.g. studio) -> day rate")
+    location_swaps: Dict[str, str] = Field(default={}, description="Location name or rate key -> location rate key to shoot it as")
+    unit_rate_overrides: Dict[str, float] = Field(default={}, description="Scalar rates such as crew_daily, prop_rate, permit_cost")
+    include_scenes: Optional[List[int]] = Field(None, description="Only price these scene numbers")
+    exclude_scenes: List[int] = Field(default=[], description="Scene numbers to leave out")
+    include_scene_costs: bool = Field(default=False, description="Return per-scene costs as well as totals")
+    
+    @field_validator('cast_rate_overrides', 'location_rate_overrides', 'unit_rate_overrides')
+    @classmethod
+    def validate_rates(cls, v):
+        negative = [key for key, value in v.items() if value < 0]
+        if negative:
+            raise ValueError(f'Rates cannot be negative: {negative}')
+        return v
+
+class WhatIfResponse(BaseModel):
+    """Response model for what-if budget recalculation"""
+    success: bool = Field(description="Recalculation success status")
+    script_id: str = Field(description="Script ID")
+    cost_breakdown: Dict[str, Any] = Field(description="Recalculated CostBreakdown")
+    baseline_total: float = Field(description="Total cost without overrides")
+    delta_total: float = Field(description="Recalculated total minus baseline total")
+    scenes_priced: int = Field(description="Number of scenes included")
+    unmatched_overrides: List[str] = Field(default=[], description="Overrides that matched nothing in the script")
+    computation_ms: float = Field(description="Time spent recalculating")
+
+class BudgetSimulationResponse(BaseModel):
+    """Response model for Monte Carlo budget simulation"""
+    success: bool = Field(description="Simulation success status")
+    script_id: str = Field(description="Script ID")
+    iterations: int = Field(description="Number of simulated budgets")
+    scenes_simulated: int = Field(description="Number of scenes included")
+    categories: Dict[str, Dict[str, float]] = Field(description="P10/P50/P90 and mean per cost category")
+    total: Dict[str, float] = Field(description="P10/P50/P90 and mean of the total budget")
+    point_estimate: float = Field(description="Deterministic total from the rate card point rates")
+    computation_ms: float = Field(description="Time spent simulating")
+
+class RateResolveRequest(BaseModel):
+    """Request model for resolving free-text attributes to rate-card records"""
+    category: str = Field(description="Rate card category, e.g. location_costs or cast_rates")
+    queries: List[str] = Field(description="Free-text locations, roles or items to resolve")
+    min_confidence: float = Field(default=0.45, ge=0, le=1, description="Matches below this are reported as unmatched")
+    
+    @field_validator('queries')
+    @classmethod
+    def validate_queries(cls, v):
+        if len(v) > 20000:
+            raise ValueError('Too many queries (max 20000)')
+        return v
+
+class PortfolioChatRequest(BaseModel):
+    """Request model for questions across all analyzed scripts"""
+    message: str = Field(description="Question about the whole slate of analyzed scripts")
+    
+    @field_validator('message')
+    @classmethod
+    def validate_message(cls, v):
+        if not v or not v.strip():
+            raise ValueError('Message cannot be empty')
+        return v.strip()
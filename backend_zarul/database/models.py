@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Float, JSON, Boolean
+from sqlalchemy import Column, Integer, String, Text, DateTime, Float, JSON, Boolean, LargeBinary, event, inspect
+from sqlalchemy.orm import deferred
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime, timezone
 import uuid
@@ -24,7 +25,7 @@ class AnalyzedScript(Base):
     # Processing metadata
     processing_time_seconds = Column(Float, nullable=True)
     api_calls_used = Column(Integer, default=2)
-    status = Column(String(50), default="completed", index=True)  # Valid statuses: "completed", "error", "pending_review", "completed_with_feedback", "needs_revision"
+    status = Column(String(50), default="completed", index=True)  # Valid statuses: "completed", "error", "pending_review", "completed_with_feedback", "needs_revision", "saving"
     
     # Error tracking
     error_message = Column(Text, nullable=True)
@@ -36,6 +37,23 @@ class AnalyzedScript(Base):
     estimated_budget = Column(Float, nullable=True)
     budget_category = Column(String(20), nullable=True)
     
+    # Rate card the cost breakdown was last priced with
+    rate_card_version = Column(String(64), nullable=True, index=True)
+    repriced_at = Column(DateTime, nullable=True)
+    
+    # Precomputed chat artifact (summary, compact scene table, entity indexes)
+    chat_context = Column(JSON, nullable=True)
+    
+    # Checkpoint thread of the analysis workflow run, used to resume it with feedback
+    workflow_thread_id = Column(String(64), nullable=True)
+    
+    # Per-stage wall time, CPU time and sampled peak memory of the analysis pipeline
+    stage_metrics = Column(JSON, nullable=True)
+    
+    # SHA-256 of the uploaded PDF bytes and of the normalized extracted text, for duplicate lookups
+    content_sha256 = Column(String(64), nullable=True, index=True)
+    text_sha256 = Column(String(64), nullable=True, index=True)
+    
     # FIXED: Correct timestamp handling
     created_at = Column(
         DateTime, 
@@ -71,10 +89,30 @@ class AnalyzedScript(Base):
             "total_locations": self.total_locations,
             "estimated_budget": self.estimated_budget,
             "budget_category": self.budget_category,
+            "rate_card_version": self.rate_card_version,
+            "repriced_at": self.repriced_at.isoformat() if self.repriced_at else None,
+            "workflow_thread_id": self.workflow_thread_id,
+            "stage_metrics": self.stage_metrics,
+            "content_sha256": self.content_sha256,
+            "text_sha256": self.text_sha256,
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None
         }
     
+    def to_analysis_dict(self):
+        """Return the stored ComprehensiveAnalysis sections as a plain dict"""
+        return {
+            "script_data": self.script_data or {},
+            "cast_breakdown": self.cast_breakdown or {},
+            "cost_breakdown": self.cost_breakdown or {},
+            "location_breakdown": self.location_breakdown or {},
+            "props_breakdown": self.props_breakdown or {}
+        }
+    
+    def analysis_version(self) -> str:
+        """Version tag of the stored analysis, changes whenever the row is updated"""
+        return self.updated_at.isoformat() if self.updated_at else ""
+    
     def to_summary_dict(self):
         """Convert to summary dictionary for list views"""
         return {
@@ -90,4 +128,123 @@ class AnalyzedScript(Base):
         }
     
     def __repr__(self):
-        return f"<AnalyzedScript(id={self.id}, filename={self.filename}, status={self.status})>"
\ No newline at end of file
+        return f"<AnalyzedScript(id={self.id}, filename={self.filename}, status={self.status})>"
+
+# Columns whose change makes the precomputed chat context stale
+CHAT_CONTEXT_SOURCES = ["script_data", "cast_breakdown", "cost_breakdown", "location_breakdown", "props_breakdown", "filename"]
+
+@event.listens_for(AnalyzedScript, "before_update")
+def invalidate_chat_context(mapper, connection, target):
+    """Drop the stored chat context whenever the analysis it was built from changes"""
+    state = inspect(target)
+    if state.attrs.chat_context.history.has_changes():
+        return
+    if any(state.attrs[name].history.has_changes() for name in CHAT_CONTEXT_SOURCES):
+        target.chat_context = None
+
+class ChatSession(Base):
+    __tablename__ = "chat_sessions"
+    
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    script_id = Column(String, nullable=False, index=True)
+    
+    # Rolling summary of turns that no longer fit the history window
+    summary = Column(Text, nullable=True)
+    summarized_through_id = Column(Integer, default=0, nullable=False)
+    message_count = Column(Integer, default=0, nullable=False)
+    
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    updated_at = Column(
+        DateTime,
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc),
+        nullable=False
+    )
+    
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "script_id": self.script_id,
+            "summary": self.summary,
+            "message_count": self.message_count,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None
+        }
+    
+    def __repr__(self):
+        return f"<ChatSession(id={self.id}, script_id={self.script_id}, messages={self.message_count})>"
+
+class ChatMessage(Base):
+    __tablename__ = "chat_messages"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    session_id = Column(String, nullable=False, index=True)
+    role = Column(String(20), nullable=False)  # "user" or "assistant"
+    content = Column(Text, nullable=False)
+    token_estimate = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "role": self.role,
+            "content": self.content,
+            "created_at": self.created_at.isoformat() if self.created_at else None
+        }
+
+class ScriptEntity(Base):
+    __tablename__ = "script_entities"
+    
+    # One row per distinct character / location / special requirement / prop of a script
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    script_id = Column(String, nullable=False, index=True)
+    entity_type = Column(String(32), nullable=False)
+    name = Column(String(255), nullable=False)
+    normalized_name = Column(String(255), nullable=False)
+    scene_count = Column(Integer, nullable=False, default=0)
+
+
+class AnalysisJobRecord(Base):
+    __tablename__ = "analysis_jobs"
+    
+    # Durable analysis queue, claimed by worker.py processes with FOR UPDATE SKIP LOCKED
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    filename = Column(String(255), nullable=False)
+    file_size_bytes = Column(Integer, nullable=False)
+    pdf_data = deferred(Column(LargeBinary, nullable=True))  # Cleared once the job finishes
+    content_sha256 = Column(String(64), nullable=True)  # Hash of pdf_data, saves the worker re-hashing it
+    priority = Column(Integer, nullable=False, default=0)  # Higher runs first
+    status = Column(String(20), nullable=False, default="queued")  # queued, running, completed, failed
+    stage = Column(String(64), nullable=True)
+    
+    # Retry and lease bookkeeping
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    available_at = Column(DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    locked_by = Column(String(128), nullable=True)
+    locked_until = Column(DateTime, nullable=True)
+    
+    result = deferred(Column(JSON, nullable=True))  # analysis_response() parts
+    error = Column(Text, nullable=True)
+    error_status_code = Column(Integer, nullable=True)
+    
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    
+    def to_dict(self, queue_position=None):
+        """Same shape as the in-process job status"""
+        return {
+            "job_id": self.id,
+            "filename": self.filename,
+            "file_size_bytes": self.file_size_bytes,
+            "priority": self.priority,
+            "status": self.status,
+            "stage": self.stage,
+            "queue_position": queue_position,
+            "attempts": self.attempts,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "error": self.error
+        }
@@ -1,14 +1,72 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import desc, asc, func, text
+from sqlalchemy.orm import Session, undefer
+from sqlalchemy import desc, asc, func, text, insert, exists, or_, update
 from sqlalchemy.exc import SQLAlchemyError
-from database.models import AnalyzedScript
+from database.models import AnalyzedScript, ChatSession, ChatMessage, ScriptEntity, AnalysisJobRecord
+from agents.tools.chat_context import build_chat_context, chat_context_cache, is_current
+from agents.tools.answer_cache import chat_answer_cache
+from agents.tools.portfolio_queries import extract_script_entities, ENTITY_TYPES
+from agents.tools.script_queries import normalize_question
+from agents.tools.chat_history import split_history, summarize_turns, estimate_tokens
+from agents.tools.stage_metrics import track_stage, current_recorder
 from typing import List, Optional, Dict, Any, Union
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+import os
+import random
 import uuid
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Status of the placeholder row /analyze-and-save writes before its background save
+SAVING_STATUS = "saving"
+
+# Columns added after the table was first released: (name, DDL type)
+ADDITIVE_COLUMNS = [
+    ("rate_card_version", "VARCHAR(64)"),
+    ("repriced_at", "TIMESTAMP WITH TIME ZONE"),
+    ("chat_context", "JSON"),
+    ("workflow_thread_id", "VARCHAR(64)"),
+    ("stage_metrics", "JSON"),
+    ("content_sha256", "VARCHAR(64)"),
+    ("text_sha256", "VARCHAR(64)"),
+]
+
+_additive_columns_ensured = False
+
+def ensure_additive_columns(db: Session):
+    """Add columns introduced after the initial schema to existing tables (once per process)"""
+    global _additive_columns_ensured
+    if _additive_columns_ensured:
+        return
+    
+    try:
+        for name, ddl_type in ADDITIVE_COLUMNS:
+            db.execute(text(f"ALTER TABLE analyzed_scripts ADD COLUMN IF NOT EXISTS {name} {ddl_type}"))
+        
+        db.execute(text("""
+            CREATE INDEX IF NOT EXISTS idx_analyzed_scripts_rate_card_version 
+            ON analyzed_scripts(rate_card_version);
+        """))
+        
+        db.execute(text("""
+            CREATE INDEX IF NOT EXISTS idx_analyzed_scripts_content_sha256 
+            ON analyzed_scripts(content_sha256);
+        """))
+        
+        db.execute(text("""
+            CREATE INDEX IF NOT EXISTS idx_analyzed_scripts_text_sha256 
+            ON analyzed_scripts(text_sha256);
+        """))
+        
+        db.commit()
+        _additive_columns_ensured = True
+        logger.debug("✅ analyzed_scripts additive columns ensured")
+        
+    except Exception as e:
+        logger.error(f"❌ Error ensuring additive columns: {e}")
+        db.rollback()
+        raise
+
 def ensure_analyzed_scripts_table(db: Session):
     """Ensure the analyzed_scripts table exists with all required columns"""
     try:
@@ -43,6 +101,13 @@ def ensure_analyzed_scripts_table(db: Session):
                     total_locations INTEGER,
                     estimated_budget FLOAT,
                     budget_category VARCHAR(20),
+                    rate_card_version VARCHAR(64),
+                    repriced_at TIMESTAMP WITH TIME ZONE,
+                    chat_context JSON,
+                    workflow_thread_id VARCHAR(64),
+                    stage_metrics JSON,
+                    content_sha256 VARCHAR(64),
+                    text_sha256 VARCHAR(64),
                     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
                     updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
                 );
@@ -68,12 +133,156 @@ def ensure_analyzed_scripts_table(db: Session):
             logger.info("✅ analyzed_scripts table created/fixed successfully")
         else:
             logger.debug("✅ analyzed_scripts table already exists with id column")
+        
+        ensure_additive_columns(db)
             
     except Exception as e:
         logger.error(f"❌ Error ensuring table exists: {e}")
         db.rollback()
         raise
 
+_chat_tables_ensured = False
+
+def ensure_chat_tables(db: Session):
+    """Ensure the chat_sessions and chat_messages tables exist (once per process)"""
+    global _chat_tables_ensured
+    if _chat_tables_ensured:
+        return
+    
+    try:
+        db.execute(text("""
+            CREATE TABLE IF NOT EXISTS chat_sessions (
+                id VARCHAR PRIMARY KEY DEFAULT gen_random_uuid()::text,
+                script_id VARCHAR NOT NULL,
+                summary TEXT,
+                summarized_through_id INTEGER NOT NULL DEFAULT 0,
+                message_count INTEGER NOT NULL DEFAULT 0,
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+            );
+        """))
+        
+        db.execute(text("""
+            CREATE TABLE IF NOT EXISTS chat_messages (
+                id SERIAL PRIMARY KEY,
+                session_id VARCHAR NOT NULL,
+                role VARCHAR(20) NOT NULL,
+                content TEXT NOT NULL,
+                token_estimate INTEGER NOT NULL DEFAULT 0,
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+            );
+        """))
+        
+        db.execute(text("""
+            CREATE INDEX IF NOT EXISTS idx_chat_sessions_script_id 
+            ON chat_sessions(script_id);
+        """))
+        
+        db.execute(text("""
+            CREATE INDEX IF NOT EXISTS idx_chat_messages_session_id 
+            ON chat_messages(session_id, id);
+        """))
+        
+        db.commit()
+        _chat_tables_ensured = True
+        logger.debug("✅ chat tables ensured")
+        
+    except Exception as e:
+        logger.error(f"❌ Error ensuring chat tables: {e}")
+        db.rollback()
+        raise
+
+_script_entities_ensured = False
+
+def ensure_script_entities_table(db: Session):
+    """Ensure the cross-script entity index table exists (once per process)"""
+    global _script_entities_ensured
+    if _script_entities_ensured:
+        return
+    
+    try:
+        db.execute(text("""
+            CREATE TABLE IF NOT EXISTS script_entities (
+                id SERIAL PRIMARY KEY,
+                script_id VARCHAR NOT NULL,
+                entity_type VARCHAR(32) NOT NULL,
+                name VARCHAR(255) NOT NULL,
+                normalized_name VARCHAR(255) NOT NULL,
+                scene_count INTEGER NOT NULL DEFAULT 0
+            );
+        """))
+        
+        db.execute(text("""
+            CREATE INDEX IF NOT EXISTS idx_script_entities_script_id 
+            ON script_entities(script_id);
+        """))
+        
+        db.execute(text("""
+            CREATE INDEX IF NOT EXISTS idx_script_entities_type_name 
+            ON script_entities(entity_type, normalized_name);
+        """))
+        
+        db.commit()
+        _script_entities_ensured = True
+        logger.debug("✅ script_entities table ensured")
+        
+    except Exception as e:
+        logger.error(f"❌ Error ensuring script_entities table: {e}")
+        db.rollback()
+        raise
+
+_analysis_jobs_ensured = False
+
+def ensure_analysis_jobs_table(db: Session):
+    """Ensure the durable analysis queue table exists (once per process)"""
+    global _analysis_jobs_ensured
+    if _analysis_jobs_ensured:
+        return
+    
+    try:
+        db.execute(text("""
+            CREATE TABLE IF NOT EXISTS analysis_jobs (
+                id VARCHAR PRIMARY KEY,
+                filename VARCHAR(255) NOT NULL,
+                file_size_bytes INTEGER NOT NULL,
+                pdf_data BYTEA,
+                content_sha256 VARCHAR(64),
+                priority INTEGER NOT NULL DEFAULT 0,
+                status VARCHAR(20) NOT NULL DEFAULT 'queued',
+                stage VARCHAR(64),
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL DEFAULT 3,
+                available_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                locked_by VARCHAR(128),
+                locked_until TIMESTAMP WITH TIME ZONE,
+                result JSON,
+                error TEXT,
+                error_status_code INTEGER,
+                created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                started_at TIMESTAMP WITH TIME ZONE,
+                finished_at TIMESTAMP WITH TIME ZONE
+            );
+        """))
+        
+        # Tables created before the PDF hash was stored with the job
+        db.execute(text("ALTER TABLE analysis_jobs ADD COLUMN IF NOT EXISTS content_sha256 VARCHAR(64)"))
+        
+        # Claim order: the partial index covers only jobs a worker could pick up
+        db.execute(text("""
+            CREATE INDEX IF NOT EXISTS idx_analysis_jobs_claim 
+            ON analysis_jobs(priority DESC, available_at, created_at) 
+            WHERE status IN ('queued', 'running');
+        """))
+        
+        db.commit()
+        _analysis_jobs_ensured = True
+        logger.debug("✅ analysis_jobs table ensured")
+        
+    except Exception as e:
+        logger.error(f"❌ Error ensuring analysis_jobs table: {e}")
+        db.rollback()
+        raise
+
 class AnalyzedScriptService:
     
     @staticmethod
@@ -84,22 +293,40 @@ class AnalyzedScriptService:
         file_size_bytes: int,
         analysis_data: Dict[str, Any],
         processing_time: Optional[float] = None,
-        api_calls_used: int = 2
+        api_calls_used: int = 2,
+        workflow_thread_id: Optional[str] = None,
+        stage_metrics: Optional[List[Dict[str, Any]]] = None,
+        content_sha256: Optional[str] = None,
+        text_sha256: Optional[str] = None,
+        rate_card_version: Optional[str] = None,
+        script_id: Optional[str] = None,
+        record_errors: bool = True
     ) -> AnalyzedScript:
-        """Create a new analyzed script record with automatic table creation"""
+        """
+        Create a new analyzed script record with automatic table creation
+        
+        stage_metrics from the analysis run are stored together with the timings of
+        this save, when it runs under a stage recorder. rate_card_version is the rate
+        card the cost engine priced the analysis with; without it the costs are the
+        model's and reprice_scripts.py picks the record up. script_id fixes the record id
+        in advance and fills in its placeholder row, if any. A failed save is stored as an error record under the same id,
+        or raised when record_errors is False (callers that retry).
+        """
         
         # Ensure table exists before any operation
         ensure_analyzed_scripts_table(db)
         
         try:
-            # Extract analysis data safely
-            extracted_data = AnalyzedScriptService._extract_analysis_data(analysis_data)
-            
-            # Extract metadata for quick access
-            metadata = AnalyzedScriptService._extract_metadata(extracted_data)
+            with track_stage("db_prepare"):
+                # Extract analysis data safely
+                extracted_data = AnalyzedScriptService._extract_analysis_data(analysis_data)
+                
+                # Extract metadata for quick access
+                metadata = AnalyzedScriptService._extract_metadata(extracted_data)
+                chat_context = AnalyzedScriptService._safe_chat_context(extracted_data, filename)
             
             analyzed_script = AnalyzedScript(
-                id=str(uuid.uuid4()),
+                id=script_id or str(uuid.uuid4()),
                 filename=filename,
                 original_filename=original_filename,
                 file_size_bytes=file_size_bytes,
@@ -115,23 +342,49 @@ class AnalyzedScriptService:
                 total_characters=metadata.get('total_characters'),
                 total_locations=metadata.get('total_locations'),
                 estimated_budget=metadata.get('estimated_budget'),
-                budget_category=metadata.get('budget_category')
+                budget_category=metadata.get('budget_category'),
+                chat_context=chat_context,
+                workflow_thread_id=workflow_thread_id,
+                stage_metrics=stage_metrics,
+                content_sha256=content_sha256,
+                text_sha256=text_sha256,
+                rate_card_version=rate_card_version
             )
             
-            db.add(analyzed_script)
+            with track_stage("db_insert"):
+                if script_id:
+                    # Replaces the placeholder row of a write-behind save
+                    analyzed_script = db.merge(analyzed_script)
+                else:
+                    db.add(analyzed_script)
+                db.flush()
+            
+            # The insert timing can only be stored once it is known: one small update in the same transaction
+            recorder = current_recorder()
+            if recorder is not None and recorder.stages:
+                analyzed_script.stage_metrics = (stage_metrics or []) + recorder.stages
+            
             db.commit()
             db.refresh(analyzed_script)
             
             logger.info(f"Successfully created analyzed script: {analyzed_script.id}")
+            
+            try:
+                PortfolioService.index_script_entities(db, analyzed_script.id, extracted_data)
+            except Exception as e:
+                logger.warning(f"Failed to index entities for script {analyzed_script.id}: {str(e)}")
+            
             return analyzed_script
             
         except Exception as e:
             db.rollback()
             logger.error(f"Failed to create analyzed script: {str(e)}")
+            if not record_errors:
+                raise
             
             # Create error record
             error_script = AnalyzedScript(
-                id=str(uuid.uuid4()),
+                id=script_id or str(uuid.uuid4()),
                 filename=filename,
                 original_filename=original_filename,
                 file_size_bytes=file_size_bytes,
@@ -142,7 +395,10 @@ class AnalyzedScriptService:
             )
             
             try:
-                db.add(error_script)
+                if script_id:
+                    error_script = db.merge(error_script)
+                else:
+                    db.add(error_script)
                 db.commit()
                 db.refresh(error_script)
                 return error_script
@@ -151,6 +407,135 @@ class AnalyzedScriptService:
                 logger.error(f"Failed to create error record: {str(db_error)}")
                 raise Exception(f"Database operation failed: {str(e)}")
     
+    @staticmethod
+    def create_placeholder(db: Session, script_id: str, filename: str, file_size_bytes: int) -> AnalyzedScript:
+        """
+        Reserve script_id for a write-behind save: a row with status 'saving' that every
+        API process can see until create_analyzed_script fills it in.
+        """
+        
+        ensure_analyzed_scripts_table(db)
+        
+        try:
+            placeholder = AnalyzedScript(
+                id=script_id,
+                filename=filename,
+                original_filename=filename,
+                file_size_bytes=file_size_bytes,
+                status=SAVING_STATUS
+            )
+            db.add(placeholder)
+            db.commit()
+            return placeholder
+        except SQLAlchemyError as e:
+            db.rollback()
+            logger.error(f"Database error in create_placeholder: {str(e)}")
+            raise Exception(f"Failed to reserve script {script_id}: {str(e)}")
+    
+    @staticmethod
+    def expire_placeholder(db: Session, script_id: str, older_than: datetime) -> bool:
+        """Mark a 'saving' row created before older_than as failed (its save was lost); True if it was"""
+        
+        try:
+            expired = db.execute(
+                update(AnalyzedScript)
+                .where(
+                    AnalyzedScript.id == script_id,
+                    AnalyzedScript.status == SAVING_STATUS,
+                    AnalyzedScript.created_at < older_than
+                )
+                .values(status="error", error_message="The save was interrupted before the analysis was stored; analyze the script again")
+            ).rowcount
+            db.commit()
+            return bool(expired)
+        except SQLAlchemyError as e:
+            db.rollback()
+            logger.error(f"Database error in expire_placeholder: {str(e)}")
+            raise Exception(f"Failed to expire placeholder {script_id}: {str(e)}")
+    
+    @staticmethod
+    def find_by_hash(db: Session, sha256: str, id_only: bool = False) -> Optional[Union[AnalyzedScript, str]]:
+        """
+        Most recent successful analysis whose PDF bytes or normalized text hash to sha256.
+        
+        Returns the record, or only its id when id_only is set; None without a match.
+        """
+        ensure_analyzed_scripts_table(db)
+        
+        try:
+            query = db.query(AnalyzedScript.id if id_only else AnalyzedScript).filter(
+                or_(AnalyzedScript.content_sha256 == sha256, AnalyzedScript.text_sha256 == sha256),
+                AnalyzedScript.status != "error"
+            ).order_by(desc(AnalyzedScript.created_at))
+            match = query.first()
+            if match is None:
+                return None
+            return match[0] if id_only else match
+        except SQLAlchemyError as e:
+            logger.error(f"Failed to look up script by hash {sha256[:16]}: {str(e)}")
+            return None
+    
+    @staticmethod
+    def get_stage_metrics(db: Session, since: datetime, limit: int = 5000) -> List[List[Dict[str, Any]]]:
+        """Stage metric lists of the most recent scripts created since the given time"""
+        
+        ensure_analyzed_scripts_table(db)
+        
+        try:
+            rows = db.query(AnalyzedScript.stage_metrics).filter(
+                AnalyzedScript.created_at >= since,
+                AnalyzedScript.stage_metrics.isnot(None)
+            ).order_by(desc(AnalyzedScript.created_at)).limit(limit).all()
+            return [row.stage_metrics for row in rows]
+            
+        except SQLAlchemyError as e:
+            logger.error(f"Database error in get_stage_metrics: {str(e)}")
+            raise Exception(f"Failed to retrieve stage metrics: {str(e)}")
+    
+    @staticmethod
+    def update_analysis(
+        db: Session,
+        script_id: str,
+        analysis_data: Dict[str, Any],
+        status: str = "completed",
+        rate_card_version: Optional[str] = None
+    ) -> Optional[AnalyzedScript]:
+        """Replace the stored analysis of a script, e.g. after a feedback-driven re-analysis"""
+        
+        ensure_analyzed_scripts_table(db)
+        
+        try:
+            script = db.query(AnalyzedScript).filter(AnalyzedScript.id == script_id).first()
+            if not script:
+                return None
+            
+            extracted_data = AnalyzedScriptService._extract_analysis_data(analysis_data)
+            metadata = AnalyzedScriptService._extract_metadata(extracted_data)
+            
+            for section in ('script_data', 'cast_breakdown', 'cost_breakdown', 'location_breakdown', 'props_breakdown'):
+                setattr(script, section, extracted_data.get(section))
+            for field in ('total_scenes', 'total_characters', 'total_locations', 'estimated_budget', 'budget_category'):
+                setattr(script, field, metadata.get(field))
+            script.status = status
+            script.rate_card_version = rate_card_version
+            db.commit()
+            db.refresh(script)
+            chat_context_cache.invalidate(script_id)
+            chat_answer_cache.invalidate(script_id)
+            
+            try:
+                PortfolioService.index_script_entities(db, script_id, extracted_data)
+            except Exception as e:
+                logger.warning(f"Failed to re-index entities for script {script_id}: {str(e)}")
+            
+            logger.info(f"Updated analysis of script {script_id}")
+            return script
+            
+        except SQLAlchemyError as e:
+            db.rollback()
+            logger.error(f"Database error in update_analysis: {str(e)}")
+            raise Exception(f"Failed to update analysis of {script_id}: {str(e)}")
+    
     @staticmethod
     def _extract_analysis_data(analysis_data: Dict[str, Any]) -> Dict[str, Any]:
         """Safely extract analysis data from various formats"""
@@ -189,6 +574,61 @@ class AnalyzedScriptService:
             logger.error(f"Failed to extract analysis data: {str(e)}")
             return {}
     
+    @staticmethod
+    def _safe_chat_context(analysis_dict: Dict[str, Any], script_title: str) -> Optional[Dict[str, Any]]:
+        """Build the chat artifact at save time; chat rebuilds it lazily if this fails"""
+        try:
+            return build_chat_context(analysis_dict, script_title)
+        except Exception as e:
+            logger.warning(f"Failed to build chat context: {str(e)}")
+            return None
+    
+    @staticmethod
+    def get_chat_context(db: Session, script_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the precomputed chat artifact for a script.
+        
+        Served from memory when the analysis version matches, else from the row, else built
+        from the stored analysis once and written back. Returns None if the script does not exist.
+        """
+        
+        ensure_analyzed_scripts_table(db)
+        
+        try:
+            row = db.query(
+                AnalyzedScript.updated_at, AnalyzedScript.filename, AnalyzedScript.original_filename
+            ).filter(AnalyzedScript.id == script_id).first()
+            if not row:
+                return None
+            
+            version = row.updated_at.isoformat() if row.updated_at else ""
+            artifact = chat_context_cache.get(script_id, version)
+            if artifact is not None:
+                return artifact
+            
+            artifact = db.query(AnalyzedScript.chat_context).filter(AnalyzedScript.id == script_id).scalar()
+            if not is_current(artifact):
+                script = db.query(AnalyzedScript).filter(AnalyzedScript.id == script_id).first()
+                artifact = build_chat_context(script.to_analysis_dict(), row.filename or row.original_filename)
+                
+                # Keep updated_at unchanged: caching the artifact is not an analysis update
+                db.query(AnalyzedScript).filter(AnalyzedScript.id == script_id).update(
+                    {"chat_context": artifact, "updated_at": AnalyzedScript.updated_at},
+                    synchronize_session=False
+                )
+                db.commit()
+                logger.info(f"Built chat context for script {script_id}")
+            
+            # Row version travels with the artifact so answer caches can key on it
+            artifact = {**artifact, "analysis_version": version}
+            chat_context_cache.put(script_id, version, artifact)
+            return artifact
+            
+        except SQLAlchemyError as e:
+            db.rollback()
+            logger.error(f"Database error in get_chat_context: {str(e)}")
+            raise Exception(f"Failed to load chat context for {script_id}: {str(e)}")
+    
     @staticmethod
     def _extract_metadata(analysis_dict: Dict[str, Any]) -> Dict[str, Any]:
         """Extract metadata for quick access"""
@@ -257,6 +697,21 @@ class AnalyzedScriptService:
             logger.error(f"Database error in get_all_analyzed_scripts: {str(e)}")
             raise Exception(f"Failed to retrieve scripts: {str(e)}")
     
+    @staticmethod
+    def get_analysis_version(db: Session, script_id: str) -> Optional[str]:
+        """Version tag of a script's stored analysis without loading the row, None if the script does not exist"""
+        
+        ensure_analyzed_scripts_table(db)
+        
+        try:
+            row = db.query(AnalyzedScript.updated_at).filter(AnalyzedScript.id == script_id).first()
+            if row is None:
+                return None
+            return row.updated_at.isoformat() if row.updated_at else ""
+        except SQLAlchemyError as e:
+            logger.error(f"Database error in get_analysis_version: {str(e)}")
+            raise Exception(f"Failed to retrieve script {script_id}: {str(e)}")
+    
     @staticmethod
     def get_analyzed_script_by_id(db: Session, script_id: str) -> Optional[AnalyzedScript]:
         """Get analyzed script by ID with error handling"""
@@ -281,7 +736,11 @@ class AnalyzedScriptService:
             script = db.query(AnalyzedScript).filter(AnalyzedScript.id == script_id).first()
             if script:
                 db.delete(script)
+                ensure_script_entities_table(db)
+                db.query(ScriptEntity).filter(ScriptEntity.script_id == script_id).delete(synchronize_session=False)
                 db.commit()
+                chat_context_cache.invalidate(script_id)
+                chat_answer_cache.invalidate(script_id)
                 logger.info(f"Successfully deleted script: {script_id}")
                 return True
             return False
@@ -403,4 +862,496 @@ class AnalyzedScriptService:
             
         except SQLAlchemyError as e:
             logger.error(f"Database error in get_scripts_statistics: {str(e)}")
-            return {}
\ No newline at end of file
+            return {}
+
+class ChatSessionService:
+    
+    @staticmethod
+    def get_or_create_session(db: Session, script_id: str, session_id: Optional[str] = None) -> Optional[ChatSession]:
+        """Return the session for this script, creating one if no session_id is given.
+        Returns None when session_id is unknown or belongs to another script."""
+        
+        ensure_chat_tables(db)
+        
+        try:
+            if session_id:
+                return db.query(ChatSession).filter(
+                    ChatSession.id == session_id,
+                    ChatSession.script_id == script_id
+                ).first()
+            
+            session = ChatSession(id=str(uuid.uuid4()), script_id=script_id)
+            db.add(session)
+            db.commit()
+            db.refresh(session)
+            logger.info(f"Created chat session {session.id} for script {script_id}")
+            return session
+            
+        except SQLAlchemyError as e:
+            db.rollback()
+            logger.error(f"Database error in get_or_create_session: {str(e)}")
+            raise Exception(f"Failed to open chat session: {str(e)}")
+    
+    @staticmethod
+    def get_history_window(db: Session, session: ChatSession) -> tuple:
+        """
+        Return (summary, recent messages) for the prompt.
+        
+        Messages that no longer fit the token budget are folded into the session
+        summary once and skipped afterwards, so each call only reads the window.
+        """
+        
+        try:
+            messages = db.query(ChatMessage).filter(
+                ChatMessage.session_id == session.id,
+                ChatMessage.id > session.summarized_through_id
+            ).order_by(ChatMessage.id).all()
+            
+            older, recent = split_history(messages)
+            if older:
+                session.summary = summarize_turns(session.summary, older)
+                session.summarized_through_id = older[-1].id
+                db.commit()
+                logger.debug(f"Summarized {len(older)} messages of chat session {session.id}")
+            
+            return session.summary, recent
+            
+        except SQLAlchemyError as e:
+            db.rollback()
+            logger.error(f"Database error in get_history_window: {str(e)}")
+            raise Exception(f"Failed to load chat history: {str(e)}")
+    
+    @staticmethod
+    def record_turn(db: Session, session_id: str, user_message: str, assistant_message: str) -> None:
+        """
+        Append one user/assistant exchange to the session.
+        
+        Works by id, so callers whose session object came from another (closed) db
+        session still count the turn; the counter is incremented in SQL.
+        """
+        
+        try:
+            db.add_all([
+                ChatMessage(session_id=session_id, role="user", content=user_message,
+                            token_estimate=estimate_tokens(user_message)),
+                ChatMessage(session_id=session_id, role="assistant", content=assistant_message,
+                            token_estimate=estimate_tokens(assistant_message)),
+            ])
+            db.execute(
+                update(ChatSession)
+                .where(ChatSession.id == session_id)
+                .values(message_count=func.coalesce(ChatSession.message_count, 0) + 2)
+            )
+            db.commit()
+            
+        except SQLAlchemyError as e:
+            db.rollback()
+            logger.error(f"Database error in record_turn: {str(e)}")
+            raise Exception(f"Failed to record chat turn: {str(e)}")
+    
+    @staticmethod
+    def get_messages(db: Session, session_id: str) -> List[ChatMessage]:
+        """All messages of a session, oldest first"""
+        
+        ensure_chat_tables(db)
+        
+        try:
+            return db.query(ChatMessage).filter(
+                ChatMessage.session_id == session_id
+            ).order_by(ChatMessage.id).all()
+            
+        except SQLAlchemyError as e:
+            logger.error(f"Database error in get_messages: {str(e)}")
+            raise Exception(f"Failed to load chat messages: {str(e)}")
+
+_entity_backfill_done = False
+
+class PortfolioService:
+    """Cross-script queries over the script_entities index and analyzed_scripts summary columns"""
+    
+    @staticmethod
+    def index_script_entities(db: Session, script_id: str, analysis: Dict[str, Any]) -> int:
+        """Replace the entity rows of one script"""
+        
+        ensure_script_entities_table(db)
+        
+        try:
+            rows = [{**row, "script_id": script_id} for row in extract_script_entities(analysis)]
+            db.query(ScriptEntity).filter(ScriptEntity.script_id == script_id).delete(synchronize_session=False)
+            if rows:
+                db.execute(insert(ScriptEntity), rows)
+            db.commit()
+            return len(rows)
+            
+        except SQLAlchemyError as e:
+            db.rollback()
+            logger.error(f"Database error in index_script_entities: {str(e)}")
+            raise Exception(f"Failed to index entities for {script_id}: {str(e)}")
+    
+    @staticmethod
+    def backfill_script_entities(db: Session, batch_size: int = 200) -> int:
+        """Index scripts saved before the entity index existed (once per process)"""
+        global _entity_backfill_done
+        if _entity_backfill_done:
+            return 0
+        
+        ensure_analyzed_scripts_table(db)
+        ensure_script_entities_table(db)
+        
+        try:
+            missing_ids = [row.id for row in db.query(AnalyzedScript.id).filter(
+                AnalyzedScript.script_data.isnot(None),
+                ~exists().where(ScriptEntity.script_id == AnalyzedScript.id)
+            ).all()]
+            
+            # Load scene data a batch at a time so memory stays bounded on large slates
+            for start in range(0, len(missing_ids), batch_size):
+                rows = db.query(AnalyzedScript.id, AnalyzedScript.script_data).filter(
+                    AnalyzedScript.id.in_(missing_ids[start:start + batch_size])
+                ).all()
+                entities = [
+                    {**entity, "script_id": row.id}
+                    for row in rows
+                    for entity in extract_script_entities({"script_data": row.script_data})
+                ]
+                if entities:
+                    db.execute(insert(ScriptEntity), entities)
+                db.commit()
+            
+            indexed = len(missing_ids)
+            _entity_backfill_done = True
+            if indexed:
+                logger.info(f"Indexed entities for {indexed} existing scripts")
+            return indexed
+            
+        except SQLAlchemyError as e:
+            db.rollback()
+            logger.error(f"Database error in backfill_script_entities: {str(e)}")
+            raise Exception(f"Failed to backfill script entities: {str(e)}")
+    
+    @staticmethod
+    def find_scripts_with_entity(
+        db: Session,
+        term: str,
+        entity_type: Optional[str] = None,
+        limit: int = 50
+    ) -> List[Dict[str, Any]]:
+        """Scripts with an entity whose name contains term (or its plural, e.g. 'hospitals'), most scenes first"""
+        
+        try:
+            pattern = f"%{normalize_question(term)}%"
+            scene_total = func.sum(ScriptEntity.scene_count)
+            query = db.query(
+                ScriptEntity.script_id,
+                AnalyzedScript.filename,
+                func.array_agg(ScriptEntity.name).label("matches"),
+                scene_total.label("scene_count")
+            ).join(
+                AnalyzedScript, AnalyzedScript.id == ScriptEntity.script_id
+            ).filter(
+                or_(
+                    ScriptEntity.normalized_name.like(pattern),
+                    (ScriptEntity.normalized_name + "s").like(pattern),
+                    (ScriptEntity.normalized_name + "es").like(pattern)
+                )
+            )
+            if entity_type:
+                query = query.filter(ScriptEntity.entity_type == entity_type)
+            
+            rows = query.group_by(ScriptEntity.script_id, AnalyzedScript.filename).order_by(desc(scene_total)).limit(limit).all()
+            return [
+                {"script_id": r.script_id, "filename": r.filename, "matches": list(r.matches), "scene_count": int(r.scene_count or 0)}
+                for r in rows
+            ]
+            
+        except SQLAlchemyError as e:
+            logger.error(f"Database error in find_scripts_with_entity: {str(e)}")
+            raise Exception(f"Failed to search script entities: {str(e)}")
+    
+    @staticmethod
+    def budget_aggregate(db: Session, budget_category: Optional[str] = None) -> Dict[str, Any]:
+        """Count, total and average estimated budget, overall or for one budget category"""
+        
+        try:
+            base = db.query(AnalyzedScript).filter(AnalyzedScript.estimated_budget.isnot(None))
+            if budget_category:
+                base = base.filter(AnalyzedScript.budget_category == budget_category)
+            
+            count, total, average = base.with_entities(
+                func.count(AnalyzedScript.id),
+                func.sum(AnalyzedScript.estimated_budget),
+                func.avg(AnalyzedScript.estimated_budget)
+            ).one()
+            
+            by_category = base.with_entities(
+                AnalyzedScript.budget_category,
+                func.count(AnalyzedScript.id),
+                func.sum(AnalyzedScript.estimated_budget)
+            ).group_by(AnalyzedScript.budget_category).order_by(desc(func.sum(AnalyzedScript.estimated_budget))).all()
+            
+            return {
+                "script_count": int(count or 0),
+                "total_budget": float(total or 0),
+                "average_budget": float(average or 0),
+                "by_category": [
+                    {"budget_category": category, "script_count": int(n), "total_budget": float(t or 0)}
+                    for category, n, t in by_category
+                ]
+            }
+            
+        except SQLAlchemyError as e:
+            logger.error(f"Database error in budget_aggregate: {str(e)}")
+            raise Exception(f"Failed to aggregate budgets: {str(e)}")
+    
+    @staticmethod
+    def top_budgets(db: Session, top_n: int = 10, descending: bool = True) -> List[Dict[str, Any]]:
+        """Scripts ranked by estimated budget"""
+        
+        try:
+            order = desc(AnalyzedScript.estimated_budget) if descending else asc(AnalyzedScript.estimated_budget)
+            rows = db.query(
+                AnalyzedScript.id, AnalyzedScript.filename, AnalyzedScript.estimated_budget, AnalyzedScript.budget_category
+            ).filter(AnalyzedScript.estimated_budget.isnot(None)).order_by(order).limit(top_n).all()
+            
+            return [
+                {"script_id": r.id, "filename": r.filename, "estimated_budget": float(r.estimated_budget), "budget_category": r.budget_category}
+                for r in rows
+            ]
+            
+        except SQLAlchemyError as e:
+            logger.error(f"Database error in top_budgets: {str(e)}")
+            raise Exception(f"Failed to rank budgets: {str(e)}")
+    
+    @staticmethod
+    def overview(db: Session, top_entities: int = 8) -> Dict[str, Any]:
+        """Slate-wide aggregates: budgets by category and the entities shared by most scripts"""
+        
+        try:
+            summary = PortfolioService.budget_aggregate(db)
+            script_count = db.query(func.count(AnalyzedScript.id)).scalar() or 0
+            
+            top = {}
+            for entity_type in ENTITY_TYPES:
+                script_total = func.count(func.distinct(ScriptEntity.script_id))
+                rows = db.query(
+                    func.min(ScriptEntity.name), script_total
+                ).filter(
+                    ScriptEntity.entity_type == entity_type
+                ).group_by(ScriptEntity.normalized_name).order_by(desc(script_total)).limit(top_entities).all()
+                top[entity_type] = [{"name": name, "script_count": int(n)} for name, n in rows]
+            
+            return {
+                "script_count": int(script_count),
+                "total_budget": summary["total_budget"],
+                "by_category": summary["by_category"],
+                "top_entities": top
+            }
+            
+        except SQLAlchemyError as e:
+            logger.error(f"Database error in portfolio overview: {str(e)}")
+            raise Exception(f"Failed to build portfolio overview: {str(e)}")
+
+
+# Lease and retry policy of the durable analysis queue
+JOB_VISIBILITY_TIMEOUT_SECONDS = int(os.getenv("JOB_VISIBILITY_TIMEOUT_SECONDS", "120"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BASE_SECONDS = int(os.getenv("JOB_RETRY_BASE_SECONDS", "30"))
+JOB_RETRY_MAX_SECONDS = 900
+
+class AnalysisJobService:
+    """
+    Durable analysis queue on Postgres.
+    
+    Workers claim jobs with FOR UPDATE SKIP LOCKED and hold a lease (locked_until) that
+    they renew while running. A job whose lease expires, because its worker died, is
+    claimed again by another worker until max_attempts is used up. Every write after
+    the claim is fenced on locked_by, so a worker that lost its lease cannot overwrite
+    the new owner's progress.
+    """
+    
+    @staticmethod
+    def enqueue(
+        db: Session,
+        filename: str,
+        file_size_bytes: int,
+        pdf_data: bytes,
+        priority: int = 0,
+        content_sha256: Optional[str] = None
+    ) -> AnalysisJobRecord:
+        ensure_analysis_jobs_table(db)
+        
+        try:
+            job = AnalysisJobRecord(
+                id=str(uuid.uuid4()),
+                filename=filename,
+                file_size_bytes=file_size_bytes,
+                pdf_data=pdf_data,
+                content_sha256=content_sha256,
+                priority=priority,
+                max_attempts=JOB_MAX_ATTEMPTS
+            )
+            db.add(job)
+            db.commit()
+            db.refresh(job)
+            logger.info(f"Queued durable analysis job {job.id} for {filename} (priority {priority})")
+            return job
+            
+        except SQLAlchemyError as e:
+            db.rollback()
+            logger.error(f"Database error in enqueue: {str(e)}")
+            raise Exception(f"Failed to queue analysis job: {str(e)}")
+    
+    @staticmethod
+    def get(db: Session, job_id: str, with_result: bool = False) -> Optional[AnalysisJobRecord]:
+        ensure_analysis_jobs_table(db)
+        
+        query = db.query(AnalysisJobRecord)
+        if with_result:
+            query = query.options(undefer(AnalysisJobRecord.result))
+        return query.filter(AnalysisJobRecord.id == job_id).first()
+    
+    @staticmethod
+    def queue_position(db: Session, job: AnalysisJobRecord) -> Optional[int]:
+        """1-based position among claimable jobs; None once the job has started"""
+        if job.status != "queued":
+            return None
+        
+        ahead = db.execute(text("""
+            SELECT COUNT(*) FROM analysis_jobs
+            WHERE status = 'queued'
+              AND (priority > :priority OR (priority = :priority AND available_at < :available_at))
+        """), {"priority": job.priority, "available_at": job.available_at}).scalar()
+        return ahead + 1
+    
+    @staticmethod
+    def claim(db: Session, worker_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Lease the next runnable job to worker_id.
+        
+        Returns:
+            Dict with id, filename, file_size_bytes, content_sha256, attempts, max_attempts and pdf_data, or None.
+        """
+        ensure_analysis_jobs_table(db)
+        
+        try:
+            # Crash recovery: expired leases that have used up their attempts fail for good
+            db.execute(text("""
+                UPDATE analysis_jobs
+                SET status = 'failed', error = 'Worker lost the job too many times', error_status_code = 500,
+                    locked_by = NULL, locked_until = NULL, pdf_data = NULL, finished_at = NOW()
+                WHERE status = 'running' AND locked_until < NOW() AND attempts >= max_attempts
+            """))
+            
+            row = db.execute(text("""
+                UPDATE analysis_jobs
+                SET status = 'running', locked_by = :worker_id, attempts = attempts + 1, stage = NULL,
+                    locked_until = NOW() + make_interval(secs => :lease), started_at = NOW()
+                WHERE id = (
+                    SELECT id FROM analysis_jobs
+                    WHERE (status = 'queued' AND available_at <= NOW())
+                       OR (status = 'running' AND locked_until < NOW())
+                    ORDER BY priority DESC, available_at, created_at
+                    LIMIT 1
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, filename, file_size_bytes, content_sha256, attempts, max_attempts, pdf_data
+            """), {"worker_id": worker_id, "lease": JOB_VISIBILITY_TIMEOUT_SECONDS}).mappings().first()
+            
+            db.commit()
+            return dict(row) if row else None
+            
+        except SQLAlchemyError as e:
+            db.rollback()
+            logger.error(f"Database error in claim: {str(e)}")
+            raise Exception(f"Failed to claim analysis job: {str(e)}")
+    
+    @staticmethod
+    def heartbeat(db: Session, job_id: str, worker_id: str, stage: Optional[str] = None) -> bool:
+        """Renew the lease and record the current stage; False if the lease was lost"""
+        try:
+            renewed = db.execute(text("""
+                UPDATE analysis_jobs
+                SET locked_until = NOW() + make_interval(secs => :lease), stage = COALESCE(:stage, stage)
+                WHERE id = :job_id AND locked_by = :worker_id AND status = 'running'
+            """), {"job_id": job_id, "worker_id": worker_id, "stage": stage, "lease": JOB_VISIBILITY_TIMEOUT_SECONDS}).rowcount
+            db.commit()
+            return renewed == 1
+            
+        except SQLAlchemyError as e:
+            db.rollback()
+            logger.error(f"Database error in heartbeat: {str(e)}")
+            raise Exception(f"Failed to renew lease of job {job_id}: {str(e)}")
+    
+    @staticmethod
+    def complete(db: Session, job_id: str, worker_id: str, result: Dict[str, Any]) -> bool:
+        try:
+            job = db.query(AnalysisJobRecord).filter(
+                AnalysisJobRecord.id == job_id,
+                AnalysisJobRecord.locked_by == worker_id,
+                AnalysisJobRecord.status == "running"
+            ).with_for_update().first()
+            if not job:
+                db.rollback()
+                return False
+            
+            job.status = "completed"
+            job.result = result
+            job.pdf_data = None
+            job.error = None
+            job.locked_by = None
+            job.locked_until = None
+            job.finished_at = datetime.now(timezone.utc)
+            db.commit()
+            return True
+            
+        except SQLAlchemyError as e:
+            db.rollback()
+            logger.error(f"Database error in complete: {str(e)}")
+            raise Exception(f"Failed to complete job {job_id}: {str(e)}")
+    
+    @staticmethod
+    def fail(db: Session, job_id: str, worker_id: str, error: str, status_code: int = 500, retryable: bool = True) -> Optional[str]:
+        """
+        Record a failed attempt: requeue with exponential backoff and jitter while attempts
+        remain, otherwise fail the job. Returns the new status, or None if the lease was lost.
+        """
+        try:
+            job = db.query(AnalysisJobRecord).filter(
+                AnalysisJobRecord.id == job_id,
+                AnalysisJobRecord.locked_by == worker_id,
+                AnalysisJobRecord.status == "running"
+            ).with_for_update().first()
+            if not job:
+                db.rollback()
+                return None
+            
+            job.error = error
+            job.error_status_code = status_code
+            job.locked_by = None
+            job.locked_until = None
+            
+            if retryable and job.attempts < job.max_attempts:
+                delay = min(JOB_RETRY_BASE_SECONDS * 2 ** (job.attempts - 1), JOB_RETRY_MAX_SECONDS)
+                job.status = "queued"
+                job.available_at = datetime.now(timezone.utc) + timedelta(seconds=delay * random.uniform(0.8, 1.2))
+            else:
+                job.status = "failed"
+                job.pdf_data = None
+                job.finished_at = datetime.now(timezone.utc)
+            
+            db.commit()
+            return job.status
+            
+        except SQLAlchemyError as e:
+            db.rollback()
+            logger.error(f"Database error in fail: {str(e)}")
+            raise Exception(f"Failed to record failure of job {job_id}: {str(e)}")
+    
+    @staticmethod
+    def stats(db: Session) -> Dict[str, Any]:
+        ensure_analysis_jobs_table(db)
+        
+        rows = db.execute(text("""
+            SELECT status, COUNT(*) AS count FROM analysis_jobs GROUP BY status
+        """)).fetchall()
+        return {"jobs": {row.status: row.count for row in rows}}
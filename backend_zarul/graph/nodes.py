@@ -1,17 +1,37 @@
 from agents.agent.analyst_agent import analyst_agent, AnalysisContext
+from agents.tools.cost_engine import estimate_costs
+from agents.tools.rate_card import load_rate_card
+from agents.tools.artifact_store import artifact_store
+from agents.tools.stage_metrics import track_stage
+from agents.utils.gemini_model import llm_semaphore
+from agents.states.states import ComprehensiveAnalysis
 from graph.states import OptimizedWorkflowState
+from typing import Optional
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
 
+def load_analysis(state: OptimizedWorkflowState) -> Optional[ComprehensiveAnalysis]:
+    """Analysis referenced by the state, or None before the analyst node has run"""
+    analysis_key = state.get('analysis_key')
+    if not analysis_key:
+        return None
+    return artifact_store.get_model(analysis_key, ComprehensiveAnalysis)
+
 async def analyst_agent_node(state: OptimizedWorkflowState):
     """Analyze uploaded pdf script with MINIMUM API calls (2 total)"""
     pdf_path = state.get('pdf_path')
     logger.info(f"Starting OPTIMIZED analysis (2 API calls) for: {pdf_path}")
     
     try:
-        # Create analysis context
-        context = AnalysisContext(pdf_path=pdf_path)
+        # Create analysis context; a stored script text key skips PDF extraction on re-analysis
+        context = AnalysisContext(
+            pdf_path=pdf_path,
+            script_text_key=state.get('script_text_key'),
+            script_length=state.get('word_count') or 0,
+            page_count=state.get('page_count') or 0
+        )
         
         # Enhanced prompt for comprehensive analysis
         analysis_prompt = f"""
@@ -23,14 +43,27 @@ async def analyst_agent_node(state: OptimizedWorkflowState):
         This should take exactly 2 API calls total.
         """
         
+        # Re-analysis after human feedback: tell the model what to fix
+        if state.get('revision_notes'):
+            analysis_prompt += f"""
+        Reviewer feedback on the previous analysis, address it in this one:
+        {state['revision_notes']}
+        """
+        
         # Execute analysis (will use 2 API calls: extract + analyze)
+        with track_stage("llm_wait"):
+            await llm_semaphore.acquire()
         try:
-            result = await analyst_agent.run_async(analysis_prompt, deps=context)
-        except AttributeError:
-            try:
-                result = await analyst_agent.run(analysis_prompt, deps=context)
-            except AttributeError:
-                result = await analyst_agent(analysis_prompt, deps=context)
+            with track_stage("model_call"):
+                try:
+                    result = await analyst_agent.run_async(analysis_prompt, deps=context)
+                except AttributeError:
+                    try:
+                        result = await analyst_agent.run(analysis_prompt, deps=context)
+                    except AttributeError:
+                        result = await analyst_agent(analysis_prompt, deps=context)
+        finally:
+            llm_semaphore.release()
         
         logger.info(f"✅ OPTIMIZED analysis completed with 2 API calls. Result type: {type(result)}")
         
@@ -42,19 +75,43 @@ async def analyst_agent_node(state: OptimizedWorkflowState):
         else:
             analysis_data = result
         
-        # Update state
-        state['comprehensive_analysis'] = analysis_data
-        state['status'] = 'analysis_completed'
-        state['api_calls_used'] = 2  # Track actual usage
+        # Replace model-estimated costs with the deterministic cost engine
+        cost_provenance_key = None
+        rate_card_version = None
+        if hasattr(analysis_data, 'cost_breakdown'):
+            try:
+                with track_stage("cost_engine"):
+                    rate_card = await asyncio.to_thread(load_rate_card)
+                    estimate = estimate_costs(analysis_data, rate_card)
+                    analysis_data.cost_breakdown = estimate.breakdown
+                    rate_card_version = rate_card.version
+                with track_stage("artifact_write"):
+                    cost_provenance_key = await asyncio.to_thread(artifact_store.put_json, estimate.provenance)
+            except Exception as cost_error:
+                logger.warning(f"Cost engine failed, keeping model cost estimate: {cost_error}")
+        
+        with track_stage("artifact_write"):
+            analysis_key = await asyncio.to_thread(artifact_store.put_model, analysis_data)
         
-        return state
+        # Partial update: only keys travel through state and checkpoints
+        return {
+            'analysis_key': analysis_key,
+            'cost_provenance_key': cost_provenance_key,
+            'rate_card_version': rate_card_version,
+            'script_text_key': context.script_text_key,
+            'word_count': context.script_length,
+            'page_count': context.page_count,
+            'status': 'analysis_completed',
+            'api_calls_used': 2  # Track actual usage
+        }
         
     except Exception as e:
         logger.error(f"OPTIMIZED analysis failed: {str(e)}")
-        state['status'] = f'analysis_failed: {str(e)}'
-        state['errors'] = state.get('errors', []) + [str(e)]
-        state['api_calls_used'] = 1  # Only extraction call succeeded
-        return state
+        return {
+            'status': f'analysis_failed: {str(e)}',
+            'errors': (state.get('errors') or []) + [str(e)],
+            'api_calls_used': 1  # Only extraction call succeeded
+        }
 
 # # Auto human-in-the-loop
 # async def human_feedback_node(state: OptimizedWorkflowState):
@@ -78,7 +135,7 @@ async def human_feedback_node(state: OptimizedWorkflowState):
     """Human feedback node - now functional"""
     
     # Check if feedback is required based on analysis quality or user preference
-    comprehensive_analysis = state.get('comprehensive_analysis')
+    comprehensive_analysis = load_analysis(state)
     
     # Auto-determine if feedback is needed (you can customize these conditions)
     feedback_required = False
@@ -105,25 +162,24 @@ async def human_feedback_node(state: OptimizedWorkflowState):
         
         if feedback_approved:
             return {
-                **state,
                 "feedback_required": False,
                 "status": "analysis_completed_with_approval",
                 "feedback_processed": True
             }
         else:
             # Feedback indicates issues - might need re-analysis
+            # (consumed here so a revised analysis is not sent back for revision again)
             return {
-                **state,
                 "feedback_required": False,
                 "status": "analysis_needs_revision",
                 "feedback_processed": True,
+                "human_feedback_provided": False,
                 "revision_notes": feedback_text
             }
     
     # If feedback is required but not yet provided
     if feedback_required:
         return {
-            **state,
             "feedback_required": True,
             "status": "awaiting_human_feedback",
             "feedback_prompt": "Please review the analysis results and provide feedback."
@@ -131,7 +187,6 @@ async def human_feedback_node(state: OptimizedWorkflowState):
     
     # No feedback needed - proceed
     return {
-        **state,
         "feedback_required": False,
         "status": "analysis_completed"
     }
\ No newline at end of file
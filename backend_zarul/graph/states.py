@@ -5,12 +5,28 @@ class OptimizedWorkflowState(TypedDict, total=False):
     # Input
     pdf_path: str
     
-    # Single comprehensive analysis result
+    # Large artifacts live in the artifact store; state only carries their keys
+    script_text_key: Optional[str]      # Extracted script text
+    analysis_key: Optional[str]         # ComprehensiveAnalysis JSON
+    cost_provenance_key: Optional[str]  # Per-line cost engine provenance
+    rate_card_version: Optional[str]    # Rate card the cost engine priced the analysis with
+    word_count: Optional[int]
+    page_count: Optional[int]
+    
+    # Resolved from the artifact store by main.py for callers, never checkpointed
     comprehensive_analysis: Optional[ComprehensiveAnalysis]
+    cost_provenance: Optional[List[Dict[str, Any]]]
     
     # Human feedback
     feedback_required: bool
     feedback_text: str
+    force_human_review: bool
+    human_feedback_provided: bool
+    feedback_approved: bool
+    reanalysis_requested: bool
+    feedback_processed: bool
+    feedback_prompt: Optional[str]
+    revision_notes: Optional[str]
     
     # Workflow status
     status: str
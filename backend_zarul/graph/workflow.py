@@ -1,6 +1,15 @@
 from langgraph.graph import StateGraph, START, END
 from graph.states import OptimizedWorkflowState
 from graph.nodes import analyst_agent_node, human_feedback_node
+from agents.tools.stage_metrics import instrument_node
+from typing import Dict, Any, Callable
+import asyncio
+import os
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
 
 # # Auto human_feedback
 # def should_continue_or_end(state: OptimizedWorkflowState):
@@ -45,19 +54,19 @@ def should_continue_or_end(state: OptimizedWorkflowState):
     if feedback_required and not state.get('human_feedback_provided', False):
         return "WAIT_FOR_FEEDBACK"  # This would pause the workflow
     
-    # If feedback was provided and indicates need for revision
-    if state.get('status') == 'analysis_needs_revision':
+    # If feedback was provided and asked for a revised analysis
+    if state.get('status') == 'analysis_needs_revision' and state.get('reanalysis_requested', False):
         return "analyst_agent"  # Re-run analysis
     
     return "END"
 
-def create_workflow():
-    """Create workflow with feedback support"""
+def build_workflow() -> StateGraph:
+    """Build the (uncompiled) workflow graph with feedback support"""
     workflow = StateGraph(OptimizedWorkflowState)
     
-    # Add nodes
-    workflow.add_node("analyst_agent", analyst_agent_node)
-    workflow.add_node("human_feedback", human_feedback_node)
+    # Add nodes (each execution is timed as a node:<name> stage)
+    workflow.add_node("analyst_agent", instrument_node("analyst_agent", analyst_agent_node))
+    workflow.add_node("human_feedback", instrument_node("human_feedback", human_feedback_node))
     
     # Flow
     workflow.set_entry_point("analyst_agent")
@@ -73,4 +82,122 @@ def create_workflow():
         }
     )
     
-    return workflow.compile()
\ No newline at end of file
+    return workflow
+
+def create_workflow():
+    """Compile a fresh workflow; request paths should use get_workflow() instead"""
+    return build_workflow().compile()
+
+# Durable checkpoints let feedback resume a finished run instead of starting over.
+# They live in the application's Postgres database, so a run executed by a worker.py
+# process on another machine can be resumed by /provide-feedback on the API host.
+# "memory" keeps them in process only (local development; lost on restart).
+WORKFLOW_CHECKPOINTER = os.getenv("WORKFLOW_CHECKPOINTER", "postgres")
+CHECKPOINT_POOL_SIZE = int(os.getenv("WORKFLOW_CHECKPOINT_POOL_SIZE", "5"))
+
+_checkpointer = None
+_checkpoint_pool = None
+_checkpointer_opened = False
+_checkpointer_open_lock = asyncio.Lock()  # Concurrent first callers wait for one open
+
+def get_checkpointer():
+    """
+    Postgres checkpointer on the application database (in-memory only when
+    WORKFLOW_CHECKPOINTER=memory). Raises instead of silently losing durability.
+    """
+    global _checkpointer, _checkpoint_pool
+    if _checkpointer is not None:
+        return _checkpointer
+
+    if WORKFLOW_CHECKPOINTER == "memory":
+        from langgraph.checkpoint.memory import MemorySaver
+        logger.warning("⚠️ WORKFLOW_CHECKPOINTER=memory: workflow checkpoints are lost on restart and cannot be resumed by other processes")
+        _checkpointer = MemorySaver()
+        return _checkpointer
+
+    if WORKFLOW_CHECKPOINTER != "postgres":
+        raise RuntimeError(f"Unknown WORKFLOW_CHECKPOINTER '{WORKFLOW_CHECKPOINTER}', use 'postgres' or 'memory'")
+
+    try:
+        from psycopg.rows import dict_row
+        from psycopg_pool import AsyncConnectionPool
+        from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+    except ImportError as e:
+        raise RuntimeError(
+            f"Durable workflow checkpoints need langgraph-checkpoint-postgres and psycopg ({e}). "
+            "Install requirements.txt, or set WORKFLOW_CHECKPOINTER=memory for local development."
+        )
+
+    from database.database import DATABASE_URL
+    # Opened by open_checkpointer() inside the serving event loop
+    _checkpoint_pool = AsyncConnectionPool(
+        DATABASE_URL,
+        max_size=CHECKPOINT_POOL_SIZE,
+        kwargs={"autocommit": True, "prepare_threshold": 0, "row_factory": dict_row},
+        open=False
+    )
+    _checkpointer = AsyncPostgresSaver(_checkpoint_pool)
+    return _checkpointer
+
+async def open_checkpointer() -> None:
+    """Open the checkpoint pool and create the checkpoint tables; safe to call repeatedly"""
+    global _checkpointer_opened
+    checkpointer = get_checkpointer()
+    if _checkpointer_opened or _checkpoint_pool is None:
+        return
+    async with _checkpointer_open_lock:
+        if _checkpointer_opened:
+            return
+        await _checkpoint_pool.open(wait=True)
+        await checkpointer.setup()
+        _checkpointer_opened = True
+        logger.info("✅ Workflow checkpoints stored in Postgres")
+
+async def close_checkpointer() -> None:
+    global _checkpointer_opened
+    async with _checkpointer_open_lock:
+        if _checkpoint_pool is not None and _checkpointer_opened:
+            await _checkpoint_pool.close()
+            _checkpointer_opened = False
+
+def thread_config(thread_id: str) -> Dict[str, Any]:
+    """Run config addressing one analysis' checkpoint thread"""
+    return {"configurable": {"thread_id": thread_id}}
+
+# Compile options per named configuration
+WORKFLOW_CONFIGS: Dict[str, Callable[[], Dict[str, Any]]] = {
+    "default": lambda: {"checkpointer": get_checkpointer()},
+    "platform": lambda: {},  # LangGraph server supplies its own persistence
+}
+
+_compiled_workflows: Dict[str, Any] = {}
+_registry_lock = threading.Lock()
+compile_timings_ms: Dict[str, float] = {}
+
+def get_workflow(name: str = "default"):
+    """
+    Return the compiled workflow for a configuration, compiling it once per process.
+
+    Compiled graphs hold no per-run state, so one instance serves concurrent ainvoke calls.
+    """
+    compiled = _compiled_workflows.get(name)
+    if compiled is not None:
+        return compiled
+
+    with _registry_lock:
+        if name not in _compiled_workflows:
+            start = time.perf_counter()
+            _compiled_workflows[name] = build_workflow().compile(**WORKFLOW_CONFIGS[name]())
+            compile_timings_ms[name] = round((time.perf_counter() - start) * 1000, 2)
+            logger.info(f"Workflow '{name}' compiled in {compile_timings_ms[name]} ms")
+        return _compiled_workflows[name]
+
+def get_platform_workflow():
+    """Entry point for langgraph.json; shares the registry's compiled graph"""
+    return get_workflow("platform")
+
+def warm_workflows() -> Dict[str, float]:
+    """Compile every configured workflow up front; returns compile times in ms"""
+    for name in WORKFLOW_CONFIGS:
+        get_workflow(name)
+    return dict(compile_timings_ms)
\ No newline at end of file
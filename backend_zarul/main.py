@@ -1,25 +1,46 @@
-from graph.workflow import create_workflow
+from graph.workflow import get_workflow, thread_config, open_checkpointer
 from graph.states import OptimizedWorkflowState
+from graph.nodes import load_analysis
+from agents.tools.artifact_store import artifact_store
+from agents.tools.stage_metrics import track_run, track_stage, current_recorder
+from agents.tools.single_flight import SingleFlight
+from agents.tools.fingerprints import file_sha256, text_sha256
+from typing import Optional
 import asyncio
+import os
+import shutil
+import tempfile
 import time
+import uuid
 from datetime import datetime
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-async def run_optimized_script_analysis(pdf_path: str, timeout: int = 300) -> OptimizedWorkflowState:
+async def run_optimized_script_analysis(pdf_path: str, timeout: int = 300, thread_id: Optional[str] = None) -> OptimizedWorkflowState:
     """
     Optimized script analysis with single API call
+    
+    The run is checkpointed under thread_id (generated when omitted and returned as
+    workflow_thread_id) so human feedback can resume it later. Per-stage timings are
+    returned as stage_metrics; a caller's stage recorder is reused if one is active.
     """
     
+    with track_run(current_recorder()) as recorder:
+        result = await _run_analysis(pdf_path, timeout, thread_id or str(uuid.uuid4()))
+        result["stage_metrics"] = recorder.stages
+        logger.info("Stage timings: " + ", ".join(f"{s['stage']} {s['wall_ms']:.0f}ms" for s in recorder.stages))
+        return result
+
+async def _run_analysis(pdf_path: str, timeout: int, thread_id: str) -> OptimizedWorkflowState:
     start_time = time.time()
-    logger.info(f"Starting optimized script analysis for: {pdf_path}")
+    logger.info(f"Starting optimized script analysis for: {pdf_path} (thread {thread_id})")
     
     try:
-        # Create optimized workflow
-        workflow = create_workflow()
-        logger.info("Optimized workflow created successfully")
+        # Shared compiled workflow; compiled once per process
+        workflow = get_workflow()
+        await open_checkpointer()
         
         # Initial state
         initial_state = {
@@ -35,10 +56,11 @@ async def run_optimized_script_analysis(pdf_path: str, timeout: int = 300) -> Op
         
         # Execute workflow with timeout
         try:
-            result = await asyncio.wait_for(
-                workflow.ainvoke(initial_state),
-                timeout=timeout
-            )
+            with track_stage("workflow"):
+                result = await asyncio.wait_for(
+                    workflow.ainvoke(initial_state, thread_config(thread_id)),
+                    timeout=timeout
+                )
             logger.info(f"Optimized workflow completed. Result keys: {list(result.keys())}")
             
         except asyncio.TimeoutError:
@@ -49,9 +71,12 @@ async def run_optimized_script_analysis(pdf_path: str, timeout: int = 300) -> Op
         processing_time = time.time() - start_time
         
         if isinstance(result, dict):
+            with track_stage("artifact_resolve"):
+                await asyncio.to_thread(resolve_artifacts, result)
             result["processing_end_time"] = datetime.now().isoformat()
             result["total_processing_time"] = processing_time
             result["status"] = "completed"
+            result["workflow_thread_id"] = thread_id
         
         logger.info(f"Optimized script analysis completed in {processing_time:.2f} seconds")
         
@@ -73,11 +98,69 @@ async def run_optimized_script_analysis(pdf_path: str, timeout: int = 300) -> Op
             "total_processing_time": processing_time,
             "errors": [str(e)],
             "feedback_required": False,
-            "feedback_text": ""
+            "feedback_text": "",
+            "workflow_thread_id": thread_id
         }
         
         return error_result
 
+# Identical PDFs submitted while an analysis of them is running share that run
+analysis_flights = SingleFlight("analysis")
+
+def analysis_settings_key(timeout: int) -> str:
+    """Settings that change the analysis output; runs only coalesce when these match"""
+    return f"{os.getenv('MODEL_CHOICE', 'gemini-2.0-flash')}:{timeout}"
+
+def _private_copy(pdf_path: str) -> str:
+    """Hard link (or copy) the PDF so the shared run does not depend on the first caller's temp file"""
+    fd, copy_path = tempfile.mkstemp(suffix=".pdf")
+    os.close(fd)
+    os.unlink(copy_path)
+    try:
+        os.link(pdf_path, copy_path)
+    except OSError:
+        shutil.copyfile(pdf_path, copy_path)
+    return copy_path
+
+async def run_deduplicated_analysis(pdf_path: str, timeout: int = 300, content_sha256: Optional[str] = None) -> OptimizedWorkflowState:
+    """
+    run_optimized_script_analysis, coalesced by PDF content hash and analysis settings.
+    
+    Concurrent callers with the same PDF share one run and each get their own copy of
+    its result, marked coalesced=True for those who joined. The hash is computed unless
+    the caller already has it, and is returned as content_sha256.
+    """
+    content_sha256 = content_sha256 or await asyncio.to_thread(file_sha256, pdf_path)
+    key = f"{content_sha256}:{analysis_settings_key(timeout)}"
+    
+    async def start() -> OptimizedWorkflowState:
+        copy_path = await asyncio.to_thread(_private_copy, pdf_path)
+        try:
+            return await run_optimized_script_analysis(copy_path, timeout)
+        finally:
+            try:
+                os.unlink(copy_path)
+            except OSError as cleanup_error:
+                logger.warning(f"Failed to cleanup temp file: {cleanup_error}")
+    
+    result, shared = await analysis_flights.do(key, start)
+    # Callers append their own stages to the metrics list, so it must not be shared
+    return {
+        **result,
+        "stage_metrics": list(result.get("stage_metrics") or []),
+        "coalesced": shared,
+        "content_sha256": content_sha256
+    }
+
+def resolve_artifacts(result: OptimizedWorkflowState) -> OptimizedWorkflowState:
+    """Load the analysis and cost provenance referenced by a final state for the API layer"""
+    result["comprehensive_analysis"] = load_analysis(result)
+    provenance_key = result.get("cost_provenance_key")
+    result["cost_provenance"] = artifact_store.get_json(provenance_key) if provenance_key else []
+    text_key = result.get("script_text_key")
+    result["text_sha256"] = text_sha256(artifact_store.get_text(text_key)) if text_key else None
+    return result
+
 def _validate_optimized_result(result: OptimizedWorkflowState) -> None:
     """Validate optimized analysis result"""
     
@@ -109,6 +192,44 @@ def _validate_optimized_result(result: OptimizedWorkflowState) -> None:
     
     logger.info("Optimized analysis validation passed")
 
+async def resume_with_feedback(
+    thread_id: str,
+    feedback_text: str,
+    approved: bool,
+    request_reanalysis: bool = False,
+    timeout: int = 300
+) -> Optional[OptimizedWorkflowState]:
+    """
+    Resume a checkpointed analysis at the human_feedback node with the reviewer's feedback.
+    
+    The stored state (extracted script, analysis, costs) is reused as is; the analyst node
+    only runs again when re-analysis was requested. Returns None if no checkpoint exists.
+    """
+    workflow = get_workflow()
+    await open_checkpointer()
+    config = thread_config(thread_id)
+    
+    snapshot = await workflow.aget_state(config)
+    if not snapshot or not snapshot.values:
+        logger.warning(f"No workflow checkpoint for thread {thread_id}")
+        return None
+    
+    # Record the feedback as if the analyst step just finished, so human_feedback runs next
+    await workflow.aupdate_state(
+        config,
+        {
+            "human_feedback_provided": True,
+            "feedback_text": feedback_text,
+            "feedback_approved": approved,
+            "reanalysis_requested": request_reanalysis and not approved,
+        },
+        as_node="analyst_agent"
+    )
+    
+    logger.info(f"Resuming workflow thread {thread_id} with human feedback (approved={approved})")
+    result = await asyncio.wait_for(workflow.ainvoke(None, config), timeout=timeout)
+    return await asyncio.to_thread(resolve_artifacts, result)
+
 # Backward compatibility
 async def run_script_analysis(pdf_path: str, timeout: int = 300) -> OptimizedWorkflowState:
     """Backward compatible function name"""
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Re-price stored analyses after the cost collection changes.
+
+Streams analyzed_scripts with a server-side cursor, re-computes cost_breakdown
+locally with the cost engine and writes the results back in bulk, stamped with
+the rate card version. Rows already stamped with the current version are
+skipped, so an interrupted run resumes where it stopped.
+
+Usage: python reprice_scripts.py [--batch-size 500] [--limit N] [--dry-run] [--force]
+"""
+
+from sqlalchemy import or_, update
+from datetime import datetime, timezone
+from database.database import SessionLocal
+from database.models import AnalyzedScript
+from database.services import ensure_analyzed_scripts_table
+from agents.tools.cost_engine import estimate_costs
+from agents.tools.rate_card import load_rate_card
+import argparse
+import time
+import logging
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Columns needed to price a script; the rest of the row is never loaded
+PRICING_COLUMNS = [
+    AnalyzedScript.id,
+    AnalyzedScript.script_data,
+    AnalyzedScript.cast_breakdown,
+    AnalyzedScript.location_breakdown,
+    AnalyzedScript.props_breakdown,
+]
+
+def reprice_row(row, rate_card) -> dict:
+    """Return the bulk-update mapping for one streamed row"""
+    analysis = {
+        "script_data": row.script_data or {},
+        "cast_breakdown": row.cast_breakdown or {},
+        "location_breakdown": row.location_breakdown or {},
+        "props_breakdown": row.props_breakdown or {},
+    }
+    breakdown = estimate_costs(analysis, rate_card, with_provenance=False).breakdown
+    now = datetime.now(timezone.utc)
+    return {
+        "id": row.id,
+        "cost_breakdown": breakdown.model_dump(),
+        "estimated_budget": breakdown.total_costs,
+        "budget_category": breakdown.budget_category,
+        "rate_card_version": rate_card.version,
+        "repriced_at": now,
+        "chat_context": None,
+        "updated_at": now,
+    }
+
+def flush_updates(write_session, mappings: list, dry_run: bool) -> None:
+    if not mappings or dry_run:
+        return
+    try:
+        write_session.execute(update(AnalyzedScript), mappings)
+        write_session.commit()
+    except Exception:
+        write_session.rollback()
+        raise
+
+def reprice_all(batch_size: int = 500, limit: int = None, dry_run: bool = False, force: bool = False) -> dict:
+    """
+    Re-price every stored analysis whose rate card version is stale.
+
+    Returns:
+        Summary with processed/failed counts, the rate card version and throughput.
+    """
+    rate_card = load_rate_card(force_refresh=True)
+    version = rate_card.version
+    logger.info(f"Re-pricing with rate card {version} ({len(rate_card.records)} records from {rate_card.source})")
+
+    read_session = SessionLocal()
+    write_session = SessionLocal()
+    processed = failed = 0
+    start_time = time.time()
+
+    try:
+        ensure_analyzed_scripts_table(write_session)
+
+        query = read_session.query(*PRICING_COLUMNS).filter(AnalyzedScript.script_data.isnot(None))
+        if not force:
+            query = query.filter(or_(
+                AnalyzedScript.rate_card_version.is_(None),
+                AnalyzedScript.rate_card_version != version
+            ))
+        query = query.order_by(AnalyzedScript.id)
+        if limit:
+            query = query.limit(limit)
+
+        # Server-side cursor: rows arrive batch_size at a time instead of all at once
+        rows = query.execution_options(stream_results=True, yield_per=batch_size)
+
+        pending = []
+        for row in rows:
+            try:
+                pending.append(reprice_row(row, rate_card))
+                processed += 1
+            except Exception as e:
+                failed += 1
+                logger.warning(f"Failed to re-price script {row.id}: {e}")
+
+            if len(pending) >= batch_size:
+                flush_updates(write_session, pending, dry_run)
+                pending = []
+                elapsed = time.time() - start_time
+                logger.info(f"Re-priced {processed} scripts ({processed / elapsed:.0f}/s), last id {row.id}")
+
+        flush_updates(write_session, pending, dry_run)
+
+    finally:
+        read_session.close()
+        write_session.close()
+
+    elapsed = time.time() - start_time
+    summary = {
+        "rate_card_version": version,
+        "processed": processed,
+        "failed": failed,
+        "dry_run": dry_run,
+        "elapsed_seconds": round(elapsed, 2),
+        "scripts_per_second": round(processed / elapsed, 1) if elapsed > 0 else 0
+    }
+    logger.info(f"Re-pricing finished: {summary}")
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-price stored script analyses with the current rate card")
+    parser.add_argument("--batch-size", type=int, default=500, help="Rows fetched and written per batch")
+    parser.add_argument("--limit", type=int, default=None, help="Stop after this many scripts")
+    parser.add_argument("--dry-run", action="store_true", help="Compute costs without writing")
+    parser.add_argument("--force", action="store_true", help="Re-price rows already on the current version")
+    args = parser.parse_args()
+
+    reprice_all(batch_size=args.batch_size, limit=args.limit, dry_run=args.dry_run, force=args.force)
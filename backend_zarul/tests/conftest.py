@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Modules import each other from the backend root (e.g. "from agents.tools ...")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
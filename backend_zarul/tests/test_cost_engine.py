@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+from agents.tools.cost_engine import (
+    HIGH_BUDGET_LIMIT, LOW_BUDGET_LIMIT, apply_what_if, budget_category_for, build_scene_cost_factors,
+    compute_scene_matrix, estimate_costs
+)
+from agents.tools.rate_card import RateCard, get_fallback_cost_data
+from agents.tools.rate_index import get_rate_index
+
+RATE_CARD = RateCard.from_cost_data(get_fallback_cost_data())
+
+ANALYSIS = {
+    "script_data": {
+        "scenes": [
+            {"scene_number": 1, "location": "STUDIO", "scene_type": "INT", "estimated_pages": 5,
+             "characters_present": ["JOHN"]},
+            {"scene_number": 2, "location": "RESTAURANT", "scene_type": "INT", "estimated_pages": 2.5,
+             "characters_present": ["JOHN", "MARY"], "props_mentioned": ["knife", "menu"]},
+            {"scene_number": 3, "location": "BUSY STREET", "scene_type": "EXT", "estimated_pages": 1,
+             "characters_present": ["MARY", "WAITER"], "special_requirements": ["stunt"]},
+        ]
+    },
+    "cast_breakdown": {"main_characters": ["JOHN - lead detective"], "supporting_characters": ["MARY"]},
+    "location_breakdown": {"scene_locations": [{"scene_number": 3, "location_type": "exterior street", "permit_needed": True}]},
+}
+
+@pytest.fixture
+def factors():
+    return build_scene_cost_factors(ANALYSIS, RATE_CARD)
+
+def test_scene_totals_sum_to_total_costs():
+    breakdown = estimate_costs(ANALYSIS, RATE_CARD).breakdown
+    assert len(breakdown.scene_costs) == 3
+    assert sum(scene.total_scene_cost for scene in breakdown.scene_costs) == pytest.approx(breakdown.total_costs)
+    column_totals = (breakdown.total_cast_costs + breakdown.total_location_costs + breakdown.total_props_costs
+                     + breakdown.total_wardrobe_costs + breakdown.total_crew_costs + breakdown.total_equipment_costs)
+    assert column_totals == pytest.approx(breakdown.total_costs)
+
+def test_scene_pricing_uses_the_rate_card():
+    scene = estimate_costs(ANALYSIS, RATE_CARD).breakdown.scene_costs[0]
+    # Five pages are one shooting day of the lead actor on the studio
+    assert scene.cast_cost == 5000
+    assert scene.location_cost == 3000
+
+def test_characters_and_locations_resolve_to_rate_keys(factors):
+    assert dict(zip(factors.cast_names, factors.cast_roles)) == {
+        "JOHN": "lead_actor", "MARY": "supporting_actor", "WAITER": "background_actor"
+    }
+    keys = [factors.location_keys[i] for i in factors.location_onehot.argmax(axis=1)]
+    assert keys == ["studio", "restaurant", "exterior_street"]
+    assert factors.unmatched_locations == []
+
+@pytest.mark.parametrize("query, key", [
+    ("INT. OFFICE - DAY", "office_building"),
+    ("JOHN'S APARTMENT - BEDROOM", "interior_house"),
+    ("busy street", "exterior_street"),
+    ("zzqx", None),
+])
+def test_rate_index_resolves_locations(query, key):
+    assert get_rate_index(RATE_CARD).resolve_one("location_costs", query).key == key
+
+@pytest.mark.parametrize("total, category", [
+    (0, "Low"),
+    (LOW_BUDGET_LIMIT - 0.01, "Low"),
+    (LOW_BUDGET_LIMIT, "Medium"),
+    (HIGH_BUDGET_LIMIT - 0.01, "Medium"),
+    (HIGH_BUDGET_LIMIT, "High"),
+])
+def test_budget_category_thresholds(total, category):
+    assert budget_category_for(total) == category
+
+def test_what_if_without_changes_matches_baseline(factors):
+    scenario = apply_what_if(factors)
+    assert scenario["breakdown"].total_costs == pytest.approx(compute_scene_matrix(factors).sum())
+    assert scenario["unmatched"] == []
+
+def test_what_if_cast_rate_override_delta(factors):
+    baseline = apply_what_if(factors)["breakdown"]
+    scenario = apply_what_if(factors, cast_rate_overrides={"lead_actor": 6000})["breakdown"]
+    # JOHN works 1 + 0.5 days; catering and every other line are unchanged
+    assert scenario.total_cast_costs - baseline.total_cast_costs == pytest.approx(1000 * 1.5)
+    assert scenario.total_costs - baseline.total_costs == pytest.approx(1000 * 1.5)
+
+def test_what_if_location_swap_and_exclusion(factors):
+    baseline = apply_what_if(factors)["breakdown"]
+    swapped = apply_what_if(factors, location_swaps={"STUDIO": "interior_house"})["breakdown"]
+    assert baseline.total_location_costs - swapped.total_location_costs == pytest.approx(3000 - 800)
+
+    excluded = apply_what_if(factors, exclude_scenes=[2])["breakdown"]
+    scene_two = next(scene for scene in baseline.scene_costs if scene.scene_number == 2)
+    assert [scene.scene_number for scene in excluded.scene_costs] == [1, 3]
+    assert baseline.total_costs - excluded.total_costs == pytest.approx(scene_two.total_scene_cost)
+
+def test_what_if_reports_unmatched_overrides(factors):
+    scenario = apply_what_if(factors, cast_rate_overrides={"NOBODY": 1}, unit_rate_overrides={"bogus": 1})
+    assert scenario["unmatched"] == ["cast:NOBODY", "unit_rate:bogus"]
+
+def test_empty_script():
+    estimate = estimate_costs({"script_data": {"scenes": []}}, RATE_CARD)
+    assert estimate.breakdown.scene_costs == []
+    assert estimate.breakdown.total_costs == 0
+    assert estimate.breakdown.budget_category == "Low"
+    assert estimate.provenance == []
+    assert estimate.scene_matrix.shape == (0, 6)
+    assert np.isfinite(estimate.scene_matrix).all()
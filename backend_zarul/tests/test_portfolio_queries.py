@@ -0,0 +1,36 @@
+import pytest
+
+from agents.tools.portfolio_queries import format_entity_matches, parse_portfolio_question
+
+@pytest.mark.parametrize("question, term, entity_type", [
+    ("Which scripts need a hospital location?", "hospital", "location"),
+    ("Which scripts are set in Paris?", "paris", None),
+    ("Which scripts have car chases", "car chases", None),
+    ("scripts with stunts", "stunts", "special_requirement"),
+])
+def test_entity_questions(question, term, entity_type):
+    intent = parse_portfolio_question(question)
+    assert intent.name == "entity_search"
+    assert intent.params == {"term": term, "entity_type": entity_type}
+
+@pytest.mark.parametrize("question", [
+    "which scripts have the most scenes?",
+    "which scripts have a budget over 1 million",
+    "which scripts have more than 3 locations",
+    "what makes a script expensive?",
+])
+def test_non_entity_questions_go_to_the_llm(question):
+    assert parse_portfolio_question(question) is None
+
+@pytest.mark.parametrize("question, name", [
+    ("What are the 5 most expensive scripts?", "top_budgets"),
+    ("What is the total budget of high budget scripts?", "budget_aggregate"),
+    ("How many scripts are there?", "budget_aggregate"),
+])
+def test_budget_questions(question, name):
+    assert parse_portfolio_question(question).name == name
+
+def test_entity_match_wording():
+    rows = [{"filename": "a.pdf", "matches": ["PARIS"], "scene_count": 2}]
+    assert format_entity_matches({"term": "paris", "entity_type": None}, rows).startswith("1 script(s) mention 'paris':")
+    assert "have a location matching 'paris'" in format_entity_matches({"term": "paris", "entity_type": "location"}, rows)
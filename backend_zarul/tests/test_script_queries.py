@@ -0,0 +1,80 @@
+import pytest
+
+from agents.tools.script_queries import answer_question
+
+ANALYSIS = {
+    "script_data": {
+        "scenes": [
+            {"scene_number": 1, "scene_header": "INT. KITCHEN - DAY", "location": "KITCHEN", "scene_type": "INT",
+             "time_of_day": "DAY", "characters_present": ["JOHN", "MARY"], "props_mentioned": ["knife"]},
+            {"scene_number": 2, "scene_header": "EXT. NIGHT CLUB - NIGHT", "location": "NIGHT CLUB", "scene_type": "EXT",
+             "time_of_day": "NIGHT", "characters_present": ["JOHN"], "special_requirements": ["stunt"]},
+            {"scene_number": 3, "scene_header": "INT. KITCHEN - NIGHT", "location": "KITCHEN", "scene_type": "INT",
+             "time_of_day": "NIGHT", "characters_present": ["MARY"]},
+        ]
+    },
+    "cost_breakdown": {
+        "total_costs": 30000.0,
+        "budget_category": "Low",
+        "scene_costs": [
+            {"scene_number": 1, "total_scene_cost": 5000.0},
+            {"scene_number": 2, "total_scene_cost": 20000.0},
+            {"scene_number": 3, "total_scene_cost": 5000.0},
+        ],
+    },
+}
+
+def intent_of(question):
+    answer = answer_question(question, ANALYSIS, "Test Script")
+    return answer.intent if answer else None
+
+@pytest.mark.parametrize("question, intent", [
+    ("How many scenes are there?", "count_scenes"),
+    ("How many scenes does the script have?", "count_scenes"),
+    ("How many characters are there?", "count_characters"),
+    ("List the locations", "count_locations"),
+    ("Which scenes is John in?", "character_scenes"),
+    ("Where does Mary appear?", "character_scenes"),
+    ("Which scenes take place in the kitchen?", "location_scenes"),
+    ("Which night scenes are there?", "filtered_scenes"),
+    ("Show me the scenes with stunts", "filtered_scenes"),
+    ("What are the top 2 most expensive scenes?", "top_expensive_scenes"),
+    ("What is the total budget?", "budget_totals"),
+    ("How much will the film cost?", "budget_totals"),
+    ("Tell me about scene 2", "scene_details"),
+    ("Which character appears in the most scenes?", "top_characters"),
+    ("What are the most used locations?", "top_locations"),
+])
+def test_routes_whole_questions(question, intent):
+    assert intent_of(question) == intent
+
+@pytest.mark.parametrize("question", [
+    "How many scenes have props?",
+    "How many scenes is John not in?",
+    "Which scenes don't have Mary?",
+    "Which night scenes is JOHN in?",
+    "Which night scenes are in the kitchen?",
+    "How much does the knife cost?",
+    "Is the budget realistic for a thriller?",
+    "How many characters are female?",
+    "Which scenes are John and Mary in?",
+])
+def test_falls_through_on_unconsumed_qualifiers(question):
+    assert intent_of(question) is None
+
+def test_location_containing_filter_word_is_one_location():
+    answer = answer_question("Which scenes are at the night club?", ANALYSIS, "Test Script")
+    assert answer.intent == "location_scenes"
+    assert answer.data == {"NIGHT CLUB": [2]}
+
+def test_character_scenes_only_lists_scenes_with_the_character():
+    answer = answer_question("Which scenes is John in?", ANALYSIS, "Test Script")
+    assert answer.data == {"JOHN": [1, 2]}
+
+def test_filters_combine():
+    answer = answer_question("Which interior night scenes are there?", ANALYSIS, "Test Script")
+    assert answer.intent == "filtered_scenes"
+    assert answer.data == [3]
+
+def test_open_ended_questions_go_to_the_llm():
+    assert intent_of("Why is scene 2 so expensive?") is None
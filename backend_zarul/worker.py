@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Standalone analysis worker for the durable job queue.
+
+Claims jobs from the analysis_jobs table (SELECT ... FOR UPDATE SKIP LOCKED), so
+any number of workers on any number of machines can share one queue. While a job
+runs its lease is renewed every few seconds together with the current stage; if
+the worker dies, the lease expires and another worker picks the job up. Failed
+attempts are retried with exponential backoff.
+
+The API queues jobs here when ANALYSIS_QUEUE_BACKEND=database.
+
+Usage: python worker.py [--concurrency 2] [--poll-interval 2] [--worker-id NAME]
+"""
+
+from database.database import SessionLocal
+from database.services import AnalysisJobService, JOB_VISIBILITY_TIMEOUT_SECONDS
+from api.analysis import analyze_pdf
+from graph.workflow import open_checkpointer
+import argparse
+import asyncio
+import os
+import random
+import socket
+import tempfile
+import logging
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Lease renewal interval, well inside the visibility timeout
+HEARTBEAT_SECONDS = max(JOB_VISIBILITY_TIMEOUT_SECONDS // 4, 1)
+
+def call_service(method, *args, **kwargs):
+    """Run one AnalysisJobService call on its own short-lived session"""
+    db = SessionLocal()
+    try:
+        return method(db, *args, **kwargs)
+    finally:
+        db.close()
+
+async def keep_lease(job_id: str, worker_id: str, progress: dict, analysis: asyncio.Task) -> None:
+    """Renew the lease until cancelled; cancel the analysis if another worker took the job over"""
+    while True:
+        await asyncio.sleep(HEARTBEAT_SECONDS)
+        try:
+            renewed = await asyncio.to_thread(call_service, AnalysisJobService.heartbeat, job_id, worker_id, progress.get("stage"))
+        except Exception as e:
+            logger.warning(f"Heartbeat for job {job_id} failed, retrying: {e}")
+            continue
+        if not renewed:
+            logger.warning(f"Lease on job {job_id} was lost, abandoning it")
+            analysis.cancel()
+            return
+
+async def run_job(job: dict, worker_id: str) -> None:
+    job_id = job["id"]
+    logger.info(f"[{worker_id}] Running job {job_id} ({job['filename']}, attempt {job['attempts']}/{job['max_attempts']})")
+
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
+        temp_file.write(job["pdf_data"])
+        temp_file_path = temp_file.name
+
+    progress = {}
+    analysis = asyncio.create_task(analyze_pdf(
+        temp_file_path,
+        job["filename"],
+        job["file_size_bytes"],
+        on_stage=lambda stage: progress.__setitem__("stage", stage),
+        content_sha256=job.get("content_sha256")
+    ))
+    lease = asyncio.create_task(keep_lease(job_id, worker_id, progress, analysis))
+
+    try:
+        parts = await analysis
+        if await asyncio.to_thread(call_service, AnalysisJobService.complete, job_id, worker_id, parts):
+            logger.info(f"✅ [{worker_id}] Job {job_id} completed")
+        else:
+            logger.warning(f"[{worker_id}] Job {job_id} finished after its lease was lost, result discarded")
+
+    except asyncio.CancelledError:
+        if not lease.done():
+            raise  # Worker shutdown: the lease expires and another worker retries the job
+
+    except Exception as e:
+        status_code = getattr(e, "status_code", 500)
+        error = getattr(e, "detail", None) or str(e)
+        # Client errors (unreadable PDF, bad input) fail the same way on every attempt
+        retryable = status_code >= 500 or status_code == 408
+        status = await asyncio.to_thread(
+            call_service, AnalysisJobService.fail, job_id, worker_id, error, status_code, retryable
+        )
+        logger.error(f"❌ [{worker_id}] Job {job_id} failed ({error}), now {status}")
+
+    finally:
+        lease.cancel()
+        if os.path.exists(temp_file_path):
+            try:
+                os.unlink(temp_file_path)
+            except Exception as cleanup_error:
+                logger.warning(f"Failed to cleanup temp file: {cleanup_error}")
+
+async def worker_loop(worker_id: str, poll_interval: float) -> None:
+    while True:
+        try:
+            job = await asyncio.to_thread(call_service, AnalysisJobService.claim, worker_id)
+        except Exception as e:
+            logger.error(f"[{worker_id}] Claim failed: {e}")
+            job = None
+
+        if job is None:
+            # Jitter keeps idle workers from polling in lockstep
+            await asyncio.sleep(poll_interval * random.uniform(0.5, 1.5))
+            continue
+
+        await run_job(job, worker_id)
+
+async def run_workers(concurrency: int, poll_interval: float, worker_id: str) -> None:
+    logger.info(f"Starting {concurrency} analysis workers as {worker_id}")
+    # Checkpoints go to the shared database so the API host can resume these runs with feedback
+    await open_checkpointer()
+    await asyncio.gather(*(
+        worker_loop(f"{worker_id}/{i}", poll_interval) for i in range(concurrency)
+    ))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run analysis jobs from the durable queue")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("ANALYSIS_WORKERS", "2")), help="Jobs run at once by this process")
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="Seconds between claims when the queue is empty")
+    parser.add_argument("--worker-id", default=f"{socket.gethostname()}:{os.getpid()}", help="Name recorded as the lease holder")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(run_workers(args.concurrency, args.poll_interval, args.worker_id))
+    except KeyboardInterrupt:
+        logger.info("Worker stopped")